@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the startup time of uncertainDistribution
+
+For every available backend a fresh python process is started, which
+ * imports the library
+ * does a first operation, which loads/compiles the core if necessary
+The median over several runs is printed in milliseconds.
+
+usage:
+    python benchImport.py [runs]
+
+@author: Bkubicek
+"""
+import os
+import subprocess
+import sys
+
+repoDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# prints the time for the import and for the first operation, measured inside the new process
+script = """
+import sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, %r)
+import uncertainDistribution as undis
+t1 = time.perf_counter()
+dis = undis.unDist("rect", leftPos=1, rightPos=2, samples=100)
+res = dis*dis
+t2 = time.perf_counter()
+print(t1-t0, t2-t1)
+""" % repoDir
+
+def measure(backend, runs=5):
+    """
+    returns the median import time and time of the first operation in seconds
+    """
+    env = dict(os.environ, UNDIST_BACKEND=backend)
+    importTimes, firstOpTimes = [], []
+    for i in range(runs):
+        out = subprocess.run([sys.executable, "-c", script], env=env, check=True,
+                             capture_output=True, text=True).stdout
+        tImport, tFirstOp = [float(v) for v in out.split()]
+        importTimes.append(tImport)
+        firstOpTimes.append(tFirstOp)
+    return sorted(importTimes)[runs//2], sorted(firstOpTimes)[runs//2]
+
+def availableBackends():
+    sys.path.insert(0, repoDir)
+    import uncertainDistribution as undis
+    names = []
+    for name in undis.backends:
+        try:
+            undis.getBackend(name)
+            names.append(name)
+        except Exception:
+            pass
+    return names
+
+if __name__=="__main__":
+    runs = int(sys.argv[1]) if len(sys.argv)>1 else 5
+    print("%-8s %12s %16s"%("backend", "import [ms]", "first op [ms]"))
+    for backend in availableBackends():
+        tImport, tFirstOp = measure(backend, runs)
+        print("%-8s %12.1f %16.1f"%(backend, tImport*1000, tFirstOp*1000))
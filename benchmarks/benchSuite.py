@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for uncertainDistribution
+
+Measures
+ * add/mul/div of two distributions for several sizes, with the pair engine and with engine="auto"
+ * the constructors getNormal/getRect/getTri
+ * quantiles and getMeanStd
+ * the import and first operation time for every backend (see benchImport.py)
+ * the equations of example_pyranometer.py and example_currentMeasurement.py, without plotting
+
+Additionally the accuracy of long sums in a single fft pass is checked: repeatSum(k) and sum of k distributions
+have to keep the mean k*mean and the stdDev sqrt(k)*stdDev. A failed check is reported like a regression.
+
+For every benchmark the best time of several runs is reported, the operations also as pairs/s
+(for the fft engines the equivalent number of pairs a pair evaluation would need),
+and the peak memory of the python/numpy allocations (tracemalloc, the c++ std::vector buffers are not seen).
+The result cache is switched off, so every run really calculates.
+
+The results can be stored as a json baseline, and compared against a baseline later.
+A benchmark is flagged as regression if it is slower than the baseline by more than the tolerance.
+
+usage:
+    python benchSuite.py                          # run and print
+    python benchSuite.py --save base.json         # store the results as baseline
+    python benchSuite.py --compare base.json      # compare against a baseline, exit code 1 on regressions
+                                                  # or failed accuracy checks
+    python benchSuite.py --sizes 100 1000 10000 100000 --backend lib --repeat 5
+
+License: LGPL-3.0-or-later
+
+@author: Bkubicek
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+repoDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repoDir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import uncertainDistribution as undis
+from uncertainDistribution import unDist as undi
+import benchImport
+
+# above this number of pairs the pair engine is skipped, it would take minutes
+maxPairEnginePairs = 10**9
+
+def timeIt(func, repeat):
+    """
+    returns the best time of repeat calls of func in seconds, and the peak memory of one call in bytes
+    """
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter()-t0)
+
+    # memory is measured in a separate call, tracemalloc slows the allocations down
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak
+
+def benchOperations(sizes, repeat):
+    results = {}
+    for n in sizes:
+        dis1 = undi("normal", mean=5, stdDev=0.5, maxSigma=4, samples=n)
+        dis2 = undi("rect", leftPos=2, rightPos=3, samples=n)
+        pairs = len(dis1.centers)*len(dis2.centers)
+        for opName in ("add", "mul", "div"):
+            op = getattr(dis1, opName)
+            for engine in ("pair", "auto"):
+                if engine=="pair" and pairs>maxPairEnginePairs:
+                    continue
+                seconds, peak = timeIt(lambda: op(dis2, engine=engine), repeat)
+                results["%s_%s_%i"%(opName, engine, n)] = {
+                    "seconds": seconds, "peakBytes": peak, "pairsPerSecond": pairs/seconds}
+    return results
+
+def benchConstructors(sizes, repeat):
+    results = {}
+    for n in sizes:
+        for name, kwargs in (("normal", dict(mean=1, stdDev=0.1, maxSigma=5)),
+                             ("rect", dict(leftPos=6, rightPos=7)),
+                             ("tri", dict(leftPos=10, centerPos=11, rightPos=13))):
+            seconds, peak = timeIt(lambda: undi(name, samples=n, **kwargs), repeat)
+            results["%s_%i"%(name, n)] = {"seconds": seconds, "peakBytes": peak}
+    return results
+
+def benchStatistics(sizes, repeat):
+    results = {}
+    wantQuant = np.linspace(0.01, 0.99, num=99)
+    for n in sizes:
+        dis = undi("normal", mean=1, stdDev=0.1, maxSigma=5, samples=n)
+        # a fresh distribution for every call, so that the cached cdf/moments are not measured
+        seconds, peak = timeIt(lambda: dis._withCenters(dis.centers).quantiles(wantQuant), repeat)
+        results["quantiles_%i"%n] = {"seconds": seconds, "peakBytes": peak}
+        seconds, peak = timeIt(lambda: dis._withCenters(dis.centers).getMeanStd(), repeat)
+        results["getMeanStd_%i"%n] = {"seconds": seconds, "peakBytes": peak}
+    return results
+
+def pyranometerEquation(samples=10000):
+    # the equation of example_pyranometer.py
+    sensitivityCalibration = undi("normal", mean=1, stdDev=1.5/3*0.01, maxSigma=3, samples=samples)
+    dataLoggerVoltage = undi("rect", leftPos=-10, rightPos=10, samples=samples)
+    zeroOffsetB = undi("rect", leftPos=-3, rightPos=3, samples=samples)
+    factors = [undi("rect", leftPos=1-p*0.01, rightPos=1+p*0.01, samples=samples) for p in (1, 0.5, 2, 0.5, 1)]
+    sensDist = sensitivityCalibration
+    for f in factors:
+        sensDist = sensDist*f
+    idealUV = (900+zeroOffsetB)*15
+    actualUV = idealUV*sensDist + dataLoggerVoltage
+    return actualUV.quantiles([0.025, 0.5, 0.975])
+
+def currentMeasurementEquation(samples=1001):
+    # the equation of example_currentMeasurement.py
+    R = undi("rect", leftPos=0.995, rightPos=1.005, samples=samples)
+    tcR = undi("rect", leftPos=0.03-0.001, rightPos=0.03+0.001, samples=samples)
+    deltaT = undi("rect", leftPos=25-0.5, rightPos=25+0.5, samples=samples)-25
+    voltageBackground = undi("normal", mean=0, stdDev=0.01, maxSigma=5, samples=samples)
+    voltageRelAcc = undi("rect", leftPos=0.999, rightPos=1.001, samples=samples)
+    volDistr = (10+voltageBackground)*voltageRelAcc
+    Rdis = R*(1+0.01*tcR*deltaT)
+    I = volDistr/Rdis
+    return I.quantiles([0.025, 0.5, 0.975])
+
+def benchExamples(repeat):
+    results = {}
+    for name, func in (("pyranometer", pyranometerEquation), ("currentMeasurement", currentMeasurementEquation)):
+        seconds, peak = timeIt(func, repeat)
+        results[name] = {"seconds": seconds, "peakBytes": peak}
+    return results
+
+def checkReductions(ks=(10, 200, 1000)):
+    """
+    the mean and stdDev of a sum of k distributions with the fft engine have to be the sum of the means and
+    the square root of the summed variances, within one result bin and 1% of the stdDev
+    returns the list of (name, (mean, stdDev), (expected mean, expected stdDev)) of the failed checks
+    """
+    failed = []
+    rect = undi("rect", leftPos=0, rightPos=1, samples=100)
+    normal = undi("normal", mean=1, stdDev=0.1, maxSigma=5, samples=100)
+    for k in ks:
+        rects = [undi("rect", leftPos=0.01*i, rightPos=1+0.02*i, samples=100) for i in range(k)]
+        for name, res, dists in (("repeatSum_rect_%i"%k, rect.repeatSum(k, engine="fft"), [rect]*k),
+                                 ("repeatSum_normal_%i"%k, normal.repeatSum(k, engine="fft"), [normal]*k),
+                                 ("sum_rects_%i"%k, undi.sum(rects, engine="fft"), rects)):
+            moments = [dis.getMeanStd() for dis in dists]
+            expected = (sum(m for m, s in moments), np.sqrt(sum(s*s for m, s in moments)))
+            mean, stdDev = res.getMeanStd()
+            delta = res.centers[1]-res.centers[0]
+            if abs(mean-expected[0])>delta or abs(stdDev-expected[1])>0.01*expected[1]:
+                failed.append((name, (mean, stdDev), expected))
+    return failed
+
+def benchImports(runs):
+    results = {}
+    for backend in benchImport.availableBackends():
+        tImport, tFirstOp = benchImport.measure(backend, runs)
+        results["import_%s"%backend] = {"seconds": tImport}
+        results["firstOp_%s"%backend] = {"seconds": tFirstOp}
+    return results
+
+def runAll(sizes, repeat, backend=None, skipImport=False):
+    """
+    runs all benchmarks, returns a dict with the environment and the results per group and benchmark
+    """
+    if backend is not None:
+        undis.setOptions(backend=backend)
+    undis.setOptions(cache=False)
+
+    results = {
+        "environment": {"backend": undis.options["backend"], "python": platform.python_version(),
+                        "numpy": np.__version__, "machine": platform.machine(),
+                        "cpus": os.cpu_count(), "threads": undis.options["threads"]},
+        "operations": benchOperations(sizes, repeat),
+        "constructors": benchConstructors(sizes, repeat),
+        "statistics": benchStatistics(sizes, repeat),
+        "examples": benchExamples(repeat),
+    }
+    if not skipImport:
+        results["import"] = benchImports(repeat)
+    return results
+
+def printResults(results):
+    print("environment: %s"%results["environment"])
+    print("%-13s %-28s %12s %14s %12s"%("group", "benchmark", "time [ms]", "pairs/s", "peak [MB]"))
+    for group, entries in results.items():
+        if group=="environment":
+            continue
+        for name, r in entries.items():
+            pairs = "%14.3g"%r["pairsPerSecond"] if "pairsPerSecond" in r else " "*14
+            peak = "%12.2f"%(r["peakBytes"]/2**20) if "peakBytes" in r else ""
+            print("%-13s %-28s %12.3f %s %s"%(group, name, r["seconds"]*1000, pairs, peak))
+
+def compare(results, baseline, tolerance):
+    """
+    returns the list of (group, name, baseline seconds, seconds) of all benchmarks,
+    which are slower than in the baseline by more than the factor 1+tolerance
+    """
+    regressions = []
+    for group, entries in results.items():
+        if group=="environment" or group not in baseline:
+            continue
+        for name, r in entries.items():
+            if name not in baseline[group]:
+                continue
+            old = baseline[group][name]["seconds"]
+            if r["seconds"]>old*(1+tolerance):
+                regressions.append((group, name, old, r["seconds"]))
+    return regressions
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="benchmark suite for uncertainDistribution")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="samples of the benchmarked distributions")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the best one is reported")
+    parser.add_argument("--backend", default=None, help="lib, cpp or numpy, default is the library default")
+    parser.add_argument("--skipImport", action="store_true", help="do not measure the import times")
+    parser.add_argument("--save", default=None, help="store the results as json baseline")
+    parser.add_argument("--compare", default=None, help="json baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slow down against the baseline, 0.2 is 20%%")
+    args = parser.parse_args()
+
+    results = runAll(args.sizes, args.repeat, args.backend, args.skipImport)
+    printResults(results)
+    failed = checkReductions()
+    for name, got, expected in failed:
+        print("ACCURACY %s: mean/stdDev %.6g/%.6g, expected %.6g/%.6g"%((name,)+got+expected))
+    if not failed:
+        print("accuracy checks passed")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("environment")!=results["environment"]:
+            print("warning: the baseline was measured in a different environment %s"%baseline.get("environment"))
+        regressions = compare(results, baseline, args.tolerance)
+        for group, name, old, new in regressions:
+            print("REGRESSION %s %s: %.3f ms -> %.3f ms (%+.0f%%)"%(group, name, old*1000, new*1000,
+                                                                   (new/old-1)*100))
+        if not regressions:
+            print("no regressions against %s"%args.compare)
+        sys.exit(1 if regressions or failed else 0)
+    sys.exit(1 if failed else 0)
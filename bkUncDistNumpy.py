@@ -0,0 +1,618 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy implementation of the routines in "include/bkUncDist.hpp"
+
+This is a drop-in replacement for the c++ core, for systems where cppyy
+can not be installed, or where the JIT compilation of the header at startup is too slow.
+The functions have the same names, arguments and results as the c++ functions,
+but take and return numpy arrays instead of std::vector.
+The results agree with the c++ functions up to rounding differences.
+
+The pair loop of operateDistributionsAndResample is done in blocks of rows,
+each block is evaluated as outer operation and binned with np.bincount.
+The block size is limited by chunkSize pairs, which bounds the temporary memory
+to a few times 8*chunkSize bytes.
+
+License: LGPL-3.0-or-later
+
+@author: Bkubicek
+"""
+import numpy as np
+import math
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+# same values as the c++ enum DistOps {OpAdd, OpMul, OpDiv}
+OpAdd = 0
+OpMul = 1
+OpDiv = 2
+
+# same values as the c++ enum DistInfo, entries of the info array of the operating routines
+InfoPrunedMass = 0
+InfoClampedMass = 1
+InfoEdgeMass = 2
+InfoSize = 3
+
+# default maximal number of pairs evaluated at once in operateDistributionsAndResample
+defaultChunkSize = 2**20
+
+# convolveManyDistributionsAndResample leaves out result tails of less mass than this (on each side),
+# it is about the rounding noise of the fft
+manyTailMass = 1e-12
+
+
+def _equallySpaced(left, delta, N):
+    # the centers are calculated as running sum, like in the c++ code
+    steps = np.full(N, delta, dtype=float)
+    steps[0] = left
+    return np.cumsum(steps)
+
+def normalizeVec(v, info=None):
+    # take a weights vector, and scale it so that the sum is 1
+    # override negative weights, that are not possible in distributions
+    # the removed negative weight is added to info[InfoClampedMass]
+    if info is not None:
+        info[InfoClampedMass] -= np.sum(v[v<0])
+    v[v<0] = 0
+    v *= 1/np.sum(v)
+    return v
+
+def getNormal(mean, stddev, sigmaMax, N):
+    # calculate a normal distribution represented in the system of interval centers and weights
+    leftVal = mean-sigmaMax*stddev
+    rightVal = mean+sigmaMax*stddev
+    delta = (rightVal-leftVal)/N
+
+    centers = _equallySpaced(leftVal+delta/2, delta, N)
+
+    preFac = 1/np.sqrt(2*np.pi)/stddev
+    expFac = 0.5/stddev/stddev
+    weights = preFac*np.exp(-(centers-mean)**2 *expFac)
+
+    return centers, normalizeVec(weights)
+
+def getTri(leftVal, centerVal, rightVal, N):
+    # calculate a triangular distribution represented in the system of interval centers and weights
+    delta = (rightVal-leftVal)/N
+    centerPos = (centerVal-leftVal)/delta
+
+    stepL = 1/centerPos
+    stepR = 1/(N-centerPos)
+
+    centers = _equallySpaced(leftVal+delta/2., delta, N)
+
+    # running sum of the rising/falling steps, like in the c++ code
+    index = np.arange(N)
+    steps = np.where(index<centerPos, stepL, -stepR)
+    steps[0] = stepL*delta/2.
+    weights = np.cumsum(steps)
+
+    return centers, normalizeVec(weights)
+
+def getRect(leftVal, rightVal, N):
+    # calculate a rectangular distribution represented in the system of interval centers and weights
+    # there is a zero weight bin left and right of the interval
+    delta = (rightVal-leftVal)/N
+    centers = _equallySpaced(leftVal-delta/2, delta, N+2)
+    weights = np.full(N+2, 1/float(N))
+    weights[0] = 0
+    weights[N+1] = 0
+    return centers, weights
+
+def _equallySpacedRows(left, delta, N):
+    # _equallySpaced for many rows at once, left and delta are arrays with one entry per row
+    steps = np.empty((len(left), N))
+    steps[:] = delta[:, None]
+    steps[:, 0] = left
+    return np.cumsum(steps, axis=1)
+
+def getManyInto(types, mean, stddev, sigmaMax, leftVal, centerVal, rightVal, samples, centers, weights, offsets):
+    """
+    many normal/rect/tri distributions at once, same results as getNormal/getRect/getTri
+    types are "normal", "rect" or "tri", the other arguments are arrays with one entry per distribution
+    distribution i is written into the bins [offsets[i], offsets[i+1]) of the centers and weights arrays
+    all distributions of the same type and size are calculated together as rows of 2d arrays
+    """
+    types, samples, offsets = np.asarray(types), np.asarray(samples), np.asarray(offsets)
+    for kind in ("normal", "rect", "tri"):
+        isKind = types==kind
+        for N in np.unique(samples[isKind]):
+            rows = np.nonzero(isKind & (samples==N))[0]
+            if kind=="normal":
+                m, s = mean[rows], stddev[rows]
+                left = m-sigmaMax[rows]*s
+                delta = (m+sigmaMax[rows]*s-left)/N
+                c = _equallySpacedRows(left+delta/2, delta, N)
+                preFac = 1/np.sqrt(2*np.pi)/s
+                expFac = 0.5/s/s
+                w = preFac[:, None]*np.exp(-(c-m[:, None])**2 *expFac[:, None])
+            elif kind=="rect":
+                left = leftVal[rows]
+                delta = (rightVal[rows]-left)/N
+                c = _equallySpacedRows(left-delta/2, delta, N+2)
+                w = np.full((len(rows), N+2), 1/float(N))
+                w[:, 0] = 0
+                w[:, N+1] = 0
+            else:
+                left = leftVal[rows]
+                delta = (rightVal[rows]-left)/N
+                centerPos = (centerVal[rows]-left)/delta
+                stepL, stepR = 1/centerPos, 1/(N-centerPos)
+                c = _equallySpacedRows(left+delta/2., delta, N)
+                steps = np.where(np.arange(N)<centerPos[:, None], stepL[:, None], -stepR[:, None])
+                steps[:, 0] = stepL*delta/2.
+                w = np.cumsum(steps, axis=1)
+            if kind!="rect":
+                # normalizeVec for every row
+                w[w<0] = 0
+                w *= 1/np.sum(w, axis=1)[:, None]
+            index = offsets[rows][:, None]+np.arange(c.shape[1])
+            centers[index] = c
+            weights[index] = w
+    return centers, weights
+
+def getLimits(v):
+    return np.min(v), np.max(v)
+
+def splitIntoBins(resWeights, indexPosF, w, info=None):
+    # put the weights at the positions indexPosF (in units of bins) into the weights array
+    # with the same anti-aliasing split as in the c++ code:
+    # the weight is shared linearly between the two neighbouring bins, the last bin gets everything
+    # the part beyond the first/last bin is added to info[InfoEdgeMass]
+    newN = len(resWeights)
+    if info is not None:
+        outside = np.maximum(-indexPosF, indexPosF-(newN-1))
+        info[InfoEdgeMass] += np.sum(w*np.clip(outside, 0, 1))
+    indexPos = np.floor(indexPosF)
+    aliasingWeight = indexPosF-indexPos
+    indexPos = np.clip(indexPos, 0, newN-1).astype(np.intp)
+    aliasingWeight[indexPos==newN-1] = 0
+
+    resWeights += np.bincount(indexPos, w*(1-aliasingWeight), minlength=newN)
+    resWeights += np.bincount(indexPos+1, w*aliasingWeight, minlength=newN+1)[:newN]
+    return resWeights
+
+def spreadOnGrid(centers, weights, left, delta, gridN):
+    # put a distribution with arbitrary centers onto an equally spaced grid
+    indexPosF = np.maximum((np.asarray(centers, dtype=float)-left)/delta, 0.)
+    return splitIntoBins(np.zeros(gridN), indexPosF, np.asarray(weights, dtype=float))
+
+def convolveVec(a, b):
+    # linear convolution of two real sequences using the fft
+    resN = len(a)+len(b)-1
+    n = 1
+    while n<resN:
+        n <<= 1
+    return np.fft.irfft(np.fft.rfft(a, n)*np.fft.rfft(b, n), n)[:resN]
+
+def resampleDistribution(centers, weights, newN):
+    # resample a distribution to a smaller size, can have aliasing effects
+    newLeft, newRight = getLimits(centers)
+    delta = (newRight-newLeft)/newN
+    newCenters = _equallySpaced(newLeft+delta/2, delta, newN)
+
+    # rounding half away from zero like std::round, negative positions are clipped anyways
+    indexPos = np.floor((np.asarray(centers)-newLeft)/delta+0.5)
+    indexPos = np.clip(indexPos, 0, newN-1).astype(np.intp)
+    newWeights = np.bincount(indexPos, weights, minlength=newN).astype(float)
+    return newCenters, newWeights
+
+def _resultLimits(op, centers1, centers2):
+    # find min/max of the resulting distribution
+    min1, max1 = getLimits(centers1)
+    min2, max2 = getLimits(centers2)
+    if op==OpAdd:
+        return min1+min2, max1+max2
+    elif op==OpMul:
+        return min1*min2, max1*max2
+    elif op==OpDiv: #this only works if there is no zero crossing in distribution 2
+        return min1/max2, max1/min2
+    raise Exception("Unknown operation %s"%op)
+
+def _pairBlocks(op, centers1, weights1, centers2, weights2, chunkSize, minPairWeight, info):
+    # all pairs, in blocks of rows with at most chunkSize pairs: yields the values and weights of a block
+    # pairs with w1*w2<minPairWeight are skipped, their summed weight is added to info[InfoPrunedMass]
+    pruned = 0.
+    if minPairWeight>0:
+        # rows where even the largest pair is too small are skipped completely
+        rowSkip = weights1*np.max(weights2)<minPairWeight
+        pruned += np.sum(weights1[rowSkip])*np.sum(weights2)
+        centers1, weights1 = centers1[~rowSkip], weights1[~rowSkip]
+    
+    rows = max(1, int(chunkSize)//len(centers2))
+    for i in range(0, len(centers1), rows):
+        c1 = centers1[i:i+rows, None]
+        w1 = weights1[i:i+rows, None]
+        if op==OpAdd:
+            newC = c1+centers2
+        elif op==OpMul:
+            newC = c1*centers2
+        else:
+            newC = c1/centers2
+        w = (w1*weights2).ravel()
+        newC = newC.ravel()
+        if minPairWeight>0:
+            keep = w>=minPairWeight
+            pruned += np.sum(w[~keep])
+            newC, w = newC[keep], w[keep]
+        yield newC, w
+    if info is not None:
+        info[InfoPrunedMass] += pruned
+
+def accumulatePairs(op, centers1, weights1, centers2, weights2, newLeft, delta, resWeights,
+                    chunkSize=defaultChunkSize, minPairWeight=0, info=None):
+    # the core of operateDistributionsAndResample:
+    # evaluate all pairs, in blocks of rows with at most chunkSize pairs,
+    # and add them to resWeights, which has its first bin at newLeft and a bin width of delta
+    # pairs with w1*w2<minPairWeight are skipped, their summed weight is added to info[InfoPrunedMass]
+    for newC, w in _pairBlocks(op, centers1, weights1, centers2, weights2, chunkSize, minPairWeight, info):
+        splitIntoBins(resWeights, (newC-newLeft)/delta, w, info)
+    return resWeights
+
+def operateDistributionsAndResample(op, centers1, weights1, centers2, weights2, newN=0,
+                                    chunkSize=defaultChunkSize, threads=1, minPairWeight=0, info=None):
+    """
+    interact one distribution with another, see the c++ function for a description
+    all pairs of centers are evaluated, in blocks of rows with at most chunkSize pairs
+    with threads>1 the rows are split into equally sized parts evaluated by a thread pool,
+    each with its own weights array, summed in a fixed order. (numpy releases the GIL while computing)
+    info is an optional array of size InfoSize, which gets statistics of the operation,
+    e.g. pairs with w1*w2<minPairWeight are skipped, their summed weight is written to info[InfoPrunedMass]
+    """
+    centers1 = np.asarray(centers1, dtype=float)
+    weights1 = np.asarray(weights1, dtype=float)
+    centers2 = np.asarray(centers2, dtype=float)
+    weights2 = np.asarray(weights2, dtype=float)
+    if newN==0:
+        newN = min(len(centers1), len(centers2))+1
+
+    newLeft, newRight = _resultLimits(op, centers1, centers2)
+    delta = (newRight-newLeft)/newN
+    resCenters = _equallySpaced(newLeft+delta/2, delta, newN)
+
+    if info is None:
+        info = np.zeros(InfoSize)
+    info[:] = 0
+
+    threads = min(max(int(threads), 1), len(centers1))
+    if threads==1:
+        resWeights = accumulatePairs(op, centers1, weights1, centers2, weights2, 
+                                     newLeft, delta, np.zeros(newN), chunkSize, minPairWeight, info)
+    else:
+        bounds = [len(centers1)*t//threads for t in range(threads+1)]
+        threadInfo = np.zeros((threads, InfoSize))
+        with ThreadPoolExecutor(threads) as pool:
+            parts = list(pool.map(lambda t: accumulatePairs(op, 
+                                    centers1[bounds[t]:bounds[t+1]], weights1[bounds[t]:bounds[t+1]], 
+                                    centers2, weights2, newLeft, delta, np.zeros(newN), chunkSize,
+                                    minPairWeight, threadInfo[t]),
+                             range(threads)))
+            # map returns in order, so the sum is deterministic
+            resWeights = sum(parts)
+            for t in range(threads):
+                info += threadInfo[t]
+
+    # polish the results weight so that they are mostly summed to 1
+    return resCenters, normalizeVec(resWeights, info)
+
+def splitOntoCenters(resCenters, resWeights, x, w, info=None):
+    # put the weights w at the values x into the weights of ascending, not equally spaced centers
+    # shared linearly between the two neighbouring centers, like the c++ function
+    newN = len(resCenters)
+    j = np.searchsorted(resCenters, x, side="right")-1
+    below, above = j<0, j>=newN-1
+    j = np.clip(j, 0, max(newN-2, 0))
+    if newN==1:
+        resWeights += np.sum(w)
+        return resWeights
+    aliasingWeight = (x-resCenters[j])/(resCenters[j+1]-resCenters[j])
+    if info is not None:
+        outside = np.where(below, -aliasingWeight, 0)
+        lastSpacing = resCenters[-1]-resCenters[-2]
+        outside = np.where(above, (x-resCenters[-1])/lastSpacing, outside)
+        info[InfoEdgeMass] += np.sum(w*np.clip(outside, 0, 1))
+    aliasingWeight = np.where(below, 0, np.where(above, 1, aliasingWeight))
+    resWeights += np.bincount(j, w*(1-aliasingWeight), minlength=newN)
+    resWeights += np.bincount(j+1, w*aliasingWeight, minlength=newN+1)[:newN]
+    return resWeights
+
+def operateDistributionsOntoCenters(op, centers1, weights1, centers2, weights2, resCenters,
+                                    chunkSize=defaultChunkSize, minPairWeight=0, info=None):
+    """
+    same as operateDistributionsAndResample, but onto the given ascending result centers,
+    see the c++ function for a description, returns the result weights
+    """
+    if info is None:
+        info = np.zeros(InfoSize)
+    info[:] = 0
+    resCenters = np.asarray(resCenters, dtype=float)
+    resWeights = np.zeros(len(resCenters))
+    for newC, w in _pairBlocks(op, np.asarray(centers1, dtype=float), np.asarray(weights1, dtype=float),
+                               np.asarray(centers2, dtype=float), np.asarray(weights2, dtype=float), 
+                               chunkSize, minPairWeight, info):
+        splitOntoCenters(resCenters, resWeights, newC, w, info)
+    return normalizeVec(resWeights, info)
+
+def resampleDistributionOntoCenters(centers, weights, newCenters, info=None):
+    # resample a distribution onto the given ascending centers, returns the new weights
+    if info is not None:
+        info[:] = 0
+    return splitOntoCenters(np.asarray(newCenters, dtype=float), np.zeros(len(newCenters)), 
+                            np.asarray(centers, dtype=float), np.asarray(weights, dtype=float), info)
+
+def adaptiveCenters(centers, weights, newN, uniformShare=0.1):
+    """
+    newN ascending centers from the smallest to the largest center of the distribution,
+    spaced so that every bin has the same mass of the mixture (1-uniformShare)*distribution+uniformShare*uniform:
+    dense where the probability mass is, and still some bins in the tails
+    the weight of a bin is assumed spread evenly between the middles to its neighbours, like for quantiles
+    """
+    centers, weights = np.asarray(centers, dtype=float), np.asarray(weights, dtype=float)
+    if len(centers)>1 and centers[0]>centers[-1]:
+        centers, weights = centers[::-1], weights[::-1]
+    lo, hi = centers[0], centers[-1]
+    if newN<2 or hi<=lo:
+        return np.full(max(newN, 1), lo)
+    # the cdf is linear between the bin edges
+    edges = np.concatenate([[lo], (centers[1:]+centers[:-1])/2, [hi]])
+    cdf = np.cumsum(np.concatenate([[weights[0]/2], weights[1:-1], [weights[-1]/2]]))
+    cdf = np.concatenate([[0], cdf])
+    mixture = (1-uniformShare)*cdf/cdf[-1]+uniformShare*(edges-lo)/(hi-lo)
+    res = np.interp(np.linspace(0, 1, newN), mixture, edges)
+    res[0], res[-1] = lo, hi
+    return res
+
+def gridCenters(left, delta, n):
+    # centers of a distribution on an equally spaced grid, as used by the grid routines
+    return left+np.arange(n)*delta
+
+def operateGridDistributionsAndResample(op, left1, delta1, weights1, left2, delta2, weights2, newN=0,
+                                        chunkSize=defaultChunkSize, threads=1, minPairWeight=0, info=None):
+    """
+    same as operateDistributionsAndResample, but for distributions on equally spaced grids:
+    center i is left+i*delta, see the c++ function for a description
+    the weights can be float32 or float64, the calculation is done in float64
+    returns the first center and the spacing of the result grid, and the result weights
+    """
+    centers1 = gridCenters(left1, delta1, len(weights1))
+    centers2 = gridCenters(left2, delta2, len(weights2))
+    resCenters, resWeights = operateDistributionsAndResample(op, centers1, weights1, centers2, weights2, 
+                                        newN, chunkSize, threads, minPairWeight, info)
+    # the same grid as the c++ function calculates
+    newLeft, newRight = _resultLimits(op, centers1, centers2)
+    delta = (newRight-newLeft)/len(resWeights)
+    return newLeft+delta/2, delta, resWeights
+
+def convolveDistributionsAndResample(centers1, weights1, centers2, weights2, newN=0, oversample=4, info=None):
+    """
+    add two distributions using a fft convolution instead of iterating all pairs
+    see the c++ function for a description
+    """
+    if newN==0:
+        newN = min(len(centers1), len(centers2))+1
+    oversample = max(oversample, 1)
+
+    min1, max1 = getLimits(centers1)
+    min2, max2 = getLimits(centers2)
+    newLeft = min1+min2
+    newRight = max1+max2
+    delta = (newRight-newLeft)/newN
+    resCenters = _equallySpaced(newLeft+delta/2, delta, newN)
+
+    h = delta/oversample
+    grid1 = spreadOnGrid(centers1, weights1, min1, h, int((max1-min1)/h)+2)
+    grid2 = spreadOnGrid(centers2, weights2, min2, h, int((max2-min2)/h)+2)
+    conv = convolveVec(grid1, grid2)
+
+    if info is not None:
+        info[:] = 0
+    resWeights = splitIntoBins(np.zeros(newN), np.arange(len(conv))/oversample, conv, info)
+    return resCenters, normalizeVec(resWeights, info)
+
+def logConvolveDistributionsAndResample(op, centers1, weights1, centers2, weights2, newN=0,
+                                        oversample=4, maxGridN=2**24, info=None):
+    """
+    multiply or divide two strictly positive distributions using a fft convolution in log space
+    see the c++ function for a description
+    """
+    if op==OpAdd:
+        raise Exception("logConvolveDistributionsAndResample can only multiply or divide")
+    if newN==0:
+        newN = min(len(centers1), len(centers2))+1
+    oversample = max(oversample, 1)
+
+    newLeft, newRight = _resultLimits(op, centers1, centers2)
+    if getLimits(centers1)[0]<=0 or getLimits(centers2)[0]<=0:
+        raise Exception("logConvolveDistributionsAndResample needs strictly positive centers")
+    delta = (newRight-newLeft)/newN
+    resCenters = _equallySpaced(newLeft+delta/2, delta, newN)
+
+    logRange = np.log(newRight/newLeft)
+    h = delta/newRight/oversample
+    if logRange/h > maxGridN:
+        h = logRange/maxGridN
+
+    logCenters1 = np.log(centers1)
+    logCenters2 = np.log(centers2) if op==OpMul else -np.log(centers2)
+    logMin1, logMax1 = getLimits(logCenters1)
+    logMin2, logMax2 = getLimits(logCenters2)
+
+    grid1 = spreadOnGrid(logCenters1, weights1, logMin1, h, int((logMax1-logMin1)/h)+2)
+    grid2 = spreadOnGrid(logCenters2, weights2, logMin2, h, int((logMax2-logMin2)/h)+2)
+    conv = convolveVec(grid1, grid2)
+
+    newC = np.exp(logMin1+logMin2+np.arange(len(conv))*h)
+    if info is not None:
+        info[:] = 0
+    resWeights = splitIntoBins(np.zeros(newN), (newC-newLeft)/delta, conv, info)
+    return resCenters, normalizeVec(resWeights, info)
+
+def _manyGrid(op, limits, counts, powers, newN, oversample):
+    # the common grid of convolveManyDistributionsAndResample
+    # limits are the (min, max) of the centers (of the log centers for products), counts the number of centers
+    # returns the left end and bin width of the result, the grid spacing h and the grid sizes
+    coordLeft = sum(p*lim[0] for p, lim in zip(powers, limits))
+    coordRight = sum(p*lim[1] for p, lim in zip(powers, limits))
+    newLeft, newRight = (np.exp(coordLeft), np.exp(coordRight)) if op==OpMul else (coordLeft, coordRight)
+    delta = (newRight-newLeft)/newN
+
+    # the grid has to resolve the result bins and the bins of every distribution,
+    # otherwise a long sum of narrow distributions collapses onto a few grid points
+    h = delta/newRight/oversample if op==OpMul else delta/oversample
+    for count, p, lim in zip(counts, powers, limits):
+        if p==0 or count<2 or lim[1]<=lim[0]:
+            continue
+        # for products the spacing in log space is the finest at the largest center
+        spacing = -np.expm1(lim[0]-lim[1]) if op==OpMul else lim[1]-lim[0]
+        h = min(h, spacing/(count-1)/oversample)
+
+    gridN = [int((lim[1]-lim[0])/h)+2 for lim in limits]
+    resN = 1+sum(p*(g-1) for p, g in zip(powers, gridN))
+    return coordLeft, newLeft, delta, h, gridN, resN
+
+def manyGridSize(op, centersList, powers=None, newN=0, oversample=4):
+    """
+    number of grid points of the fft in convolveManyDistributionsAndResample,
+    above maxGridN the sum/product has to be calculated as a chain of operations
+    """
+    if powers is None:
+        powers = [1]*len(centersList)
+    if newN==0:
+        newN = min(len(c) for c in centersList)+1
+    limits = [getLimits(c) for c in centersList]
+    if op==OpMul:
+        limits = [np.log(lim) for lim in limits]
+    return _manyGrid(op, limits, [len(c) for c in centersList], powers, newN, max(oversample, 1))[-1]
+
+def convolveManyDistributionsAndResample(op, centersList, weightsList, powers=None, newN=0,
+                                         oversample=4, maxGridN=2**24, info=None):
+    """
+    add or multiply many distributions in a single fft pass, 
+    distribution i occurs powers[i] times in the sum/product
+    see the c++ function for a description
+    """
+    if op==OpDiv:
+        raise Exception("convolveManyDistributionsAndResample can only add or multiply")
+    if powers is None:
+        powers = [1]*len(centersList)
+    if newN==0:
+        newN = min(len(c) for c in centersList)+1
+    oversample = max(oversample, 1)
+
+    # the grid coordinate is the value itself for sums, and its logarithm for products
+    coords = [np.asarray(c, dtype=float) for c in centersList]
+    if op==OpMul:
+        if min(np.min(c) for c in coords)<=0:
+            raise Exception("convolveManyDistributionsAndResample needs strictly positive centers")
+        coords = [np.log(c) for c in coords]
+
+    limits = [getLimits(c) for c in coords]
+    coordLeft, newLeft, delta, h, gridN, resN = _manyGrid(op, limits, [len(c) for c in coords], powers, 
+                                                          newN, oversample)
+    if resN>maxGridN:
+        raise Exception("convolveManyDistributionsAndResample needs %i grid points, more than maxGridN"%resN)
+
+    # every distribution is spread onto the grid, one that occurs p times is transformed once
+    # and its spectrum is raised to the power p. The grids are then convolved, the shortest ones first
+    # like in a chain of operations, so every level of this tree costs about one fft of the result size
+    shortest = []
+    for i, (c, w, p, lim, g) in enumerate(zip(coords, weightsList, powers, limits, gridN)):
+        if p==0:
+            continue
+        grid = spreadOnGrid(c, w, lim[0], h, g)
+        if p>1:
+            size = p*(g-1)+1
+            n = 1
+            while n<size:
+                n <<= 1
+            grid = np.fft.irfft(np.fft.rfft(grid, n)**int(p), n)[:size]
+        shortest.append((len(grid), i, grid))
+    heapq.heapify(shortest)
+    counter = len(coords)
+    while len(shortest)>1:
+        n1, i1, grid1 = heapq.heappop(shortest)
+        n2, i2, grid2 = heapq.heappop(shortest)
+        grid = convolveVec(grid1, grid2)
+        heapq.heappush(shortest, (len(grid), counter, grid))
+        counter += 1
+    conv = shortest[0][2]
+    if info is not None:
+        info[:] = 0
+
+    # the full interval of a long sum is much wider than its mass (a sum of k rects has a stdDev of
+    # about 1/sqrt(k) of the interval), so the result bins only span the grid points without the tails
+    mass = np.maximum(conv, 0)
+    cut = manyTailMass*np.sum(mass)
+    first = np.searchsorted(np.cumsum(mass), cut, side="right")
+    last = resN-np.searchsorted(np.cumsum(mass[::-1]), cut, side="right")
+    if last-first<2:
+        first, last = 0, resN
+    if info is not None:
+        info[InfoPrunedMass] += np.sum(mass[:first])+np.sum(mass[last:])
+    conv = conv[first:last]
+    m = np.arange(first, last)
+
+    # grid point m of the result is at coordLeft+m*h
+    if op==OpMul:
+        newLeft, newRight = np.exp(coordLeft+first*h), np.exp(coordLeft+(last-1)*h)
+    else:
+        newLeft, newRight = coordLeft+first*h, coordLeft+(last-1)*h
+    delta = (newRight-newLeft)/newN
+    resCenters = _equallySpaced(newLeft+delta/2, delta, newN)
+    indexPosF = (np.exp(coordLeft+m*h)-newLeft)/delta if op==OpMul else (m-first)*(h/delta)
+    resWeights = splitIntoBins(np.zeros(newN), indexPosF, conv, info)
+    return resCenters, normalizeVec(resWeights, info)
+
+def _gridProductChunks(func, centersList, weightsList, chunkSize):
+    # evaluate func for all combinations of centers, yields the values and the combined weights
+    # the last inputs (at least one) with together at most chunkSize combinations are evaluated at once,
+    # their arguments and weights are prepared once, the first inputs are iterated
+    inner = len(centersList)-1
+    while inner>0 and math.prod(len(c) for c in centersList[inner-1:])<=chunkSize:
+        inner -= 1
+    
+    innerShape = tuple(len(c) for c in centersList[inner:])
+    innerArgs = [a.ravel() for a in np.meshgrid(*centersList[inner:], indexing="ij")]
+    innerWeights = np.ones(1)
+    for w in weightsList[inner:]:
+        innerWeights = np.multiply.outer(innerWeights, w).ravel()
+    
+    for index in np.ndindex(*[len(c) for c in centersList[:inner]]):
+        outerWeight = 1.
+        for w, i in zip(weightsList, index):
+            outerWeight *= w[i]
+        args = [c[i] for c, i in zip(centersList, index)]+innerArgs
+        newC = np.broadcast_to(np.asarray(func(*args), dtype=float), innerWeights.shape)
+        yield newC, outerWeight*innerWeights
+
+def applyFunctionAndResample(func, centersList, weightsList, newN=0, chunkSize=defaultChunkSize):
+    """
+    distribution of func(x1, x2, ..., xk) for k independent distributions
+    func has to be vectorized: it gets k arrays of the same length, and returns the values
+    like operateDistributionsAndResample all combinations of centers are evaluated,
+    in chunks of at most chunkSize combinations, so the memory stays bounded.
+    A first pass finds the limits of the result, the second one puts the values into
+    newN bins with the same anti-aliasing as operateDistributionsAndResample.
+    """
+    centersList = [np.asarray(c, dtype=float) for c in centersList]
+    weightsList = [np.asarray(w, dtype=float) for w in weightsList]
+    if newN==0:
+        newN = min(len(c) for c in centersList)+1
+
+    newLeft, newRight = np.inf, -np.inf
+    for newC, w in _gridProductChunks(func, centersList, weightsList, chunkSize):
+        if not np.all(np.isfinite(newC)):
+            raise Exception("applyFunctionAndResample: the function returned non finite values")
+        newLeft = min(newLeft, np.min(newC))
+        newRight = max(newRight, np.max(newC))
+
+    if newRight==newLeft:
+        # func is constant, like a rect distribution of zero width all bins are at this value
+        return _equallySpaced(newLeft, 0., newN), np.full(newN, 1/float(newN))
+
+    delta = (newRight-newLeft)/newN
+    resCenters = _equallySpaced(newLeft+delta/2, delta, newN)
+    resWeights = np.zeros(newN)
+    for newC, w in _gridProductChunks(func, centersList, weightsList, chunkSize):
+        splitIntoBins(resWeights, (newC-newLeft)/delta, w)
+    return resCenters, normalizeVec(resWeights)
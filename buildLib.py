@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Compiles the c++ core ahead of time into a shared library, used by the "lib" backend
+
+Without it, the c++ core is compiled by cppyy at runtime,
+which costs about a second for every new python process.
+The library is loaded with ctypes in a few milliseconds.
+
+usage:
+    python buildLib.py            # uses the compiler from the CXX environment variable, or g++
+    python buildLib.py clang++
+
+License: LGPL-3.0-or-later
+
+@author: Bkubicek
+"""
+import os
+import subprocess
+import sys
+
+includeDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "include")
+source = os.path.join(includeDir, "bkUncDistLib.cpp")
+target = os.path.join(includeDir, "libbkUncDist.dll" if sys.platform=="win32" else "libbkUncDist.so")
+
+def build(compiler=None):
+    if compiler is None:
+        compiler = os.environ.get("CXX", "g++")
+    cmd = [compiler, "-O3", "-std=c++17", "-shared", "-fPIC", "-pthread", source, "-o", target]
+    print(" ".join(cmd))
+    subprocess.run(cmd, check=True)
+    return target
+
+if __name__=="__main__":
+    build(sys.argv[1] if len(sys.argv)>1 else None)
@@ -0,0 +1,2 @@
+# the scripts in examples/ are demos that plot into ./plots/, they are not collected as tests
+collect_ignore = ["examples"]
@@ -45,6 +45,8 @@ for i in range(1,10):
     totalLengths.append( curLength)
 
 #  now we have an array of 10 disributions
+#  a single one can also be calculated directly, which avoids the resampling after every addition:
+#  tenSticks = singleStickLength.repeatSum(10)
 
 
 # lets see how the quantiles change:
@@ -13,6 +13,11 @@
  * all definitions are inline, so that they can "legally" recide in a header file only
  * this simplifies compilation, as no corresponding c++ file needs to be defined
  *
+ * Every routine exists twice:
+ * the "...Into" version takes raw pointers plus lengths, and writes into preallocated result arrays.
+ * This allows to hand numpy arrays through without any copy.
+ * The std::vector version allocates the results, and calls the "...Into" version.
+ *
  * initial written by Bernhard Kubicek, AIT Austrian institute of technology
  *  originally for the SolidPV EU Project, EURAMET
  * 
@@ -28,55 +33,87 @@
 #include <tuple>
 #include <cmath>
 #include <utility>
+#include <complex>
+#include <algorithm>
+#include <stdexcept>
+#include <thread>
+#include <functional>
+#include <queue>
 
 const double pi = 3.14159265358979323846;
 
 //! an Enum to allow to define if one wants to add, multiply or divide two distributions
 enum DistOps {OpAdd, OpMul, OpDiv};
 
+//! entries of the optional info array of the operating routines, InfoSize is the array size
+//! InfoPrunedMass: summed weight of the pairs skipped because of minPairWeight
+//! InfoClampedMass: summed negative weight, that normalizeVec set to zero (fft rounding)
+//! InfoEdgeMass: weight, that the anti-aliasing split would have put outside of the result bins,
+//!               and that was added to the first/last bin instead
+enum DistInfo {InfoPrunedMass, InfoClampedMass, InfoEdgeMass, InfoSize};
+
 //! simpler type names
 typedef std::vector<double> VecD;
 typedef std::tuple< VecD, VecD> TupleVecD;
 typedef std::pair< double, double > PairDouble;
+typedef std::complex<double> ComplexD;
+typedef std::vector<ComplexD> VecC;
 
 
-//! take a weights vector, and scale it so that the sum is 1
-inline void normalizeVec(VecD &v)
+//! take a weights array of size n, and scale it so that the sum is 1
+//! @param info optional array of size InfoSize, the removed negative weight is added to InfoClampedMass
+inline void normalizeVec(double *v, size_t n, double *info=nullptr)
 {
     // override negative weights, that are not possible in distributions
-    for(unsigned i=0;i<v.size();i++)
+    double clamped=0;
+    for(size_t i=0;i<n;i++)
         if (v[i]<0)
+        {
+            clamped-=v[i];
             v[i]=0;
+        }
+    if (info)
+        info[InfoClampedMass]+=clamped;
     // find sum
     double wsum=0;
-    for(unsigned i=0;i<v.size();i++)
+    for(size_t i=0;i<n;i++)
         wsum+=v[i];
     // scale to one
-    for(unsigned i=0;i<v.size();i++)
+    for(size_t i=0;i<n;i++)
         v[i]*=1/wsum;
 }
 
+//! take a weights vector, and scale it so that the sum is 1
+inline void normalizeVec(VecD &v)
+{
+    normalizeVec(v.data(), v.size());
+}
+
+//! write N equally spaced centers, starting with first
+inline void fillCenters(double *centers, unsigned N, double first, double delta)
+{
+    centers[0]=first;
+    for(unsigned i=1;i<N;i++)
+        centers[i]=centers[i-1]+delta;
+}
+
 
 //! calculate a normal distribution represented in the system of interval centers and weights
 //! @param mean self explenatory
 //! @param stddev  self explenatory
 //! @param sigmaMax is the maximum sigma, until the distribution should be evaluated. "3-4" sigmas is reasonable
 //! @param N is the number of samples used.
-inline TupleVecD getNormal(double mean, double stddev, double sigmaMax, unsigned N)
+//! @param centers, weights arrays of size N for the result
+inline void getNormalInto(double mean, double stddev, double sigmaMax, unsigned N,
+                          double *centers, double *weights)
 {    
     // find the interval
     double leftVal= mean-sigmaMax*stddev;
     double rightVal= mean+sigmaMax*stddev;
     double delta = (rightVal-leftVal)/N;
     
-    //allocate the result vectors
-    VecD centers(N,0);
-    VecD weights(N,0);
-    
     // write the centers
-    centers[0]=leftVal+delta/2;
-    for(unsigned i=1;i<N;i++)
-        centers[i]=centers[i-1]+delta;
+    fillCenters(centers, N, leftVal+delta/2, delta);
         
     // optimized factors for the noraml distribution function
     double preFac=1/std::sqrt(2*pi)/stddev;
@@ -86,8 +123,15 @@ inline TupleVecD getNormal(double mean, double stddev, double sigmaMax, unsigned
         weights[i]=preFac*std::exp(-std::pow(centers[i]-mean,2) *expFac);
     
     //normalize so that not the integral but the sum is one.
-    normalizeVec(weights);
+    normalizeVec(weights, N);
+}
     
+inline TupleVecD getNormal(double mean, double stddev, double sigmaMax, unsigned N)
+{
+    //allocate the result vectors
+    VecD centers(N,0);
+    VecD weights(N,0);
+    getNormalInto(mean, stddev, sigmaMax, N, centers.data(), weights.data());
     return {centers, weights};
 }
 
@@ -96,11 +140,11 @@ inline TupleVecD getNormal(double mean, double stddev, double sigmaMax, unsigned
 //! @param centerVal the pos; at which the peak is reached
 //! @param rightVal the largest pos; at which the falling flank stops
 //! @param N is the number of samples used. 
-inline TupleVecD getTri(double leftVal, double centerVal, double rightVal, unsigned N)
+//! @param centers, weights arrays of size N for the result
+inline void getTriInto(double leftVal, double centerVal, double rightVal, unsigned N,
+                       double *centers, double *weights)
 {
     double delta = (rightVal-leftVal)/N;
-    VecD centers(N,0);
-    VecD weights(N,0);
     
     // index of center Position
     double centerPos=(centerVal-leftVal)/delta; 
@@ -109,10 +153,7 @@ inline TupleVecD getTri(double leftVal, double centerVal, double rightVal, unsig
     double stepL = 1/centerPos;
     double stepR = 1/(N-centerPos);
     
-    
-    centers[0]=leftVal+delta/2.;
-    for(unsigned i=1;i<N;i++)
-        centers[i]=centers[i-1]+delta;
+    fillCenters(centers, N, leftVal+delta/2., delta);
     
     weights[0] = stepL*delta/2.;
     for(unsigned i=1;i<N;i++)
@@ -121,31 +162,39 @@ inline TupleVecD getTri(double leftVal, double centerVal, double rightVal, unsig
         else
             weights[i]=weights[i-1]-stepR;
     
-    normalizeVec(weights);
+    normalizeVec(weights, N);
+}
     
+inline TupleVecD getTri(double leftVal, double centerVal, double rightVal, unsigned N)
+{
+    VecD centers(N,0);
+    VecD weights(N,0);
+    getTriInto(leftVal, centerVal, rightVal, N, centers.data(), weights.data());
     return {centers, weights};
 }
 
-//! calculate a triangular distribution represented in the system of interval centers and weights
-//! @param leftVal the smallest pos; at which the raising flank start
-//! @param centerVal the pos; at which the peak is reached
-//! @param rightVal the largest pos; at which the falling flank stops
+//! calculate a rectangular distribution represented in the system of interval centers and weights
+//! there is a zero weight bin left and right of the interval
+//! @param leftVal the smallest pos
+//! @param rightVal the largest pos
 //! @param N is the number of samples used. 
-inline TupleVecD getRect(double leftVal, double rightVal, unsigned N)
-{    
+//! @param centers, weights arrays of size N+2 for the result
+inline void getRectInto(double leftVal, double rightVal, unsigned N, double *centers, double *weights)
+{
     double delta = (rightVal-leftVal)/N;
-    VecD centers;
-    centers.resize(N+2);
-    VecD weights(N+2,1/double(N));
-    
-    
-    centers[0]=leftVal-delta/2;
-    weights[0]=0;
+
+    fillCenters(centers, N+2, leftVal-delta/2, delta);
     for(unsigned i=1;i<N+1;i++)
-        centers[i]=centers[i-1]+delta;
-    centers[N+1]=centers[N]+delta;
+        weights[i]=1/double(N);
+    weights[0]=0;
     weights[N+1]=0;
-    
+}
+
+inline TupleVecD getRect(double leftVal, double rightVal, unsigned N)
+{    
+    VecD centers(N+2);
+    VecD weights(N+2);
+    getRectInto(leftVal, rightVal, N, centers.data(), weights.data());
     return {centers, weights};
 }
 
@@ -157,54 +206,353 @@ inline bool comparatorPair ( const PairDouble &l, const PairDouble &r)
     return l.first < r.first; 
 }
 
-//! find the min/max of a vector
-//! @param v the vector
+//! find the min/max of an array of size n
+//! @param v the array
 //! @param dmin the double that the minimum is written into
 //! @param dmax the double that the maximum is written into
+inline void getLimits(const double *v, size_t n, double &dmin, double &dmax)
+{
+    dmin= *std::min_element(v, v+n);
+    dmax= *std::max_element(v, v+n);
+}
+
+//! find the min/max of a vector
 inline void getLimits(const VecD &v, double &dmin, double &dmax)
 {
-    dmin= *std::min_element(v.begin(), v.end());
-    dmax= *std::max_element(v.begin(), v.end());
+    getLimits(v.data(), v.size(), dmin, dmax);
 }
   
+//! in place radix-2 fast fourier transform, the size of v has to be a power of two
+//! @param v the data, overwritten with its transform
+//! @param inverse if true, the inverse transform (including the 1/N scaling) is performed
+inline void fftInPlace(VecC &v, bool inverse)
+{
+    const size_t n=v.size();
+    
+    // bit reversal permutation
+    for(size_t i=1,j=0;i<n;i++)
+    {
+        size_t bit=n>>1;
+        for(;j&bit;bit>>=1)
+            j^=bit;
+        j^=bit;
+        if(i<j)
+            std::swap(v[i],v[j]);
+    }
+    
+    // twiddle factors are calculated once, and not by repeated multiplication
+    // which would accumulate rounding errors for large n
+    // they are kept per thread for the last n, the inverse transform uses the conjugated ones
+    static thread_local VecC roots;
+    if (roots.size()!=n/2)
+    {
+        roots.resize(n/2);
+        for(size_t k=0;k<n/2;k++)
+            roots[k]=std::polar(1.0, -2*pi*k/n);
+    }
+    
+    for(size_t len=2;len<=n;len<<=1)
+    {
+        const size_t step=n/len;
+        for(size_t i=0;i<n;i+=len)
+            for(size_t j=0;j<len/2;j++)
+            {
+                ComplexD u=v[i+j];
+                ComplexD t=v[i+j+len/2]*(inverse ? std::conj(roots[j*step]) : roots[j*step]);
+                v[i+j]=u+t;
+                v[i+j+len/2]=u-t;
+            }
+    }
+    
+    if(inverse)
+        for(size_t i=0;i<n;i++)
+            v[i]/=double(n);
+}
+
+//! linear convolution of two real sequences using the fft, result has size a.size()+b.size()-1
+inline VecD convolveVec(const VecD &a, const VecD &b)
+{
+    const size_t resN=a.size()+b.size()-1;
+    size_t n=1;
+    while(n<resN)
+        n<<=1;
+    
+    // the transform buffers are kept per thread, so repeated convolutions do not allocate them again
+    static thread_local VecC fa, fb;
+    fa.assign(n,0);
+    fb.assign(n,0);
+    for(size_t i=0;i<a.size();i++)
+        fa[i]=a[i];
+    for(size_t i=0;i<b.size();i++)
+        fb[i]=b[i];
+    
+    fftInPlace(fa,false);
+    fftInPlace(fb,false);
+    for(size_t i=0;i<n;i++)
+        fa[i]*=fb[i];
+    fftInPlace(fa,true);
+    
+    VecD res(resN);
+    for(size_t i=0;i<resN;i++)
+        res[i]=fa[i].real();
+    return res;
+}
+
+//! put a weight at the position indexPosF (in units of bins) into the weights array of size newN
+//! with the same anti-aliasing split as used in operateDistributionsAndResample:
+//! the weight is shared linearly between the two neighbouring bins, the last bin gets everything
+//! @param info optional array of size InfoSize, the part of w beyond the first/last bin is added to InfoEdgeMass
+inline void splitIntoBins(double *resWeights, unsigned newN, double indexPosF, double w, double *info=nullptr)
+{
+    if (info && (indexPosF<0 || indexPosF>newN-1.))
+        info[InfoEdgeMass]+=w*std::min(1., indexPosF<0 ? -indexPosF : indexPosF-(newN-1.));
+    int indexPos= std::floor(indexPosF);
+    double aliasingWeight=(indexPosF-indexPos); //how closely is it hitting at the integer pos
+    if(indexPos<0)
+        indexPos=0;
+    if(indexPos>=int(newN))
+        indexPos=newN-1;
+    
+    if ( indexPos==int(newN)-1 )
+        resWeights[indexPos]+=w;
+    else 
+    {
+        resWeights[indexPos]+=w * (1-aliasingWeight);
+        resWeights[indexPos+1]+=w * (aliasingWeight);
+    }
+}
+
+inline void splitIntoBins(VecD &resWeights, double indexPosF, double w)
+{
+    splitIntoBins(resWeights.data(), resWeights.size(), indexPosF, w);
+}
+
+//! put a distribution with arbitrary centers onto an equally spaced grid
+//! the weights are split linearly between neighbouring grid points, so that the mean is conserved
+//! @param left the position of grid point 0
+//! @param delta the spacing of the grid
+//! @param gridN number of grid points, should cover all the centers
+inline VecD spreadOnGrid(const double *centers, const double *weights, size_t n,
+                         double left, double delta, unsigned gridN)
+{
+    VecD grid(gridN,0);
+    for(size_t i=0;i<n;i++)
+    {
+        // rounding can give tiny negative positions for the leftmost center
+        double indexPosF=std::max((centers[i]-left)/delta, 0.);
+        splitIntoBins(grid, indexPosF, weights[i]);
+    }
+    return grid;
+}
+
+inline VecD spreadOnGrid(const VecD &centers, const VecD &weights, double left, double delta, unsigned gridN)
+{
+    return spreadOnGrid(centers.data(), weights.data(), centers.size(), left, delta, gridN);
+}
+
 //! resample a distributino in the system of interval centers and weights to a smaller size
 //! @param centers the original interval centers
 //! @param weights the likelyhood of the corresponding interval centers
+//! @param n the size of centers and weights
+//! @param newCenters, newWeights arrays of size newN for the result
 //! @param newN the new size should be smaller!
-inline TupleVecD resampleDistribution(const VecD &centers, const VecD &weights, unsigned newN)
+inline void resampleDistributionInto(const double *centers, const double *weights, size_t n,
+                                     double *newCenters, double *newWeights, unsigned newN)
 {
-    // allocate results vectors
-    VecD newCenters;
-    VecD newWeights;
-    newCenters.resize(newN);
-    newWeights.resize(newN,0);
-    
     //find range
     double newLeft, newRight; //init. not necessary as always overwritten in getLimits
-    getLimits(centers, newLeft, newRight);
+    getLimits(centers, n, newLeft, newRight);
     double delta = (newRight-newLeft)/newN;
     
     //write resampled center positions
-    newCenters[0]=newLeft+delta/2;
-    for(unsigned i=1;i<newN;i++)
-        newCenters[i]=newCenters[i-1]+delta;
+    fillCenters(newCenters, newN, newLeft+delta/2, delta);
     
     // go through all weights and add them in the new interval
     // can have aliasing effects
-    for(unsigned i=0;i<centers.size();i++)
+    std::fill(newWeights, newWeights+newN, 0.);
+    for(size_t i=0;i<n;i++)
     {
         double indexPosF=(centers[i]-newLeft)/delta;
         int indexPos= std::round(indexPosF);
         if(indexPos<0)
             indexPos=0;
-        if(indexPos>=newN)
+        if(indexPos>=int(newN))
             indexPos=newN-1;
         newWeights[indexPos]+=weights[i];
     }
+}
     
+inline TupleVecD resampleDistribution(const VecD &centers, const VecD &weights, unsigned newN)
+{
+    // allocate results vectors
+    VecD newCenters(newN);
+    VecD newWeights(newN,0);
+    resampleDistributionInto(centers.data(), weights.data(), centers.size(),
+                             newCenters.data(), newWeights.data(), newN);
     return {newCenters, newWeights};
 }
 
+//! find min/max of the distribution resulting from operating two distributions with the given limits
+//! @param newLeft the double that the minimum is written into
+//! @param newRight the double that the maximum is written into
+inline void getResultLimits(const DistOps op, double min1, double max1, double min2, double max2,
+                            double &newLeft, double &newRight)
+{
+    switch(op)
+    {
+    case OpAdd: 
+            newLeft  =min1+min2;
+            newRight =max1+max2;
+        break;
+    case OpMul:
+            newLeft  =min1*min2;
+            newRight =max1*max2;
+        break;
+    case OpDiv: //this only works if there is no zero crossing in distribution 2
+            newLeft  =min1/max2;
+            newRight =max1/min2;
+        break;
+    }
+}
+
+//! find min/max of the distribution resulting from operating two distributions
+inline void getResultLimits(const DistOps op, const double *centers1, size_t n1,
+                            const double *centers2, size_t n2, double &newLeft, double &newRight)
+{
+    //get limits for the operated centers
+    double min1,max1,min2,max2;
+    getLimits(centers1, n1, min1, max1);
+    getLimits(centers2, n2, min2, max2);
+    getResultLimits(op, min1, max1, min2, max2, newLeft, newRight);
+}
+
+inline void getResultLimits(const DistOps op, const VecD &centers1, const VecD &centers2,
+                            double &newLeft, double &newRight)
+{
+    getResultLimits(op, centers1.data(), centers1.size(), centers2.data(), centers2.size(), newLeft, newRight);
+}
+
+//! number of entries of the second distribution, that form a tile of the pair loops:
+//! 4096 centers and weights are 64 kB, which fits in the L2 cache
+const size_t pairTile = 4096;
+
+//! the core of operateDistributionsAndResample:
+//! iterate through all combinations of points i=[iStart,iEnd) of distribution 1 and all of distribution 2
+//! to find the likelyhood of the operated new value 
+//! and add it to the resWeights array, which has its first bin at newLeft and a bin width of delta
+//! pairs with w1*w2<minPairWeight are skipped, their summed weight is added to info[InfoPrunedMass]
+inline void accumulatePairs( const DistOps op,
+    const double *centers1, const double *weights1, size_t iStart, size_t iEnd,
+    const double *centers2, const double *weights2, size_t n2,
+    double newLeft, double delta, double *resWeights, unsigned newN,
+    double minPairWeight=0, double *info=nullptr)
+{
+    // with pruning, whole rows can be skipped if even the largest pair is too small
+    double maxW2 = 0, sumW2 = 0;
+    if (minPairWeight>0)
+    {
+        for (size_t j =0;j<n2;j++)
+        {
+            maxW2 = std::max(maxW2, weights2[j]);
+            sumW2 += weights2[j];
+        }
+    }
+    double prunedSum = 0;
+
+    // the second distribution is processed in tiles, which stay in the cache while all rows are combined
+    // with them: it is read from memory once instead of once per row, the rows are read once per tile
+    for (size_t jStart =0;jStart<n2;jStart+=pairTile)
+    {
+        const size_t jEnd = std::min(n2, jStart+pairTile);
+        for (size_t i =iStart;i<iEnd;i++)
+        {
+            const double &c1=centers1[i];
+            const double &w1=weights1[i];
+            if (minPairWeight>0 && w1*maxW2<minPairWeight)
+            {
+                if (jStart==0)
+                    prunedSum += w1*sumW2;
+                continue;
+            }
+            for (size_t j =jStart;j<jEnd;j++)
+            {
+                    const double &c2=centers2[j];
+                    const double &w2=weights2[j];
+                
+                    if (minPairWeight>0 && w1*w2<minPairWeight)
+                    {
+                        prunedSum += w1*w2;
+                        continue;
+                    }
+
+                    double newC; //the new center pos
+                    switch(op)
+                    {
+                    case OpAdd: newC=c1+c2; break;
+                    case OpMul: newC=c1*c2; break;
+                    case OpDiv: newC=c1/c2; break;
+                    }
+                
+                    //find the index at which this new Pos is in the results
+                    //and add it there with anti-aliasing
+                    splitIntoBins(resWeights, newN, (newC-newLeft)/delta, w1*w2, info);
+            }
+        }
+    }
+    if (info)
+        info[InfoPrunedMass] += prunedSum;
+}
+
+//! split the rows [0,n1) of a pair operation into blocks evaluated by several threads
+//! every thread accumulates its block into its own weights array, and the arrays are summed
+//! in a fixed order at the end, so the result does not depend on the thread scheduling.
+//! @param info array of size InfoSize, gets the summed info of all blocks
+//! @param accumulate callable(iStart, iEnd, weightsTarget, infoTarget) that does the work for a block
+inline void runPairThreads(size_t n1, size_t n2, double *resWeights, unsigned newN, double *info,
+    unsigned nThreads, unsigned minPairsPerThread,
+    const std::function<void(size_t, size_t, double*, double*)> &accumulate)
+{
+    if (nThreads==0)
+        nThreads = std::max(1u, std::thread::hardware_concurrency());
+    nThreads = std::min<size_t>(nThreads, std::max<size_t>(1, n1*n2/std::max(1u, minPairsPerThread)));
+    nThreads = std::min<size_t>(nThreads, n1);
+
+    if (nThreads<=1)
+    {
+        accumulate(0, n1, resWeights, info);
+        return;
+    }
+
+    // one weights and info array per thread, so that no locking is needed
+    // the first thread writes directly into the result
+    // the arrays are kept per calling thread, so repeated operations do not allocate them again
+    static thread_local std::vector<VecD> threadWeights, threadInfo;
+    threadWeights.resize(nThreads-1);
+    threadInfo.resize(nThreads);
+    for(auto &w : threadWeights)
+        w.assign(newN, 0);
+    for(auto &w : threadInfo)
+        w.assign(InfoSize, 0);
+    std::vector<std::thread> threads;
+    for(unsigned t=0;t<nThreads;t++)
+    {
+        size_t iStart = n1*t/nThreads;
+        size_t iEnd = n1*(t+1)/nThreads;
+        double *target = t==0 ? resWeights : threadWeights[t-1].data();
+        threads.emplace_back(accumulate, iStart, iEnd, target, threadInfo[t].data());
+    }
+    for(unsigned t=0;t<nThreads;t++)
+        threads[t].join();
+
+    // reduce in a fixed order, so that the result is deterministic
+    for(unsigned t=1;t<nThreads;t++)
+        for(unsigned i=0;i<newN;i++)
+            resWeights[i]+=threadWeights[t-1][i];
+    for(unsigned t=0;t<nThreads;t++)
+        for(unsigned i=0;i<InfoSize;i++)
+            info[i]+=threadInfo[t][i];
+}
+
 //! interact one distribution with another
 //! One can add/multiply/divide two distributions.
 //! adding means, that one e.g. has two sticks with the likely lengths are the distribution centers
@@ -221,9 +569,53 @@ inline TupleVecD resampleDistribution(const VecD &centers, const VecD &weights,
 //! and the dramatic slowdown/memory increase if the full resolution would be outputted
 //! however this allows for aliasing effects
 //! 
+//! With nThreads>1 the rows of distribution 1 are split into nThreads equally sized blocks,
+//! every thread accumulates its block into its own weights array,
+//! and the arrays are summed in a fixed order at the end.
+//! So the result does not depend on the thread scheduling,
+//! but can differ from the single threaded result by rounding.
+//!
 //! @param op: One out of "OpAdd, OpMul, OpDiv" to define what should be done
-//! @param weights the likelyhood of the corresponding interval centers
+//! @param centers1, weights1, n1 the first distribution and its size
+//! @param centers2, weights2, n2 the second distribution and its size
+//! @param resCenters, resWeights arrays of size newN for the result
 //! @param newN the new size should be smaller!
+//! @param nThreads number of threads, 0 uses std::thread::hardware_concurrency()
+//! @param minPairsPerThread small operations use less threads, as starting a thread costs time
+//! @param minPairWeight pairs with w1*w2 below this are skipped, 0 evaluates all pairs
+//! @param info optional array of size InfoSize, which gets statistics of the operation
+inline void operateDistributionsAndResampleInto( const DistOps op,
+    const double *centers1, const double *weights1, size_t n1,
+    const double *centers2, const double *weights2, size_t n2,
+    double *resCenters, double *resWeights, unsigned newN,
+    unsigned nThreads=1, unsigned minPairsPerThread=100000,
+    double minPairWeight=0, double *info=nullptr)
+{
+    //find min/max of the resulting distribution
+    double newLeft, newRight;
+    getResultLimits(op, centers1, n1, centers2, n2, newLeft, newRight);
+
+    // define the new centers, weights are more compliacted
+    double delta = (newRight-newLeft)/newN;
+    fillCenters(resCenters, newN, newLeft+delta/2, delta);
+    std::fill(resWeights, resWeights+newN, 0.);
+
+    double localInfo[InfoSize];
+    if (!info)
+        info = localInfo;
+    std::fill(info, info+InfoSize, 0.);
+
+    runPairThreads(n1, n2, resWeights, newN, info, nThreads, minPairsPerThread,
+        [&](size_t iStart, size_t iEnd, double *target, double *infoTarget)
+        {
+            accumulatePairs(op, centers1, weights1, iStart, iEnd, centers2, weights2, n2,
+                            newLeft, delta, target, newN, minPairWeight, infoTarget);
+        });
+
+    // polish the results weight so that they are mostly summed to 1
+    normalizeVec(resWeights, newN, info);
+}
+
 inline TupleVecD operateDistributionsAndResample( const DistOps op,
     const VecD &centers1, const VecD &weights1, 
     const VecD &centers2, const VecD &weights2, unsigned newN=0)
@@ -235,83 +627,593 @@ inline TupleVecD operateDistributionsAndResample( const DistOps op,
     // allocate the centers/weights for the results
     VecD resCenters( newN, 0);
     VecD resWeights( newN, 0);
+    operateDistributionsAndResampleInto(op, centers1.data(), weights1.data(), centers1.size(),
+        centers2.data(), weights2.data(), centers2.size(), resCenters.data(), resWeights.data(), newN);
+    return  {resCenters,resWeights};
+}
+
+//! same as operateDistributionsAndResample, but the pairs are evaluated by several threads
+inline TupleVecD operateDistributionsAndResampleParallel( const DistOps op,
+    const VecD &centers1, const VecD &weights1, 
+    const VecD &centers2, const VecD &weights2, unsigned newN=0, 
+    unsigned nThreads=0, unsigned minPairsPerThread=100000)
+{
+    if (newN==0)
+        newN = std::min(centers1.size(), centers2.size()) +1;
     
-    //get limits for the operated centers
-    double min1,max1,min2,max2;
-    getLimits(centers1, min1, max1);
-    getLimits(centers2, min2, max2);
-    
-    //find min/max of the resulting distribution
-    double newLeft, newRight;
-    switch(op)
+    VecD resCenters( newN, 0);
+    VecD resWeights( newN, 0);
+    operateDistributionsAndResampleInto(op, centers1.data(), weights1.data(), centers1.size(),
+        centers2.data(), weights2.data(), centers2.size(), resCenters.data(), resWeights.data(), newN,
+        nThreads, minPairsPerThread);
+    return  {resCenters,resWeights};
+}
+
+//! put a weight at the value x into the weights of ascending, not necessarily equally spaced centers
+//! the weight is shared linearly between the two neighbouring centers, which conserves the mean.
+//! The neighbours are found by binary search. Values beyond the first/last center go there,
+//! the part the linear split would have put further out is added to info[InfoEdgeMass].
+inline void splitOntoCenters(const double *resCenters, double *resWeights, unsigned newN, 
+                             double x, double w, double *info=nullptr)
+{
+    const double *upper = std::upper_bound(resCenters, resCenters+newN, x);
+    if (upper==resCenters || upper==resCenters+newN)
     {
-    case OpAdd: 
-            newLeft  =min1+min2;
-            newRight =max1+max2;
-        break;
-    case OpMul:
-            newLeft  =min1*min2;
-            newRight =max1*max2;
-        break;
-    case OpDiv: //this only works if there is no zero crossing in distribution 2
-            newLeft  =min1/max2;
-            newRight =max1/min2;
-        break;
+        size_t k = upper==resCenters ? 0 : newN-1;
+        if (info && newN>1 && x!=resCenters[k])
+        {
+            double spacing = k==0 ? resCenters[1]-resCenters[0] : resCenters[k]-resCenters[k-1];
+            info[InfoEdgeMass] += w*std::min(1., std::abs(x-resCenters[k])/spacing);
+        }
+        resWeights[k]+=w;
+        return;
     }
-    
-    // define the new centers, weights are more compliacted
-    double delta = (newRight-newLeft)/newN;
-    
-    resCenters[0]=newLeft+delta/2;
-    for(unsigned i=1;i<newN;i++)
-        resCenters[i]=resCenters[i-1]+delta; 
-        
-    // iterate through all combinations of points
-    // to find the likelyhood of the operated new value 
-    // and add it to the weights array
-    for (unsigned i =0;i<centers1.size();i++)
+    size_t j = upper-resCenters-1;
+    double aliasingWeight = (x-resCenters[j])/(resCenters[j+1]-resCenters[j]);
+    resWeights[j]+=w*(1-aliasingWeight);
+    resWeights[j+1]+=w*aliasingWeight;
+}
+
+//! same as accumulatePairs, but the result has the given ascending centers instead of equally spaced ones
+inline void accumulatePairsOntoCenters( const DistOps op,
+    const double *centers1, const double *weights1, size_t iStart, size_t iEnd,
+    const double *centers2, const double *weights2, size_t n2,
+    const double *resCenters, double *resWeights, unsigned newN,
+    double minPairWeight=0, double *info=nullptr)
+{
+    double maxW2 = 0, sumW2 = 0;
+    if (minPairWeight>0)
     {
-        const double &c1=centers1[i];
-        const double &w1=weights1[i];
-        for (unsigned j =0;j<centers2.size();j++)
+        for (size_t j =0;j<n2;j++)
         {
-                const double &c2=centers2[j];
-                const double &w2=weights2[j];
-                
-                double newC; //the new center pos
+            maxW2 = std::max(maxW2, weights2[j]);
+            sumW2 += weights2[j];
+        }
+    }
+    double prunedSum = 0;
+
+    // the second distribution is processed in tiles, which stay in the cache while all rows are combined
+    // with them: it is read from memory once instead of once per row, the rows are read once per tile
+    for (size_t jStart =0;jStart<n2;jStart+=pairTile)
+    {
+        const size_t jEnd = std::min(n2, jStart+pairTile);
+        for (size_t i =iStart;i<iEnd;i++)
+        {
+            const double c1=centers1[i];
+            const double w1=weights1[i];
+            if (minPairWeight>0 && w1*maxW2<minPairWeight)
+            {
+                if (jStart==0)
+                    prunedSum += w1*sumW2;
+                continue;
+            }
+            for (size_t j =jStart;j<jEnd;j++)
+            {
+                const double w=w1*weights2[j];
+                if (minPairWeight>0 && w<minPairWeight)
+                {
+                    prunedSum += w;
+                    continue;
+                }
+                double newC=0;
                 switch(op)
                 {
-                case OpAdd: newC=c1+c2; break;
-                case OpMul: newC=c1*c2; break;
-                case OpDiv: newC=c1/c2; break;
+                case OpAdd: newC=c1+centers2[j]; break;
+                case OpMul: newC=c1*centers2[j]; break;
+                case OpDiv: newC=c1/centers2[j]; break;
                 }
-                
-                //find the index at which this new Pos is in the results
-                double indexPosF=(newC-newLeft)/delta;
-                int indexPos= std::floor(indexPosF);
-                double aliasingWeight=(indexPosF-indexPos); //how closely is it hitting at the integer pos
-                if(indexPos<0)
-                    indexPos=0;
-                if(indexPos>=newN)
-                    indexPos=newN-1;
-                
-                if ( indexPos==newN-1 )
-                    resWeights[indexPos]+=w1*w2;
-                else 
+                splitOntoCenters(resCenters, resWeights, newN, newC, w, info);
+            }
+        }
+    }
+    if (info)
+        info[InfoPrunedMass] += prunedSum;
+}
+
+//! same as operateDistributionsAndResampleInto, but the result bins are not equally spaced
+//! between the result limits: resCenters are given (ascending), e.g. denser where the probability mass is.
+//! Every pair costs a binary search in resCenters, log2(newN) steps, but the same accuracy
+//! needs far fewer result bins, and so fewer pairs in the following operations.
+//! @param resCenters the ascending centers of the result, should reach from the smallest to the largest pair
+//! @param resWeights array of size newN for the result
+inline void operateDistributionsOntoCentersInto( const DistOps op,
+    const double *centers1, const double *weights1, size_t n1,
+    const double *centers2, const double *weights2, size_t n2,
+    const double *resCenters, double *resWeights, unsigned newN,
+    unsigned nThreads=1, unsigned minPairsPerThread=100000,
+    double minPairWeight=0, double *info=nullptr)
+{
+    std::fill(resWeights, resWeights+newN, 0.);
+
+    double localInfo[InfoSize];
+    if (!info)
+        info = localInfo;
+    std::fill(info, info+InfoSize, 0.);
+
+    runPairThreads(n1, n2, resWeights, newN, info, nThreads, minPairsPerThread,
+        [&](size_t iStart, size_t iEnd, double *target, double *infoTarget)
+        {
+            accumulatePairsOntoCenters(op, centers1, weights1, iStart, iEnd, centers2, weights2, n2,
+                                       resCenters, target, newN, minPairWeight, infoTarget);
+        });
+
+    normalizeVec(resWeights, newN, info);
+}
+
+//! resample a distribution onto the given ascending centers, with the same linear split as splitOntoCenters
+//! @param info optional array of size InfoSize, which gets statistics of the operation
+inline void resampleDistributionOntoCentersInto(const double *centers, const double *weights, size_t n,
+    const double *newCenters, double *newWeights, unsigned newN, double *info=nullptr)
+{
+    std::fill(newWeights, newWeights+newN, 0.);
+    if (info)
+        std::fill(info, info+InfoSize, 0.);
+    for(size_t i=0;i<n;i++)
+        splitOntoCenters(newCenters, newWeights, newN, centers[i], weights[i], info);
+}
+
+//! the min/max of a grid distribution, whose center i is left+i*delta, i=[0,n)
+inline void getGridLimits(double left, double delta, size_t n, double &dmin, double &dmax)
+{
+    double right = left+(n-1)*delta;
+    dmin = std::min(left, right);
+    dmax = std::max(left, right);
+}
+
+//! same as accumulatePairs, but for distributions on equally spaced grids:
+//! center i of distribution 1 is left1+i*delta1, no center arrays are read.
+//! For additions and multiplications the result position is linear in j, 
+//! so the bin positions are calculated with a single multiply-add per pair.
+//! The weights can be float or double, the products and sums are always done in double,
+//! so float weights are only rounded once when they are stored.
+template<typename W>
+inline void accumulateGridPairs( const DistOps op,
+    double left1, double delta1, const W *weights1, size_t iStart, size_t iEnd,
+    double left2, double delta2, const W *weights2, size_t n2,
+    double newLeft, double delta, double *resWeights, unsigned newN,
+    double minPairWeight=0, double *info=nullptr)
+{
+    double maxW2 = 0, sumW2 = 0;
+    if (minPairWeight>0)
+    {
+        for (size_t j =0;j<n2;j++)
+        {
+            maxW2 = std::max<double>(maxW2, weights2[j]);
+            sumW2 += weights2[j];
+        }
+    }
+    double prunedSum = 0;
+
+    // the second distribution is processed in tiles, which stay in the cache while all rows are combined
+    // with them: it is read from memory once instead of once per row, the rows are read once per tile
+    for (size_t jStart =0;jStart<n2;jStart+=pairTile)
+    {
+        const size_t jEnd = std::min(n2, jStart+pairTile);
+        for (size_t i =iStart;i<iEnd;i++)
+        {
+            const double c1=left1+i*delta1;
+            const double w1=weights1[i];
+            if (minPairWeight>0 && w1*maxW2<minPairWeight)
+            {
+                if (jStart==0)
+                    prunedSum += w1*sumW2;
+                continue;
+            }
+        
+            // position of pair (i,j) in units of result bins is pos0+j*posStep for OpAdd and OpMul
+            double pos0=0, posStep=0;
+            switch(op)
+            {
+            case OpAdd: pos0=(c1+left2-newLeft)/delta; posStep=delta2/delta; break;
+            case OpMul: pos0=(c1*left2-newLeft)/delta; posStep=c1*delta2/delta; break;
+            case OpDiv: break;
+            }
+        
+            for (size_t j =jStart;j<jEnd;j++)
+            {
+                const double w=w1*double(weights2[j]);
+                if (minPairWeight>0 && w<minPairWeight)
                 {
-                    //anti-aliasing
-                    resWeights[indexPos]+=w1*w2 * (1-aliasingWeight);
-                    resWeights[indexPos+1]+=w1*w2 * (aliasingWeight);
+                    prunedSum += w;
+                    continue;
                 }
-                
+                double indexPosF = op==OpDiv ? (c1/(left2+j*delta2)-newLeft)/delta : pos0+j*posStep;
+                splitIntoBins(resWeights, newN, indexPosF, w, info);
+            }
         }
     }
-    // polish the results weight so that they are mostly summed to 1
-    normalizeVec(resWeights);
+    if (info)
+        info[InfoPrunedMass] += prunedSum;
+}
+
+//! same as operateDistributionsAndResampleInto, but for distributions on equally spaced grids
+//! center i of distribution 1 is left1+i*delta1, the same for distribution 2 and the result.
+//! This needs no center arrays, the result grid is written into resLeft and resDelta.
+//! @param weights1, weights2 float or double arrays
+//! @param resWeights double array of size newN
+template<typename W>
+inline void operateGridDistributionsAndResampleInto( const DistOps op,
+    double left1, double delta1, const W *weights1, size_t n1,
+    double left2, double delta2, const W *weights2, size_t n2,
+    double &resLeft, double &resDelta, double *resWeights, unsigned newN,
+    unsigned nThreads=1, unsigned minPairsPerThread=100000,
+    double minPairWeight=0, double *info=nullptr)
+{
+    double min1,max1,min2,max2;
+    getGridLimits(left1, delta1, n1, min1, max1);
+    getGridLimits(left2, delta2, n2, min2, max2);
+    double newLeft, newRight;
+    getResultLimits(op, min1, max1, min2, max2, newLeft, newRight);
+
+    double delta = (newRight-newLeft)/newN;
+    resLeft = newLeft+delta/2;
+    resDelta = delta;
+    std::fill(resWeights, resWeights+newN, 0.);
+
+    double localInfo[InfoSize];
+    if (!info)
+        info = localInfo;
+    std::fill(info, info+InfoSize, 0.);
+
+    runPairThreads(n1, n2, resWeights, newN, info, nThreads, minPairsPerThread,
+        [&](size_t iStart, size_t iEnd, double *target, double *infoTarget)
+        {
+            accumulateGridPairs(op, left1, delta1, weights1, iStart, iEnd, left2, delta2, weights2, n2,
+                                newLeft, delta, target, newN, minPairWeight, infoTarget);
+        });
+
+    normalizeVec(resWeights, newN, info);
+}
+
+//! add two distributions using a fft convolution instead of iterating all pairs
+//! The result is the same as operateDistributionsAndResample(OpAdd,...) up to a small additional smoothing:
+//! both distributions are spread onto a common equally spaced grid, which is "oversample" times 
+//! finer than the result grid, convolved in O(N log N), and then put into the result bins
+//! with the same anti-aliasing as the pair algorithm.
+//! The mean is conserved, the variance grows by roughly (resultBinWidth/oversample)^2/3.
+//! @param resCenters, resWeights arrays of size newN for the result
+//! @param newN the size of the result, same meaning as in operateDistributionsAndResample
+//! @param oversample how much finer the internal grid is compared to the result
+//! @param info optional array of size InfoSize, which gets statistics of the operation
+inline void convolveDistributionsAndResampleInto(
+    const double *centers1, const double *weights1, size_t n1,
+    const double *centers2, const double *weights2, size_t n2,
+    double *resCenters, double *resWeights, unsigned newN, unsigned oversample=4, double *info=nullptr)
+{
+    if (info)
+        std::fill(info, info+InfoSize, 0.);
+    if (oversample==0)
+        oversample=1;
+
+    double min1,max1,min2,max2;
+    getLimits(centers1, n1, min1, max1);
+    getLimits(centers2, n2, min2, max2);
+
+    // same result interval as operateDistributionsAndResample
+    double newLeft  =min1+min2;
+    double newRight =max1+max2;
+    double delta = (newRight-newLeft)/newN;
+    fillCenters(resCenters, newN, newLeft+delta/2, delta);
+    std::fill(resWeights, resWeights+newN, 0.);
+
+    // common fine grid, each distribution starts at its own minimum
+    // so grid point k of the convolution is at newLeft+k*h
+    double h = delta/oversample;
+    unsigned gridN1 = unsigned((max1-min1)/h)+2;
+    unsigned gridN2 = unsigned((max2-min2)/h)+2;
+    VecD grid1 = spreadOnGrid(centers1, weights1, n1, min1, h, gridN1);
+    VecD grid2 = spreadOnGrid(centers2, weights2, n2, min2, h, gridN2);
+
+    VecD conv = convolveVec(grid1, grid2);
+
+    // put the fine grid into the result bins
+    for(unsigned k=0;k<conv.size();k++)
+        splitIntoBins(resWeights, newN, double(k)/oversample, conv[k], info);
+
+    // fft rounding produces tiny negative weights, they are removed here
+    normalizeVec(resWeights, newN, info);
+}
+
+inline TupleVecD convolveDistributionsAndResample(
+    const VecD &centers1, const VecD &weights1, 
+    const VecD &centers2, const VecD &weights2, unsigned newN=0, unsigned oversample=4)
+{
+    if (newN==0)
+        newN = std::min(centers1.size(), centers2.size()) +1;
     
+    VecD resCenters( newN, 0);
+    VecD resWeights( newN, 0);
+    convolveDistributionsAndResampleInto(centers1.data(), weights1.data(), centers1.size(),
+        centers2.data(), weights2.data(), centers2.size(), resCenters.data(), resWeights.data(), newN,
+        oversample);
+    return  {resCenters,resWeights};
+}
+
+//! multiply or divide two strictly positive distributions using a fft convolution in log space
+//! log(c1*c2)=log(c1)+log(c2), so a product is a sum of the logarithms.
+//! Both distributions are spread onto a common equally spaced grid of log(centers),
+//! convolved in O(N log N), and every point of the log grid is mapped back by exp() 
+//! into the result bins with the same anti-aliasing as operateDistributionsAndResample.
+//! The log grid is "oversample" times finer than the result bins at the upper end of the result range.
+//! For distributions with a very large ratio max/min the log grid would get huge,
+//! it is then limited to maxGridN points, which makes the result coarser at the upper end.
+//! @param op: OpMul or OpDiv
+//! @param resCenters, resWeights arrays of size newN for the result
+//! @param newN the size of the result, same meaning as in operateDistributionsAndResample
+//! @param info optional array of size InfoSize, which gets statistics of the operation
+inline void logConvolveDistributionsAndResampleInto( const DistOps op,
+    const double *centers1, const double *weights1, size_t n1,
+    const double *centers2, const double *weights2, size_t n2,
+    double *resCenters, double *resWeights, unsigned newN,
+    unsigned oversample=4, unsigned maxGridN=1<<24, double *info=nullptr)
+{
+    if (op==OpAdd)
+        throw std::invalid_argument("logConvolveDistributionsAndResample can only multiply or divide");
+    if (oversample==0)
+        oversample=1;
+    
+    double min1,max1,min2,max2;
+    getLimits(centers1, n1, min1, max1);
+    getLimits(centers2, n2, min2, max2);
+    if (min1<=0 || min2<=0)
+        throw std::invalid_argument("logConvolveDistributionsAndResample needs strictly positive centers");
+    
+    // same result interval as operateDistributionsAndResample
+    double newLeft, newRight;
+    getResultLimits(op, centers1, n1, centers2, n2, newLeft, newRight);
+    double delta = (newRight-newLeft)/newN;
+    fillCenters(resCenters, newN, newLeft+delta/2, delta);
+    std::fill(resWeights, resWeights+newN, 0.);
+    if (info)
+        std::fill(info, info+InfoSize, 0.);
+    
+    // the log grid spacing, chosen so that a result bin at newRight is resolved "oversample" times
+    double logRange = std::log(newRight/newLeft);
+    double h = delta/newRight/oversample;
+    if (logRange/h > maxGridN)
+        h = logRange/maxGridN;
+    
+    // for division the second distribution is mirrored: log(c1/c2)=log(c1)+(-log(c2))
+    VecD logCenters1(n1), logCenters2(n2);
+    for(size_t i=0;i<n1;i++)
+        logCenters1[i]=std::log(centers1[i]);
+    for(size_t i=0;i<n2;i++)
+        logCenters2[i]= op==OpMul ? std::log(centers2[i]) : -std::log(centers2[i]);
+    
+    double logMin1,logMax1,logMin2,logMax2;
+    getLimits(logCenters1, logMin1, logMax1);
+    getLimits(logCenters2, logMin2, logMax2);
+    
+    unsigned gridN1 = unsigned((logMax1-logMin1)/h)+2;
+    unsigned gridN2 = unsigned((logMax2-logMin2)/h)+2;
+    VecD grid1 = spreadOnGrid(logCenters1.data(), weights1, n1, logMin1, h, gridN1);
+    VecD grid2 = spreadOnGrid(logCenters2.data(), weights2, n2, logMin2, h, gridN2);
+    
+    VecD conv = convolveVec(grid1, grid2);
+    
+    // map the log grid back to linear values and put them into the result bins
+    double logLeft=logMin1+logMin2;
+    for(unsigned k=0;k<conv.size();k++)
+    {
+        double newC=std::exp(logLeft+k*h);
+        splitIntoBins(resWeights, newN, (newC-newLeft)/delta, conv[k], info);
+    }
+    
+    // fft rounding produces tiny negative weights, they are removed here
+    normalizeVec(resWeights, newN, info);
+}
+    
+inline TupleVecD logConvolveDistributionsAndResample( const DistOps op,
+    const VecD &centers1, const VecD &weights1,
+    const VecD &centers2, const VecD &weights2, unsigned newN=0,
+    unsigned oversample=4, unsigned maxGridN=1<<24)
+{
+    if (newN==0)
+        newN = std::min(centers1.size(), centers2.size()) +1;
+
+    VecD resCenters( newN, 0);
+    VecD resWeights( newN, 0);
+    logConvolveDistributionsAndResampleInto(op, centers1.data(), weights1.data(), centers1.size(),
+        centers2.data(), weights2.data(), centers2.size(), resCenters.data(), resWeights.data(), newN,
+        oversample, maxGridN);
     return  {resCenters,resWeights};
 }
 
 
+//! z^p by repeated squaring, which is more accurate than std::pow for complex numbers
+inline ComplexD powInt(ComplexD z, unsigned p)
+{
+    ComplexD res(1,0);
+    while(p)
+    {
+        if(p&1)
+            res*=z;
+        z*=z;
+        p>>=1;
+    }
+    return res;
+}
+
+//! convolveManyDistributionsAndResample leaves out result tails of less mass than this (on each side),
+//! it is about the rounding noise of the fft
+const double manyTailMass = 1e-12;
+
+//! add or multiply many distributions in a single fft pass
+//! Instead of a chain of binary operations, which resamples after every step,
+//! all distributions are spread onto a common fine grid (in log space for OpMul, like the log engine),
+//! that resolves the bins of every distribution, they are convolved on this grid,
+//! and the result is put into the result bins once, which only span the part with mass.
+//! A distribution that occurs p times is transformed once, and its spectrum is raised to the power p,
+//! so the sum of k identical distributions costs the same as a single fft.
+//! @param op: OpAdd or OpMul (for OpMul all centers have to be strictly positive)
+//! @param centers, weights the k distributions concatenated, distribution i is [offsets[i],offsets[i+1])
+//! @param offsets array of size k+1
+//! @param powers how often each distribution occurs in the sum/product
+//! @param resCenters, resWeights arrays of size newN for the result
+//! @param oversample grid points per result bin and per bin of every distribution
+//! @param maxGridN maximal number of grid points of the result, above it std::length_error is thrown
+//!                 and the sum/product has to be calculated as a chain of operations
+//! @param info optional array of size InfoSize, which gets statistics of the operation
+inline void convolveManyDistributionsAndResampleInto( const DistOps op,
+    const double *centers, const double *weights, const size_t *offsets, const unsigned *powers, size_t k,
+    double *resCenters, double *resWeights, unsigned newN,
+    unsigned oversample=4, unsigned maxGridN=1<<24, double *info=nullptr)
+{
+    if (op==OpDiv)
+        throw std::invalid_argument("convolveManyDistributionsAndResample can only add or multiply");
+    if (oversample==0)
+        oversample=1;
+    
+    // the grid coordinate is the value itself for sums, and its logarithm for products
+    VecD coords(centers, centers+offsets[k]);
+    if (op==OpMul)
+    {
+        for(size_t i=0;i<offsets[k];i++)
+        {
+            if (coords[i]<=0)
+                throw std::invalid_argument("convolveManyDistributionsAndResample needs strictly positive centers");
+            coords[i]=std::log(coords[i]);
+        }
+    }
+    
+    // the full result interval, the same as for a chain of operateDistributionsAndResample
+    VecD mins(k), maxs(k);
+    double coordLeft=0, coordRight=0;
+    for(size_t i=0;i<k;i++)
+    {
+        getLimits(coords.data()+offsets[i], offsets[i+1]-offsets[i], mins[i], maxs[i]);
+        coordLeft += powers[i]*mins[i];
+        coordRight += powers[i]*maxs[i];
+    }
+    double newLeft = op==OpMul ? std::exp(coordLeft) : coordLeft;
+    double newRight = op==OpMul ? std::exp(coordRight) : coordRight;
+    double delta = (newRight-newLeft)/newN;
+    std::fill(resWeights, resWeights+newN, 0.);
+    if (info)
+        std::fill(info, info+InfoSize, 0.);
+    
+    // the grid has to resolve the result bins and the bins of every distribution,
+    // otherwise a long sum of narrow distributions collapses onto a few grid points
+    double h = op==OpMul ? delta/newRight/oversample : delta/oversample;
+    for(size_t i=0;i<k;i++)
+    {
+        size_t count = offsets[i+1]-offsets[i];
+        if (powers[i]==0 || count<2 || maxs[i]<=mins[i])
+            continue;
+        // for products the spacing in log space is the finest at the largest center
+        double spacing = op==OpMul ? -std::expm1(mins[i]-maxs[i]) : maxs[i]-mins[i];
+        h = std::min(h, spacing/(count-1)/oversample);
+    }
+    
+    std::vector<size_t> gridN(k);
+    size_t resN=1;
+    for(size_t i=0;i<k;i++)
+    {
+        gridN[i] = size_t((maxs[i]-mins[i])/h)+2;
+        resN += size_t(powers[i])*(gridN[i]-1);
+    }
+    if (resN>maxGridN)
+        throw std::length_error("convolveManyDistributionsAndResample needs more than maxGridN grid points");
+    
+    // every distribution is spread onto the grid, one that occurs p times is transformed once
+    // and its spectrum is raised to the power p. The grids are then convolved, the shortest ones first
+    // like in a chain of operations, so every level of this tree costs about one fft of the result size
+    typedef std::pair<size_t,size_t> SizeIndex;
+    std::vector<VecD> grids;
+    std::priority_queue<SizeIndex, std::vector<SizeIndex>, std::greater<SizeIndex>> shortest;
+    for(size_t i=0;i<k;i++)
+    {
+        if (powers[i]==0)
+            continue;
+        VecD grid = spreadOnGrid(coords.data()+offsets[i], weights+offsets[i], offsets[i+1]-offsets[i], 
+                                 mins[i], h, unsigned(gridN[i]));
+        if (powers[i]>1)
+        {
+            const size_t size = size_t(powers[i])*(gridN[i]-1)+1;
+            size_t n=1;
+            while(n<size)
+                n<<=1;
+            VecC f(n, ComplexD(0,0));
+            for(size_t j=0;j<grid.size();j++)
+                f[j]=grid[j];
+            fftInPlace(f,false);
+            for(size_t j=0;j<n;j++)
+                f[j]=powInt(f[j], powers[i]);
+            fftInPlace(f,true);
+            grid.resize(size);
+            for(size_t j=0;j<size;j++)
+                grid[j]=f[j].real();
+        }
+        shortest.push(SizeIndex(grid.size(), grids.size()));
+        grids.push_back(std::move(grid));
+    }
+    while (shortest.size()>1)
+    {
+        const size_t i1=shortest.top().second;
+        shortest.pop();
+        const size_t i2=shortest.top().second;
+        shortest.pop();
+        grids[i1]=convolveVec(grids[i1], grids[i2]);
+        VecD().swap(grids[i2]);
+        shortest.push(SizeIndex(grids[i1].size(), i1));
+    }
+    const VecD &conv = grids[shortest.top().second];
+    
+    // the full interval of a long sum is much wider than its mass (a sum of k rects has a stdDev of
+    // about 1/sqrt(k) of the interval), so the result bins only span the grid points without the tails
+    double total=0;
+    for(size_t m=0;m<resN;m++)
+        total += std::max(conv[m], 0.);
+    const double cut = manyTailMass*total;
+    size_t first=0, last=resN;
+    double leftMass=0, rightMass=0;
+    while (first<resN && leftMass+std::max(conv[first], 0.)<=cut)
+        leftMass += std::max(conv[first++], 0.);
+    while (last>first && rightMass+std::max(conv[last-1], 0.)<=cut)
+        rightMass += std::max(conv[--last], 0.);
+    if (last-first<2)
+    {
+        first=0;
+        last=resN;
+        leftMass=rightMass=0;
+    }
+    if (info)
+        info[InfoPrunedMass] += leftMass+rightMass;
+    
+    // grid point m of the result is at coordLeft+m*h
+    newLeft = op==OpMul ? std::exp(coordLeft+first*h) : coordLeft+first*h;
+    newRight = op==OpMul ? std::exp(coordLeft+(last-1)*h) : coordLeft+(last-1)*h;
+    delta = (newRight-newLeft)/newN;
+    fillCenters(resCenters, newN, newLeft+delta/2, delta);
+    for(size_t m=first;m<last;m++)
+    {
+        double indexPosF = op==OpMul ? (std::exp(coordLeft+m*h)-newLeft)/delta : (m-first)*(h/delta);
+        splitIntoBins(resWeights, newN, indexPosF, conv[m], info);
+    }
+    
+    // fft rounding produces tiny negative weights, they are removed here
+    normalizeVec(resWeights, newN, info);
+}
+
 
-#endif
\ No newline at end of file
+#endif
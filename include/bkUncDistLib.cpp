@@ -0,0 +1,147 @@
+/**
+ * C interface to bkUncDist.hpp, to be compiled ahead of time into a shared library
+ *
+ * This allows to use the c++ core from python via ctypes, without cppyy and without
+ * the JIT compilation of the header at startup. Build it with "python buildLib.py".
+ *
+ * Only the "...Into" routines are exported, they work on raw arrays, so numpy arrays
+ * can be passed directly. The functions are extern "C", so their names are not mangled,
+ * the prefix "undis_" avoids clashes with the c++ names.
+ *
+ * License: LGPL-3.0-or-later
+ */
+
+#include "bkUncDist.hpp"
+
+extern "C" {
+
+// version of this interface, checked by uncertainDistribution.py before the library is used
+// increase it (and libAbiVersion in uncertainDistribution.py) whenever a signature or a return code changes
+int undis_abiVersion()
+{
+    return 1;
+}
+
+void undis_getNormal(double mean, double stddev, double sigmaMax, unsigned N,
+                     double *centers, double *weights)
+{
+    getNormalInto(mean, stddev, sigmaMax, N, centers, weights);
+}
+
+void undis_getTri(double leftVal, double centerVal, double rightVal, unsigned N,
+                  double *centers, double *weights)
+{
+    getTriInto(leftVal, centerVal, rightVal, N, centers, weights);
+}
+
+void undis_getRect(double leftVal, double rightVal, unsigned N, double *centers, double *weights)
+{
+    getRectInto(leftVal, rightVal, N, centers, weights);
+}
+
+void undis_resampleDistribution(const double *centers, const double *weights, size_t n,
+                                double *newCenters, double *newWeights, unsigned newN)
+{
+    resampleDistributionInto(centers, weights, n, newCenters, newWeights, newN);
+}
+
+void undis_operateDistributionsAndResample(int op,
+    const double *centers1, const double *weights1, size_t n1,
+    const double *centers2, const double *weights2, size_t n2,
+    double *resCenters, double *resWeights, unsigned newN, unsigned nThreads,
+    double minPairWeight, double *info)
+{
+    operateDistributionsAndResampleInto(DistOps(op), centers1, weights1, n1, centers2, weights2, n2,
+                                        resCenters, resWeights, newN, nThreads, 100000, minPairWeight, info);
+}
+
+void undis_operateDistributionsOntoCenters(int op,
+    const double *centers1, const double *weights1, size_t n1,
+    const double *centers2, const double *weights2, size_t n2,
+    const double *resCenters, double *resWeights, unsigned newN, unsigned nThreads,
+    double minPairWeight, double *info)
+{
+    operateDistributionsOntoCentersInto(DistOps(op), centers1, weights1, n1, centers2, weights2, n2,
+                                        resCenters, resWeights, newN, nThreads, 100000, minPairWeight, info);
+}
+
+void undis_resampleDistributionOntoCenters(const double *centers, const double *weights, size_t n,
+    const double *newCenters, double *newWeights, unsigned newN, double *info)
+{
+    resampleDistributionOntoCentersInto(centers, weights, n, newCenters, newWeights, newN, info);
+}
+
+// the grid version for double and float weights, resGrid gets the first center and the spacing
+void undis_operateGridDistributionsAndResample(int op,
+    double left1, double delta1, const double *weights1, size_t n1,
+    double left2, double delta2, const double *weights2, size_t n2,
+    double *resGrid, double *resWeights, unsigned newN, unsigned nThreads,
+    double minPairWeight, double *info)
+{
+    operateGridDistributionsAndResampleInto(DistOps(op), left1, delta1, weights1, n1, left2, delta2, weights2, n2,
+                                            resGrid[0], resGrid[1], resWeights, newN, nThreads, 100000,
+                                            minPairWeight, info);
+}
+
+void undis_operateGridDistributionsAndResampleFloat(int op,
+    double left1, double delta1, const float *weights1, size_t n1,
+    double left2, double delta2, const float *weights2, size_t n2,
+    double *resGrid, double *resWeights, unsigned newN, unsigned nThreads,
+    double minPairWeight, double *info)
+{
+    operateGridDistributionsAndResampleInto(DistOps(op), left1, delta1, weights1, n1, left2, delta2, weights2, n2,
+                                            resGrid[0], resGrid[1], resWeights, newN, nThreads, 100000,
+                                            minPairWeight, info);
+}
+
+void undis_convolveDistributionsAndResample(
+    const double *centers1, const double *weights1, size_t n1,
+    const double *centers2, const double *weights2, size_t n2,
+    double *resCenters, double *resWeights, unsigned newN, unsigned oversample, double *info)
+{
+    convolveDistributionsAndResampleInto(centers1, weights1, n1, centers2, weights2, n2,
+                                         resCenters, resWeights, newN, oversample, info);
+}
+
+// returns 0 on success, 1 if the arguments are invalid (the c++ exception can not cross the C interface)
+int undis_logConvolveDistributionsAndResample(int op,
+    const double *centers1, const double *weights1, size_t n1,
+    const double *centers2, const double *weights2, size_t n2,
+    double *resCenters, double *resWeights, unsigned newN, unsigned oversample, unsigned maxGridN,
+    double *info)
+{
+    try
+    {
+        logConvolveDistributionsAndResampleInto(DistOps(op), centers1, weights1, n1, centers2, weights2, n2,
+                                                resCenters, resWeights, newN, oversample, maxGridN, info);
+    }
+    catch(const std::invalid_argument &)
+    {
+        return 1;
+    }
+    return 0;
+}
+
+// returns 0 on success, 1 if the arguments are invalid, 2 if the grid would exceed maxGridN
+int undis_convolveManyDistributionsAndResample(int op,
+    const double *centers, const double *weights, const size_t *offsets, const unsigned *powers, size_t k,
+    double *resCenters, double *resWeights, unsigned newN, unsigned oversample, unsigned maxGridN,
+    double *info)
+{
+    try
+    {
+        convolveManyDistributionsAndResampleInto(DistOps(op), centers, weights, offsets, powers, k,
+                                                 resCenters, resWeights, newN, oversample, maxGridN, info);
+    }
+    catch(const std::invalid_argument &)
+    {
+        return 1;
+    }
+    catch(const std::length_error &)
+    {
+        return 2;
+    }
+    return 0;
+}
+
+}
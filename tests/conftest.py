@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+common fixtures of the tests, run them with "python -m pytest tests" from the repository root
+
+License: LGPL-3.0-or-later
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import uncertainDistribution as undis
+
+# the backends that can run here, lib needs "python buildLib.py", cpp needs cppyy
+availableBackends = ["numpy"]+(["cpp"] if undis.haveCppyy else [])+(["lib"] if os.path.exists(undis.libPath) else [])
+
+@pytest.fixture(autouse=True)
+def defaultOptions():
+    # every test starts with the default options and an empty cache
+    saved = dict(undis.options)
+    undis.clearCache()
+    yield
+    undis.options.clear()
+    undis.options.update(saved)
+    undis.clearCache()
+
+def kernelCalls(prof):
+    # number of core routine calls in the records of a profiler, their names are "backend.routine"
+    return sum(1 for rec in prof.records if "." in rec["name"])
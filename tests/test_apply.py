@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+tests of unDist.apply
+
+License: LGPL-3.0-or-later
+"""
+import numpy as np
+import pytest
+
+import uncertainDistribution as undis
+from uncertainDistribution import unDist as undi
+from conftest import availableBackends
+
+@pytest.mark.parametrize("backend", availableBackends)
+def test_applyMatchesOperators(backend):
+    undis.setOptions(backend=backend)
+    a = undi("normal", mean=2, stdDev=0.1, maxSigma=5, samples=100)
+    b = undi("rect", leftPos=1, rightPos=3, samples=100)
+    applied = undi.apply(lambda x, y: x*y+x, a, b, samples=200)
+    assert np.allclose(applied.getMeanStd(), (a*b+a).getMeanStd(), rtol=2e-2)
+
+@pytest.mark.parametrize("backend", availableBackends)
+def test_applyConstantFunction(backend):
+    undis.setOptions(backend=backend)
+    a = undi("normal", mean=2, stdDev=0.1, maxSigma=5, samples=50)
+    b = undi("tri", leftPos=0, centerPos=1, rightPos=3, samples=50)
+    const = undi.apply(lambda x, y: 0*x+3.0, a, b)
+    # like a rect distribution of zero width
+    assert np.all(const.centers==3.0)
+    assert np.isclose(np.sum(const.weights), 1)
+    mean, std = const.getMeanStd()
+    assert mean==pytest.approx(3.0) and std==pytest.approx(0, abs=1e-12)
+    assert np.allclose(const.quantiles([0.05, 0.5, 0.95]), 3.0)
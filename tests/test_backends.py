@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+the cpp and lib backends have to give the same results as the numpy backend,
+and the fft/log engines the same as the pair engine within their resolution
+
+License: LGPL-3.0-or-later
+"""
+import numpy as np
+import pytest
+
+import uncertainDistribution as undis
+from uncertainDistribution import unDist as undi
+from conftest import availableBackends
+
+def inputs():
+    # strictly positive, so that the log engine can be used as well
+    return (undi("normal", mean=10, stdDev=0.5, maxSigma=5, samples=120),
+            undi("rect", leftPos=2, rightPos=3, samples=90),
+            undi("tri", leftPos=1, centerPos=1.2, rightPos=2, samples=100))
+
+def results(backend, calculate):
+    undis.setOptions(backend=backend)
+    undis.clearCache()
+    return calculate(*inputs())
+
+def assertSame(res, ref):
+    assert len(res.centers)==len(ref.centers)
+    assert np.allclose(res.centers, ref.centers, rtol=1e-12, atol=1e-12)
+    assert np.allclose(res.weights, ref.weights, rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize("backend", availableBackends)
+@pytest.mark.parametrize("grid", ["uniform", "adaptive"])
+def test_constructors(backend, grid):
+    undis.setOptions(grid=grid)
+    refs = results("numpy", lambda *dists: dists)
+    for res, ref in zip(results(backend, lambda *dists: dists), refs):
+        assertSame(res, ref)
+
+@pytest.mark.parametrize("backend", availableBackends)
+@pytest.mark.parametrize("engine", ["pair", "fft", "log"])
+@pytest.mark.parametrize("op", ["add", "mul", "div"])
+def test_operations(backend, engine, op):
+    calculate = lambda a, b, c: getattr(getattr(a, op)(b, engine=engine), op)(c, engine=engine)
+    assertSame(results(backend, calculate), results("numpy", calculate))
+
+@pytest.mark.parametrize("backend", availableBackends)
+@pytest.mark.parametrize("engine", ["pair", "fft"])
+def test_reductions(backend, engine):
+    for calculate in (lambda a, b, c: undi.sum([a, b, c, b], engine=engine),
+                      lambda a, b, c: undi.prod([a, b, c], engine=engine),
+                      lambda a, b, c: b.repeatSum(5, engine=engine)):
+        assertSame(results(backend, calculate), results("numpy", calculate))
+
+@pytest.mark.parametrize("backend", availableBackends)
+@pytest.mark.parametrize("op", ["add", "mul", "div"])
+def test_enginesAgree(backend, op):
+    # the fft engines calculate on an oversampled grid, their quantiles agree with the pair engine
+    # within about one result bin
+    pair = results(backend, lambda a, b, c: getattr(a, op)(b, engine="pair"))
+    fft = results(backend, lambda a, b, c: getattr(a, op)(b, engine="fft"))
+    binWidth = (pair.centers[-1]-pair.centers[0])/(len(pair.centers)-1)
+    q = [0.025, 0.5, 0.975]
+    assert np.allclose(fft.quantiles(q, interpolate=True), pair.quantiles(q, interpolate=True), rtol=0, atol=binWidth)
+    assert np.allclose(fft.getMeanStd(), pair.getMeanStd(), rtol=1e-2)
+
+@pytest.mark.parametrize("backend", availableBackends)
+def test_analyticMoments(backend):
+    res = results(backend, lambda a, b, c: undi.sum([a, 2*b, c])+1)
+    mean, stdDev = res.analyticMeanStd()
+    assert mean==pytest.approx(10+5+(1+1.2+2)/3+1, rel=1e-12)
+    assert np.allclose(res.getMeanStd(), (mean, stdDev), rtol=2e-2)
+
+def test_saveLoadKeepsAnalyticMoments(tmp_path):
+    res = results("numpy", lambda a, b, c: a*b+c)
+    res.save(str(tmp_path/"res.undist"))
+    loaded = undi.load(str(tmp_path/"res.undist"))
+    assert np.array_equal(loaded.centers, res.centers) and np.array_equal(loaded.weights, res.weights)
+    assert loaded.analyticMeanStd()==res.analyticMeanStd()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+tests of the memory mapped results, see options["memmapDir"]
+
+License: LGPL-3.0-or-later
+"""
+import pytest
+
+import uncertainDistribution as undis
+from uncertainDistribution import unDist as undi, _isMapped
+from conftest import availableBackends
+
+@pytest.fixture
+def mapped(tmp_path):
+    undis.setOptions(memmapDir=str(tmp_path), memmapMinBins=100, cache=False)
+
+@pytest.mark.parametrize("backend", availableBackends)
+def test_operationResultsAreMapped(mapped, backend):
+    undis.setOptions(backend=backend, compact=True)
+    rect = undi("rect", leftPos=0, rightPos=1, samples=200)
+    normal = undi("normal", mean=1, stdDev=0.1, maxSigma=5, samples=200)
+    for res in (rect+normal, rect*normal, rect.add(normal, engine="fft"), normal.mul(normal, engine="log")):
+        assert _isMapped(res.weights)
+    # compact distributions on an equally spaced grid use the grid routines
+    assert rect._grid is not None and normal._grid is not None
+
+@pytest.mark.parametrize("backend", availableBackends)
+@pytest.mark.parametrize("grid", ["uniform", "adaptive"])
+def test_constructorsAndReductionsAreMapped(mapped, backend, grid):
+    undis.setOptions(backend=backend, grid=grid)
+    rect = undi("rect", leftPos=0, rightPos=1, samples=200)
+    normal = undi("normal", mean=1, stdDev=0.1, maxSigma=5, samples=200)
+    tri = undi("tri", leftPos=0, centerPos=1, rightPos=3, samples=200)
+    for res in (rect, normal, tri, undi.sum([rect, normal, tri], engine="fft"), 
+                rect.repeatSum(5, engine="fft"), undi.prod([normal, normal+1, normal+2], engine="fft")):
+        assert _isMapped(res.weights)
+
+def test_tableIsMapped(mapped):
+    table = undi.fromTable([dict(type="rect", leftPos=0, rightPos=1, samples=300),
+                            dict(type="normal", mean=0, stdDev=1, maxSigma=4, samples=300)])
+    assert _isMapped(table[0].weights) and _isMapped(table[1].centers)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+tests of the lazy expressions with parameters, sweep() and distBatch
+
+License: LGPL-3.0-or-later
+"""
+import numpy as np
+import pytest
+
+import uncertainDistribution as undis
+from uncertainDistribution import unDist as undi, parameter, sweep, profiler
+from conftest import kernelCalls
+
+@pytest.mark.parametrize("cache", [True, False])
+def test_sweepReusesParameterIndependentProduct(cache):
+    undis.setOptions(cache=cache)
+    DNI = parameter("DNI")
+    zeroOffset = undi("rect", leftPos=-3, rightPos=3, samples=200)
+    s1, s2, s3 = [undi("rect", leftPos=1-p, rightPos=1+p, samples=200) for p in (0.01, 0.02, 0.005)]
+    values = np.linspace(100, 1000, 10)
+    with profiler() as prof:
+        batch = sweep((DNI+zeroOffset)*s1*s2*s3, DNI=values)
+    # s1*s2*s3 once (two pair operations), then one multiplication per value
+    assert kernelCalls(prof)==2+len(values)
+    
+    direct = (values[4]+zeroOffset)*s1*s2*s3
+    assert np.allclose(batch[4].getMeanStd(), direct.getMeanStd(), rtol=1e-3)
+
+def test_batchQuantilesOfDescendingRows():
+    k = parameter("k")
+    tri = undi("tri", leftPos=0, centerPos=1, rightPos=4, samples=300)
+    batch = sweep(tri.lazy()*k, k=[-2., 1., 3.])
+    vals = [0.1, 0.5, 0.9]
+    expected = np.array([batch[i].quantiles(vals) for i in range(len(batch))])
+    assert np.array_equal(batch.quantiles(vals), expected)
+    assert np.array_equal(batch.quantiles(0.5), expected[:, 1])
+    # the negative scale gives descending centers, the quantiles still ascend
+    assert np.all(np.diff(batch.quantiles(vals)[0])>0)
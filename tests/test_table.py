@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+tests of unDist.fromTable
+
+License: LGPL-3.0-or-later
+"""
+import numpy as np
+import pytest
+
+import uncertainDistribution as undis
+from uncertainDistribution import unDist as undi
+
+rows = [dict(type="normal", mean=1, stdDev=0.2, maxSigma=5, samples=101),
+        dict(type="rect", leftPos=-1, rightPos=2, samples=50),
+        dict(type="tri", leftPos=0, centerPos=0.3, rightPos=1, samples=77),
+        dict(type="tri", leftPos=-2, centerPos=1, rightPos=1.5, samples=101)]
+
+def test_tableMatchesConstructors():
+    undis.setOptions(backend="numpy")
+    table = undi.fromTable(rows)
+    for i, row in enumerate(rows):
+        single = undi(row["type"], **{k: v for k, v in row.items() if k!="type"})
+        assert np.allclose(table[i].centers, single.centers, rtol=0, atol=1e-12)
+        assert np.allclose(table[i].weights, single.weights, rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize("row", [dict(type="tri", leftPos=0, centerPos=0, rightPos=1, samples=10),
+                                 dict(type="tri", leftPos=0, centerPos=1, rightPos=1, samples=10),
+                                 dict(type="tri", leftPos=0, centerPos=2, rightPos=1, samples=10),
+                                 dict(type="rect", leftPos=1, rightPos=0, samples=10)])
+def test_tableRejectsInvalidRows(row):
+    with pytest.raises(ValueError, match="row 2"):
+        undi.fromTable(rows[:2]+[row])
@@ -61,31 +61,1053 @@ Usage:
 
 core functionally is written in c++ for optimization
 and automatically wrapped to python from "bkUncDist.hpp" using cppyy "https://cppyy.readthedocs.io/en/latest/"
+cppyy compiles the header when it is first used, which takes about a second.
+Alternatively "python buildLib.py" compiles it once into a shared library, that is loaded with ctypes.
+Without a compiler, the numpy implementation in bkUncDistNumpy.py is used.
 
 License: LGPL-3.0-or-later
 
 @author: Bkubicek
 """
 import numpy as np
-import cppyy
-import copy
+import os
+import sys
+import ctypes
+import importlib.util
+import threading
+import heapq
+import hashlib
+import time
+import json
+import struct
+import mmap
+import functools
+import itertools
+import math
+import warnings
+import pickle
+import tempfile
+import io
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory, resource_tracker
+from collections import OrderedDict
 
-try:
-    cppyy.add_include_path('./include')
-except:
-    cppyy.add_include_path('../include')
+import bkUncDistNumpy
+from bkUncDistNumpy import OpAdd, OpMul, OpDiv, InfoPrunedMass, InfoClampedMass, InfoEdgeMass, InfoSize
+
+# the c++ header and the prebuilt library are found relative to this file, not the working directory
+includeDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "include")
+libPath = os.path.join(includeDir, "libbkUncDist.dll" if sys.platform=="win32" else "libbkUncDist.so")
+# version of the C interface of bkUncDistLib.cpp, that libBackend is written for, see undis_abiVersion
+libAbiVersion = 1
+
+# cppyy is optional, and only imported when the cpp backend is used for the first time
+# as the JIT compilation of the header takes about a second
+cppyy = None
+haveCppyy = importlib.util.find_spec("cppyy") is not None
+
+# the first use of a backend might happen in several threads at the same time
+_loadLock = threading.Lock()
+
+def _loadCppyy():
+    # import cppyy and compile the header, only done once
+    global cppyy
+    if cppyy is not None:
+        return cppyy.gbl
+    with _loadLock:
+        if cppyy is None:
+            _includeHeader()
+    return cppyy.gbl
+
+def _includeHeader():
+    global cppyy
+    if not haveCppyy:
+        raise Exception("The cpp backend needs cppyy, use the lib or numpy backend instead")
+    import cppyy as _cppyy
+    
+    _cppyy.add_include_path(includeDir)
+    _cppyy.include("bkUncDist.hpp")
+    
+    # the c++ routines do not touch python objects, so other python threads can run meanwhile
+    for name in ("getNormal", "getRect", "getTri", "resampleDistribution", 
+                 "operateDistributionsAndResample", "convolveDistributionsAndResample", 
+                 "logConvolveDistributionsAndResample"):
+        getattr(_cppyy.gbl, name).__release_gil__ = True
+        getattr(_cppyy.gbl, name+"Into").__release_gil__ = True
+    _cppyy.gbl.operateDistributionsAndResampleParallel.__release_gil__ = True
+    _cppyy.gbl.convolveManyDistributionsAndResampleInto.__release_gil__ = True
+    
+    cppyy = _cppyy
+
+# the prebuilt library, loaded with ctypes when the lib backend is used for the first time
+_libCore = None
+
+def _loadLib():
+    # load the library from buildLib.py, only done once
+    if _libCore is not None:
+        return _libCore
+    with _loadLock:
+        if _libCore is None:
+            _openLib()
+    return _libCore
+
+# None: not checked yet, otherwise whether the library has libAbiVersion
+_libMatches = None
+
+def _checkLib():
+    # a library built from an older bkUncDistLib.cpp would be called with wrong arguments,
+    # so it is only used if its version matches, otherwise the cpp or numpy backend is used with a warning
+    global _libMatches
+    if _libMatches is None:
+        try:
+            version = ctypes.CDLL(libPath).undis_abiVersion()
+        except AttributeError:
+            # built before the version was exported
+            version = 0
+        _libMatches = version==libAbiVersion
+        if not _libMatches:
+            warnings.warn("%s has the interface version %i instead of %i, it is not used, "
+                          "rebuild it with 'python buildLib.py'"%(libPath, version, libAbiVersion))
+    return _libMatches
+
+def _openLib():
+    # load the library and declare the argument types
+    global _libCore
+    if not os.path.exists(libPath):
+        raise Exception("The lib backend needs %s, build it with 'python buildLib.py'"%libPath)
+    if not _checkLib():
+        raise Exception("%s was built from another version, rebuild it with 'python buildLib.py'"%libPath)
+    lib = ctypes.CDLL(libPath)
+    
+    d, u, i, n, p = ctypes.c_double, ctypes.c_uint, ctypes.c_int, ctypes.c_size_t, ctypes.c_void_p
+    lib.undis_getNormal.argtypes = [d, d, d, u, p, p]
+    lib.undis_getTri.argtypes = [d, d, d, u, p, p]
+    lib.undis_getRect.argtypes = [d, d, u, p, p]
+    lib.undis_resampleDistribution.argtypes = [p, p, n, p, p, u]
+    lib.undis_operateDistributionsAndResample.argtypes = [i, p, p, n, p, p, n, p, p, u, u, d, p]
+    lib.undis_convolveDistributionsAndResample.argtypes = [p, p, n, p, p, n, p, p, u, u, p]
+    for name in ("undis_operateGridDistributionsAndResample", "undis_operateGridDistributionsAndResampleFloat"):
+        getattr(lib, name).argtypes = [i, d, d, p, n, d, d, p, n, p, p, u, u, d, p]
+        getattr(lib, name).restype = None
+    lib.undis_operateDistributionsOntoCenters.argtypes = [i, p, p, n, p, p, n, p, p, u, u, d, p]
+    lib.undis_resampleDistributionOntoCenters.argtypes = [p, p, n, p, p, u, p]
+    lib.undis_logConvolveDistributionsAndResample.argtypes = [i, p, p, n, p, p, n, p, p, u, u, u, p]
+    lib.undis_convolveManyDistributionsAndResample.argtypes = [i, p, p, p, p, n, p, p, u, u, u, p]
+    for name in ("undis_getNormal", "undis_getTri", "undis_getRect", "undis_resampleDistribution",
+                 "undis_operateDistributionsAndResample", "undis_convolveDistributionsAndResample",
+                 "undis_operateDistributionsOntoCenters", "undis_resampleDistributionOntoCenters"):
+        getattr(lib, name).restype = None
+    lib.undis_logConvolveDistributionsAndResample.restype = i
+    lib.undis_convolveManyDistributionsAndResample.restype = i
+    
+    _libCore = lib
+
+
+class cppBackend:
+    """
+    the c++ core from bkUncDist.hpp, wrapped with cppyy
+    takes and returns numpy arrays, like the functions in bkUncDistNumpy
+    the "...Into" c++ routines are used, which read and write the numpy memory directly,
+    so no std::vector copies are made
+    the routines combining two distributions return centers, weights and the info array (see DistInfo),
+    with out=(resCenters, resWeights) they write into these float64 arrays instead of new ones
+    """
+    name = "cpp"
+    
+    def getNormal(self, mean, stdDev, maxSigma, N):
+        centers, weights = _resultArrays(N, None)
+        _loadCppyy().getNormalInto(mean, stdDev, maxSigma, N, centers, weights)
+        return centers, weights
+    
+    def getRect(self, leftPos, rightPos, N):
+        centers, weights = _resultArrays(N+2, None)
+        _loadCppyy().getRectInto(leftPos, rightPos, N, centers, weights)
+        return centers, weights
+    
+    def getTri(self, leftPos, centerPos, rightPos, N):
+        centers, weights = _resultArrays(N, None)
+        _loadCppyy().getTriInto(leftPos, centerPos, rightPos, N, centers, weights)
+        return centers, weights
+    
+    def resampleDistribution(self, centers, weights, newN):
+        centers, weights = _contiguous(centers), _contiguous(weights)
+        newCenters, newWeights = _resultArrays(newN, None)
+        _loadCppyy().resampleDistributionInto(centers, weights, len(centers), newCenters, newWeights, newN)
+        return newCenters, newWeights
+    
+    def operateDistributionsAndResample(self, op, centers1, weights1, centers2, weights2, newN, out=None):
+        args = _contiguous(centers1), _contiguous(weights1), len(centers1), \
+               _contiguous(centers2), _contiguous(weights2), len(centers2)
+        (resCenters, resWeights), info = _resultArrays(newN, out), np.zeros(InfoSize)
+        _loadCppyy().operateDistributionsAndResampleInto(op, *args, resCenters, resWeights, newN, 
+                                                         options["threads"], 100000, 
+                                                         options["minPairWeight"], info)
+        return resCenters, resWeights, info
+    
+    def operateDistributionsOntoCenters(self, op, centers1, weights1, centers2, weights2, resCenters, out=None):
+        args = _contiguous(centers1), _contiguous(weights1), len(centers1), \
+               _contiguous(centers2), _contiguous(weights2), len(centers2)
+        resCenters, (centers, resWeights), info = _contiguous(resCenters), \
+                _resultArrays(len(resCenters), out), np.zeros(InfoSize)
+        _loadCppyy().operateDistributionsOntoCentersInto(op, *args, resCenters, resWeights, len(resCenters), 
+                                                         options["threads"], 100000, 
+                                                         options["minPairWeight"], info)
+        return _copyInto((centers, None), (resCenters, resWeights)) + (info,)
+    
+    def resampleDistributionOntoCenters(self, centers, weights, newCenters, out=None):
+        centers, weights, newCenters = _contiguous(centers), _contiguous(weights), _contiguous(newCenters)
+        (resCenters, newWeights), info = _resultArrays(len(newCenters), out), np.zeros(InfoSize)
+        _loadCppyy().resampleDistributionOntoCentersInto(centers, weights, len(centers), 
+                                                         newCenters, newWeights, len(newCenters), info)
+        return _copyInto((resCenters, None), (newCenters, newWeights)) + (info,)
+    
+    def operateGridDistributionsAndResample(self, op, grid1, weights1, grid2, weights2, newN, out=None):
+        weightType = "float" if weights1.dtype==np.float32 and weights2.dtype==np.float32 else "double"
+        weights1, weights2 = _contiguous(weights1, weightType), _contiguous(weights2, weightType)
+        resLeft, resDelta = ctypes.c_double(), ctypes.c_double()
+        resWeights, info = _resultArrays(newN, out, centers=False)[1], np.zeros(InfoSize)
+        _loadCppyy().operateGridDistributionsAndResampleInto[weightType](op, 
+                grid1[0], grid1[1], weights1, len(weights1), grid2[0], grid2[1], weights2, len(weights2),
+                resLeft, resDelta, resWeights, newN, options["threads"], 100000, options["minPairWeight"], info)
+        return np.array([resLeft.value, resDelta.value]), resWeights, info
+    
+    def convolveDistributionsAndResample(self, centers1, weights1, centers2, weights2, newN, out=None):
+        args = _contiguous(centers1), _contiguous(weights1), len(centers1), \
+               _contiguous(centers2), _contiguous(weights2), len(centers2)
+        (resCenters, resWeights), info = _resultArrays(newN, out), np.zeros(InfoSize)
+        _loadCppyy().convolveDistributionsAndResampleInto(*args, resCenters, resWeights, newN, 
+                                                          options["oversample"], info)
+        return resCenters, resWeights, info
+    
+    def logConvolveDistributionsAndResample(self, op, centers1, weights1, centers2, weights2, newN, out=None):
+        args = _contiguous(centers1), _contiguous(weights1), len(centers1), \
+               _contiguous(centers2), _contiguous(weights2), len(centers2)
+        (resCenters, resWeights), info = _resultArrays(newN, out), np.zeros(InfoSize)
+        _loadCppyy().logConvolveDistributionsAndResampleInto(op, *args, resCenters, resWeights, newN, 
+                                                             options["oversample"], options["maxLogGrid"], info)
+        return resCenters, resWeights, info
+    
+    def convolveManyDistributionsAndResample(self, op, centersList, weightsList, powers, newN):
+        centers, weights, offsets, powers = _concatenate(centersList, weightsList, powers)
+        (resCenters, resWeights), info = _resultArrays(newN, None), np.zeros(InfoSize)
+        _loadCppyy().convolveManyDistributionsAndResampleInto(op, centers, weights, offsets, powers, 
+                len(powers), resCenters, resWeights, newN, options["oversample"], options["maxLogGrid"], info)
+        return resCenters, resWeights, info
+
+
+class libBackend:
+    """
+    the c++ core from bkUncDist.hpp, compiled ahead of time by buildLib.py and loaded with ctypes
+    same results as the cpp backend, but starts in milliseconds, and needs no cppyy
+    ctypes releases the GIL during the calls
+    out=(resCenters, resWeights) works like for the cpp backend
+    """
+    name = "lib"
+    
+    def getNormal(self, mean, stdDev, maxSigma, N):
+        centers, weights = _resultArrays(N, None)
+        _loadLib().undis_getNormal(mean, stdDev, maxSigma, N, _ptr(centers), _ptr(weights))
+        return centers, weights
+    
+    def getRect(self, leftPos, rightPos, N):
+        centers, weights = _resultArrays(N+2, None)
+        _loadLib().undis_getRect(leftPos, rightPos, N, _ptr(centers), _ptr(weights))
+        return centers, weights
+    
+    def getTri(self, leftPos, centerPos, rightPos, N):
+        centers, weights = _resultArrays(N, None)
+        _loadLib().undis_getTri(leftPos, centerPos, rightPos, N, _ptr(centers), _ptr(weights))
+        return centers, weights
+    
+    def resampleDistribution(self, centers, weights, newN):
+        centers, weights = _contiguous(centers), _contiguous(weights)
+        newCenters, newWeights = _resultArrays(newN, None)
+        _loadLib().undis_resampleDistribution(_ptr(centers), _ptr(weights), len(centers), 
+                                              _ptr(newCenters), _ptr(newWeights), newN)
+        return newCenters, newWeights
+    
+    def _args(self, centers1, weights1, centers2, weights2, newN, out):
+        # the arrays have to be kept alive during the call, hence they are returned as well
+        arrays = [_contiguous(centers1), _contiguous(weights1), 
+                  _contiguous(centers2), _contiguous(weights2), *_resultArrays(newN, out)]
+        c1, w1, c2, w2, resC, resW = [_ptr(a) for a in arrays]
+        return arrays, (c1, w1, len(centers1), c2, w2, len(centers2), resC, resW, newN)
+    
+    def operateDistributionsAndResample(self, op, centers1, weights1, centers2, weights2, newN, out=None):
+        arrays, args = self._args(centers1, weights1, centers2, weights2, newN, out)
+        info = np.zeros(InfoSize)
+        _loadLib().undis_operateDistributionsAndResample(op, *args, options["threads"], 
+                                                         options["minPairWeight"], _ptr(info))
+        return arrays[4], arrays[5], info
+    
+    def operateDistributionsOntoCenters(self, op, centers1, weights1, centers2, weights2, resCenters, out=None):
+        resCenters = _contiguous(resCenters)
+        arrays, args = self._args(centers1, weights1, centers2, weights2, len(resCenters), out)
+        info = np.zeros(InfoSize)
+        _loadLib().undis_operateDistributionsOntoCenters(op, *args[:6], _ptr(resCenters), args[7], args[8], 
+                                                         options["threads"], options["minPairWeight"], _ptr(info))
+        return _copyInto((arrays[4], None), (resCenters, arrays[5])) + (info,)
+    
+    def resampleDistributionOntoCenters(self, centers, weights, newCenters, out=None):
+        centers, weights, newCenters = _contiguous(centers), _contiguous(weights), _contiguous(newCenters)
+        (resCenters, newWeights), info = _resultArrays(len(newCenters), out), np.zeros(InfoSize)
+        _loadLib().undis_resampleDistributionOntoCenters(_ptr(centers), _ptr(weights), len(centers), 
+                _ptr(newCenters), _ptr(newWeights), len(newCenters), _ptr(info))
+        return _copyInto((resCenters, None), (newCenters, newWeights)) + (info,)
+    
+    def operateGridDistributionsAndResample(self, op, grid1, weights1, grid2, weights2, newN, out=None):
+        if weights1.dtype==np.float32 and weights2.dtype==np.float32:
+            weightType, function = "float", _loadLib().undis_operateGridDistributionsAndResampleFloat
+        else:
+            weightType, function = "double", _loadLib().undis_operateGridDistributionsAndResample
+        weights1, weights2 = _contiguous(weights1, weightType), _contiguous(weights2, weightType)
+        resGrid, resWeights, info = np.empty(2), _resultArrays(newN, out, centers=False)[1], np.zeros(InfoSize)
+        function(op, grid1[0], grid1[1], _ptr(weights1), len(weights1), grid2[0], grid2[1], _ptr(weights2), 
+                 len(weights2), _ptr(resGrid), _ptr(resWeights), newN, options["threads"], 
+                 options["minPairWeight"], _ptr(info))
+        return resGrid, resWeights, info
+    
+    def convolveDistributionsAndResample(self, centers1, weights1, centers2, weights2, newN, out=None):
+        arrays, args = self._args(centers1, weights1, centers2, weights2, newN, out)
+        info = np.zeros(InfoSize)
+        _loadLib().undis_convolveDistributionsAndResample(*args, options["oversample"], _ptr(info))
+        return arrays[4], arrays[5], info
+    
+    def logConvolveDistributionsAndResample(self, op, centers1, weights1, centers2, weights2, newN, out=None):
+        arrays, args = self._args(centers1, weights1, centers2, weights2, newN, out)
+        info = np.zeros(InfoSize)
+        if _loadLib().undis_logConvolveDistributionsAndResample(op, *args, 
+                            options["oversample"], options["maxLogGrid"], _ptr(info)):
+            raise Exception("logConvolveDistributionsAndResample needs strictly positive centers")
+        return arrays[4], arrays[5], info
+    
+    def convolveManyDistributionsAndResample(self, op, centersList, weightsList, powers, newN):
+        arrays = _concatenate(centersList, weightsList, powers)
+        (resCenters, resWeights), info = _resultArrays(newN, None), np.zeros(InfoSize)
+        error = _loadLib().undis_convolveManyDistributionsAndResample(op, *[_ptr(a) for a in arrays], 
+                len(powers), _ptr(resCenters), _ptr(resWeights), newN, 
+                options["oversample"], options["maxLogGrid"], _ptr(info))
+        if error==1:
+            raise Exception("convolveManyDistributionsAndResample needs strictly positive centers")
+        if error==2:
+            raise Exception("convolveManyDistributionsAndResample needs more than maxLogGrid grid points")
+        return resCenters, resWeights, info
+
+
+class numpyBackend:
+    """
+    the pure numpy implementation from bkUncDistNumpy, needs no compiler
+    with out=(resCenters, resWeights) the results are copied into these arrays
+    """
+    name = "numpy"
+    
+    def getNormal(self, mean, stdDev, maxSigma, N):
+        return _copyInto(None, bkUncDistNumpy.getNormal(mean, stdDev, maxSigma, N))
+    
+    def getRect(self, leftPos, rightPos, N):
+        return _copyInto(None, bkUncDistNumpy.getRect(leftPos, rightPos, N))
+    
+    def getTri(self, leftPos, centerPos, rightPos, N):
+        return _copyInto(None, bkUncDistNumpy.getTri(leftPos, centerPos, rightPos, N))
+    
+    def resampleDistribution(self, centers, weights, newN):
+        return _copyInto(None, bkUncDistNumpy.resampleDistribution(centers, weights, newN))
+    
+    def operateDistributionsAndResample(self, op, centers1, weights1, centers2, weights2, newN, out=None):
+        threads = options["threads"] or os.cpu_count()
+        info = np.zeros(InfoSize)
+        return _copyInto(out, bkUncDistNumpy.operateDistributionsAndResample(op, 
+                centers1, weights1, centers2, weights2, newN, options["chunkSize"], threads,
+                options["minPairWeight"], info)) + (info,)
+    
+    def operateDistributionsOntoCenters(self, op, centers1, weights1, centers2, weights2, resCenters, out=None):
+        info = np.zeros(InfoSize)
+        resWeights = bkUncDistNumpy.operateDistributionsOntoCenters(op, centers1, weights1, centers2, weights2, 
+                resCenters, options["chunkSize"], options["minPairWeight"], info)
+        return _copyInto(out, (np.array(resCenters, dtype=float), resWeights)) + (info,)
+    
+    def resampleDistributionOntoCenters(self, centers, weights, newCenters, out=None):
+        info = np.zeros(InfoSize)
+        newWeights = bkUncDistNumpy.resampleDistributionOntoCenters(centers, weights, newCenters, info)
+        return _copyInto(out, (np.array(newCenters, dtype=float), newWeights)) + (info,)
+    
+    def operateGridDistributionsAndResample(self, op, grid1, weights1, grid2, weights2, newN, out=None):
+        threads = options["threads"] or os.cpu_count()
+        info = np.zeros(InfoSize)
+        resLeft, resDelta, resWeights = bkUncDistNumpy.operateGridDistributionsAndResample(op, 
+                grid1[0], grid1[1], weights1, grid2[0], grid2[1], weights2, newN, 
+                options["chunkSize"], threads, options["minPairWeight"], info)
+        return np.array([resLeft, resDelta]), _copyInto(out, (None, resWeights))[1], info
+    
+    def convolveDistributionsAndResample(self, centers1, weights1, centers2, weights2, newN, out=None):
+        info = np.zeros(InfoSize)
+        return _copyInto(out, bkUncDistNumpy.convolveDistributionsAndResample(
+                centers1, weights1, centers2, weights2, newN, options["oversample"], info)) + (info,)
+    
+    def logConvolveDistributionsAndResample(self, op, centers1, weights1, centers2, weights2, newN, out=None):
+        info = np.zeros(InfoSize)
+        return _copyInto(out, bkUncDistNumpy.logConvolveDistributionsAndResample(op, 
+                centers1, weights1, centers2, weights2, newN, 
+                options["oversample"], options["maxLogGrid"], info)) + (info,)
+    
+    def convolveManyDistributionsAndResample(self, op, centersList, weightsList, powers, newN):
+        info = np.zeros(InfoSize)
+        return _copyInto(None, bkUncDistNumpy.convolveManyDistributionsAndResample(op, 
+                centersList, weightsList, powers, newN, 
+                options["oversample"], options["maxLogGrid"], info)) + (info,)
+
+
+def _contiguous(a, dtype="double"):
+    # the c++ routines need contiguous double (or float) arrays, this only copies if necessary
+    res = np.ascontiguousarray(a, dtype=np.float32 if dtype=="float" else np.float64)
+    if _profiling() and not np.may_share_memory(res, a):
+        _profileState.copied = getattr(_profileState, "copied", 0) + res.nbytes
+    return res
+
+def _resultArrays(newN, out, centers=True):
+    # the result centers and weights: new arrays, or the given ones for the in-place operations
+    # large results go into memory mapped files, see options["memmapDir"]
+    # centers=False for the grid routines, which only need the weights
+    if out is None:
+        if options["memmapDir"] is not None and newN>=options["memmapMinBins"]:
+            return _mappedArray(newN) if centers else None, _mappedArray(newN)
+        return np.empty(newN) if centers else None, np.empty(newN)
+    return out
+
+def _mappedArray(n):
+    # a float64 array of size n in a temporary file in options["memmapDir"], mapped into memory
+    # the file is removed right away, its disk space is freed with the last reference to the array
+    fd, path = tempfile.mkstemp(dir=options["memmapDir"], suffix=".undist")
+    try:
+        os.ftruncate(fd, max(n, 1)*8)
+        a = np.memmap(path, dtype=np.float64, mode="r+", shape=(n,))
+    finally:
+        os.close(fd)
+        try:
+            os.unlink(path)
+        except OSError:
+            # windows cannot remove a mapped file, it stays in memmapDir
+            pass
+    return a
+
+def _isMapped(a):
+    # True if the array is a view of a memory mapped file (np.memmap, or np.frombuffer of an mmap)
+    while a is not None:
+        if isinstance(a, (np.memmap, mmap.mmap)):
+            return True
+        a = a.obj if isinstance(a, memoryview) else getattr(a, "base", None)
+    return False
+
+def _copyInto(out, result):
+    # for the numpy backend, which allocates its results: copy (centers, weights) into out
+    # large results are moved into memory mapped files, like the ones of the c++ backends
+    if out is None and options["memmapDir"] is not None and len(result[1])>=options["memmapMinBins"]:
+        out = _resultArrays(len(result[1]), None, centers=result[0] is not None)
+    if out is None:
+        return result
+    for res, target in zip(result, out):
+        if target is not None:
+            target[:] = res
+    return tuple(res if target is None else target for res, target in zip(result, out))
+
+def _ptr(a):
+    # address of a numpy array for ctypes
+    return a.ctypes.data
+
+def _concatenate(centersList, weightsList, powers):
+    # the c++ routines for many distributions take them as one array with offsets
+    offsets = np.cumsum([0]+[len(c) for c in centersList]).astype(np.uintp)
+    return (_contiguous(np.concatenate(centersList)), _contiguous(np.concatenate(weightsList)), 
+            offsets, np.asarray(powers, dtype=np.uintc))
+
+backends = {"cpp": cppBackend(), "lib": libBackend(), "numpy": numpyBackend()}
+
+def getBackend(name=None):
+    """
+    get the backend object by its name, name=None gives the one selected in options["backend"]
+    """
+    if name is None:
+        name = options["backend"]
+    if name not in backends:
+        raise Exception("Unknown backend %s"%name)
+    if name=="cpp" and not haveCppyy:
+        raise Exception("The cpp backend needs cppyy, use the lib or numpy backend instead")
+    if name=="lib" and not os.path.exists(libPath):
+        raise Exception("The lib backend needs %s, build it with 'python buildLib.py'"%libPath)
+    if name=="lib" and not _checkLib():
+        name = "cpp" if haveCppyy else "numpy"
+    return backends[name]
+
+def _defaultBackend():
+    # the fastest available: prebuilt library (of the right version), cppyy, numpy
+    if os.path.exists(libPath) and _checkLib():
+        return "lib"
+    if haveCppyy:
+        return "cpp"
+    return "numpy"
+
+
+# global settings, change them with setOptions(...)
+options = {
+    # algorithm for combining two distributions:
+    #  "pair": evaluate all N*M pairs of centers (exact reference, O(N*M))
+    #  "fft":  additions are done as fft convolution on a common grid (O(N log N))
+    #          multiplications/divisions of strictly positive distributions
+    #          are done as fft convolution of the logarithms ("log" engine)
+    #          everything else falls back to "pair"
+    #  "log":  like "fft", but only for multiplications/divisions
+    #  "auto": use the fft engines with at least fftMinPairs pairs, otherwise "pair"
+    "engine": "auto",
+    "fftMinPairs": 10**7,
+    # how much finer the internal fft grid is compared to the result grid
+    # with 4 the fft result matches the pair result to about 1e-3 of the peak weight
+    # (1e-2 for the log engine) and quantiles agree within one result bin
+    "oversample": 4,
+    # upper limit of the log grid size, only reached for distributions spanning many decades
+    "maxLogGrid": 2**24,
+    # which implementation of the core routines is used:
+    #  "lib":   the c++ core, compiled ahead of time by buildLib.py
+    #  "cpp":   the c++ header compiled by cppyy at the first use
+    #  "numpy": pure numpy, no compiler needed
+    # the default is the first available of these,
+    # or can be set with the environment variable UNDIST_BACKEND
+    "backend": os.environ.get("UNDIST_BACKEND", _defaultBackend()),
+    # maximal number of pairs the numpy backend evaluates at once, bounds the temporary memory
+    "chunkSize": bkUncDistNumpy.defaultChunkSize,
+    # if True, all operations on distributions return a lazyDist, which is calculated when needed
+    "lazy": False,
+    # number of threads for the pair algorithm, 0 uses all cores
+    # 1 gives the same result as before, other values can differ by rounding
+    "threads": 1,
+    # keep the results of constructors and operations, so that repeated calculations are fast
+    # cached arrays are read-only, as they are shared between all distributions with the same result
+    "cache": True,
+    # the cache forgets the least recently used results above this size
+    "cacheMaxBytes": 256*2**20,
+    # probability mass, that may be dropped from the outer bins of the two inputs of an operation
+    # the outermost bins of each input are left out, as long as their summed weight
+    # is below massBudget/4 on each side. The result range is smaller and its bins are finer.
+    # 0 keeps everything
+    "massBudget": 0,
+    # the pair engine skips all pairs with w1*w2 below this, 0 evaluates all pairs
+    "minPairWeight": 0,
+    # if True, equally spaced distributions only keep the first center and the spacing, 
+    # the centers array is calculated when it is used. This halves the memory per distribution,
+    # and the pair engine calculates the positions from the grid instead of reading center arrays.
+    "compact": False,
+    # "float64" or "float32" for the weights arrays, float32 halves the memory again
+    # the calculations are still done in float64, only the stored results are rounded
+    "weightsDtype": "float64",
+    # automatic resolution: with a tolerance>0 the number of result bins of every operation is not
+    # min(samples1, samples2)+1, but the smallest of autoMinSamples*2^k, for which the result
+    # agrees with the result of twice as many bins within tolerance*stdDev.
+    # Compared are the interpolated toleranceQuantiles, or mean and stdDev for toleranceOn="moments".
+    # The chosen number is the samples of the result, see also resolutionReport()
+    "tolerance": 0,
+    "toleranceOn": "quantiles",
+    "toleranceQuantiles": (0.025, 0.5, 0.975),
+    "autoMinSamples": 64,
+    "autoMaxSamples": 2**14,
+    # bins of the results of constructors and binary operations:
+    #  "uniform":  equally spaced between the smallest and the largest value
+    #  "adaptive": every bin has about the same probability mass, so the bins are dense where
+    #              the mass is. adaptiveShare of the bins are spread equally spaced, so that the
+    #              tails are still resolved. Quantiles need far fewer bins for the same accuracy.
+    "grid": "uniform",
+    "adaptiveShare": 0.1,
+    # every distribution also carries its exact mean and variance, from the constructor parameters
+    # and propagated through sums, products and operations with scalars (see analyticMeanStd).
+    # With momentsOnly=True no bins are calculated at all, only getMeanStd works, in O(1) per operation.
+    # With momentsTolerance>0 a warning is given, if the mean or stdDev of the bins differ from
+    # the analytic ones by more than momentsTolerance*stdDev, 0 switches the check off
+    "momentsOnly": False,
+    "momentsTolerance": 0,
+    # out of core: results with at least memmapMinBins bins are written into memory mapped temporary
+    # files in the directory memmapDir, so they are limited by the disk instead of the memory.
+    # None keeps all results in memory. The files are deleted right away, the operating system
+    # frees the space when the distribution is deleted.
+    "memmapDir": None,
+    "memmapMinBins": 2**22,
+    # getMeanStd/quantiles/cdf/ppf of memory mapped distributions and of distributions with more than
+    # streamMinBins bins read the bins in chunks of streamChunk, instead of making arrays of the full size
+    "streamMinBins": 2**26,
+    "streamChunk": 2**20,
+}
+
+engines = ("auto", "pair", "fft", "log")
+
+def setOptions(**kwargs):
+    """
+    change global settings, e.g. setOptions(engine="pair")
+    see the options dict for the possible keys
+    """
+    for key in kwargs:
+        if key not in options:
+            raise Exception("Unknown option %s"%key)
+    if "engine" in kwargs and kwargs["engine"] not in engines:
+        raise Exception("Unknown engine %s"%kwargs["engine"])
+    if "backend" in kwargs:
+        getBackend(kwargs["backend"])
+    if "weightsDtype" in kwargs and kwargs["weightsDtype"] not in ("float64", "float32"):
+        raise Exception("weightsDtype has to be float64 or float32")
+    for key in ("massBudget", "minPairWeight"):
+        if key in kwargs and not 0<=kwargs[key]<1:
+            raise Exception("%s has to be in [0, 1)"%key)
+    if "tolerance" in kwargs and kwargs["tolerance"]<0:
+        raise Exception("tolerance has to be >=0")
+    if "momentsTolerance" in kwargs and kwargs["momentsTolerance"]<0:
+        raise Exception("momentsTolerance has to be >=0")
+    if "memmapDir" in kwargs and kwargs["memmapDir"] is not None and not os.path.isdir(kwargs["memmapDir"]):
+        raise Exception("memmapDir %s is not a directory"%kwargs["memmapDir"])
+    if "streamChunk" in kwargs and kwargs["streamChunk"]<2:
+        raise Exception("streamChunk has to be at least 2")
+    if "grid" in kwargs and kwargs["grid"] not in ("uniform", "adaptive"):
+        raise Exception("grid has to be uniform or adaptive")
+    if "adaptiveShare" in kwargs and not 0<kwargs["adaptiveShare"]<=1:
+        raise Exception("adaptiveShare has to be in (0, 1]")
+    if "toleranceOn" in kwargs and kwargs["toleranceOn"] not in ("quantiles", "moments"):
+        raise Exception("toleranceOn has to be quantiles or moments")
+    options.update(kwargs)
+    
+class lruCache:
+    """
+    remembers results (tuples of numpy arrays) by a key, up to a maximal memory size
+    if the size is exceeded, the least recently used results are forgotten
+    the stored arrays are made read-only
+    """
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+    
+    def lookup(self, key, calculate):
+        """
+        return the result for key, calls calculate() if it is not known yet
+        """
+        if not options["cache"]:
+            return calculate()
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        
+        result = calculate()
+        for a in result:
+            a.flags.writeable = False
+        size = sum(a.nbytes for a in result)
+        
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = result
+                self.bytes += size
+            while self.bytes>options["cacheMaxBytes"] and self.entries:
+                oldKey, old = self.entries.popitem(last=False)
+                self.bytes -= sum(a.nbytes for a in old)
+                self.evictions += 1
+        return result
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+    
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, 
+                "entries": len(self.entries), "bytes": self.bytes, "maxBytes": options["cacheMaxBytes"]}
+
+resultCache = lruCache()
+
+def cacheInfo():
+    """
+    statistics of the result cache: hits, misses, evictions, entries, bytes, maxBytes
+    """
+    return resultCache.info()
+
+def clearCache():
+    resultCache.clear()
+
+def _digest(a):
+    # content hash of an array, used in the cache keys
+    a = np.ascontiguousarray(a)
+    return hashlib.blake2b(a.data, digest_size=16).digest()+str(a.dtype).encode()
+
+# instrumentation: while a profiler is active or a callback is registered, the operators, 
+# the constructors and the calls of the core routines are measured, see profiler
+_profilers = []
+_profileCallbacks = []
+_profileState = threading.local()
+_profileIds = itertools.count()
+
+def _profiling():
+    return bool(_profilers or _profileCallbacks)
+
+class profiler:
+    """
+    collects a record for every instrumented call while it is active:
+        with profiler() as prof:
+            res = (disR+disT)*disN
+        print(prof.report())
+        prof.saveChromeTrace("trace.json")   # open in chrome://tracing or https://ui.perfetto.dev
+    
+    instrumented are the operators + * / (also 1/dis), sample(), unDist.sum/prod/apply, 
+    lazyDist.evaluate and the calls of the core routines of the backends.
+    A record is a dict with
+        name            e.g. "mul", "sample" or "lib.operateDistributionsAndResample"
+        id, parent, depth   the core calls are children of the operation that caused them
+        thread, start, duration   perf_counter seconds
+        sizes           number of bins of the inputs
+        resultSize      number of bins of the result
+    and for the core calls additionally
+        engine, pairs   pairs is the number of evaluated center pairs of the pair engine
+        bytesCopied     input arrays that had to be converted for the c++ routine, and the result arrays
+        prunedMass      weight of the pairs skipped because of minPairWeight
+        clampedMass     negative weight set to zero by normalizeVec (fft rounding)
+        edgeMass        weight beyond the first/last result bin, that was put into it
+    A cached result does not call the core, so the operation then has no child.
+    """
+    def __init__(self):
+        self.records = []
+        self.start = None
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        _profilers.append(self)
+        return self
+    
+    def __exit__(self, *exc):
+        _profilers.remove(self)
+    
+    def _children(self):
+        children = {}
+        for rec in self.records:
+            children.setdefault(rec["parent"], []).append(rec)
+        for recs in children.values():
+            recs.sort(key=lambda rec: rec["start"])
+        return children
+    
+    def report(self):
+        """
+        returns a text with one block per expression (every call that was not inside another 
+        instrumented call), followed by the summed time per name
+        """
+        children = self._children()
+        lines = []
+        def addLines(rec, indent):
+            line = "%-*s %10.3f ms"%(48-indent, rec["name"], rec["duration"]*1000)
+            if rec["sizes"]:
+                line += "  %s"%"x".join(str(n) for n in rec["sizes"])
+            if rec.get("resultSize"):
+                line += " -> %i"%rec["resultSize"]
+            if rec.get("pairs"):
+                line += "  %.3g pairs/s"%(rec["pairs"]/max(rec["duration"], 1e-12))
+            if "bytesCopied" in rec:
+                line += "  copied %.1f kB"%(rec["bytesCopied"]/1024)
+                line += "  lost mass: pruned %.3g clamped %.3g edge %.3g"%(
+                        rec["prunedMass"], rec["clampedMass"], rec["edgeMass"])
+            lines.append(" "*indent+line)
+            for child in children.get(rec["id"], []):
+                addLines(child, indent+2)
+        for i, rec in enumerate(children.get(None, [])):
+            lines.append("expression %i:"%(i+1))
+            addLines(rec, 2)
+        
+        lines.append("")
+        lines.append("%-48s %6s %12s"%("total per name", "calls", "time [ms]"))
+        totals = {}
+        for rec in self.records:
+            count, seconds = totals.get(rec["name"], (0, 0.))
+            totals[rec["name"]] = count+1, seconds+rec["duration"]
+        for name, (count, seconds) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append("%-48s %6i %12.3f"%(name, count, seconds*1000))
+        return "\n".join(lines)
+    
+    def chromeTrace(self):
+        """
+        the records in the Chrome trace event format, as dict
+        """
+        events = []
+        for rec in self.records:
+            args = {key: value for key, value in rec.items() 
+                    if key not in ("name", "start", "duration", "thread", "parent")}
+            events.append({"name": rec["name"], "ph": "X", "pid": os.getpid(), "tid": rec["thread"],
+                           "ts": (rec["start"]-self.start)*1e6, "dur": rec["duration"]*1e6, 
+                           "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+    
+    def saveChromeTrace(self, fileName):
+        with open(fileName, "w") as f:
+            json.dump(self.chromeTrace(), f)
+
+def addProfileCallback(func):
+    """
+    func(record) is called at the end of every instrumented call, see profiler for the record
+    """
+    _profileCallbacks.append(func)
+
+def removeProfileCallback(func):
+    _profileCallbacks.remove(func)
+
+class _span:
+    # measures one instrumented call, the record is None if nothing is profiled
+    def __init__(self, name, sizes=(), **fields):
+        self.record = None
+        if _profiling():
+            self.record = dict(name=name, id=next(_profileIds), thread=threading.get_ident(), 
+                               sizes=list(sizes), **fields)
+    
+    def __enter__(self):
+        rec = self.record
+        if rec is not None:
+            stack = _profileState.__dict__.setdefault("stack", [])
+            rec["parent"] = stack[-1]["id"] if stack else None
+            rec["depth"] = len(stack)
+            stack.append(rec)
+            rec["start"] = time.perf_counter()
+        return rec
+    
+    def __exit__(self, *exc):
+        rec = self.record
+        if rec is not None:
+            rec["duration"] = time.perf_counter()-rec["start"]
+            _profileState.stack.pop()
+            for prof in list(_profilers):
+                prof.records.append(rec)
+            for func in list(_profileCallbacks):
+                func(rec)
+
+def _sizes(args):
+    # number of bins of the distributions in args (also inside lists)
+    sizes = []
+    for x in args:
+        if isinstance(x, unDist) and x.weights is not None:
+            sizes.append(len(x.weights))
+        elif isinstance(x, (list, tuple)):
+            sizes += _sizes(x)
+    return sizes
+
+def _profiled(name):
+    # decorator for the instrumented methods and functions
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiling():
+                return func(*args, **kwargs)
+            with _span(name, _sizes(args)) as rec:
+                res = func(*args, **kwargs)
+                # sample() fills the distribution itself
+                out = args[0] if res is None else res
+                if isinstance(out, unDist) and out.weights is not None:
+                    rec["resultSize"] = len(out.weights)
+            return res
+        return wrapper
+    return decorate
+
+def _coreCall(core, routine, *args, sizes=(), engine=None, pairs=0, out=None):
+    # calls a routine of the backend, and records it if something is profiled
+    # out are the result arrays for in-place operations, see unDist._outBuffers
+    kwargs = {} if out is None else {"out": out}
+    if not _profiling():
+        return getattr(core, routine)(*args, **kwargs)
+    with _span(core.name+"."+routine, sizes, engine=engine, pairs=pairs) as rec:
+        _profileState.copied = 0
+        res = getattr(core, routine)(*args, **kwargs)
+        rec["bytesCopied"] = _profileState.copied + sum(a.nbytes for a in res if not 
+                                                        any(a is b for b in out or ()))
+        info = res[2] if len(res)>2 else np.zeros(InfoSize)
+        rec["prunedMass"] = float(info[InfoPrunedMass])
+        rec["clampedMass"] = float(info[InfoClampedMass])
+        rec["edgeMass"] = float(info[InfoEdgeMass])
+        rec["resultSize"] = len(res[1])
+    return res
+
+def _ascending(centers, weights):
+    # the centers of a distribution are sorted ascending or descending (e.g. after negating),
+    # returns both in the order of ascending centers, for 2d arrays (distBatch) every row separately
+    if centers.shape[-1]<2:
+        return centers, weights
+    descending = centers[..., 0]>centers[..., -1]
+    if centers.ndim==1:
+        return (centers[::-1], weights[::-1]) if descending else (centers, weights)
+    if not np.any(descending):
+        return centers, weights
+    flip = descending[:, None]
+    return np.where(flip, centers[:, ::-1], centers), np.where(flip, weights[:, ::-1], weights)
+
+def _trimTails(weights, budget):
+    # leave out the outermost bins, as long as their summed weight is below budget/2 on each side
+    # the centers of all distributions are sorted (ascending or descending), so these are the tails
+    # returns the range [first, last) of the kept bins, and the dropped weight
+    if budget<=0:
+        return 0, len(weights), 0.
+    first = np.searchsorted(np.cumsum(weights), budget/2, side="right")
+    last = len(weights)-np.searchsorted(np.cumsum(weights[::-1]), budget/2, side="right")
+    if last-first<2:
+        return 0, len(weights), 0.
+    dropped = np.sum(weights[:first])+np.sum(weights[last:])
+    return first, last, dropped
+
+def _storeWeights(result):
+    # convert the weights of a calculated (centers, weights, ...) tuple to options["weightsDtype"]
+    weights = result[1].astype(options["weightsDtype"], copy=False)
+    return (result[0], weights)+tuple(result[2:])
+
+# bins of the cheap result estimate, that places the bins of an adaptive pair result
+_adaptiveEstimateSamples = 256
+
+def _gridKey():
+    # the part of the cache keys for options["grid"], with all options an adaptive result depends on
+    # (the constructors and the fft engines calculate oversample times finer results, that are resampled)
+    if options["grid"]=="adaptive":
+        return ("adaptive", options["adaptiveShare"], options["oversample"])
+    return ("uniform",)
+
+def _adaptiveResample(core, centers, weights, newN, out=None):
+    # resample a (finer) distribution onto newN bins of about equal probability mass
+    newCenters = bkUncDistNumpy.adaptiveCenters(centers, weights, newN, options["adaptiveShare"])
+    return _coreCall(core, "resampleDistributionOntoCenters", centers, weights, newCenters, 
+                     sizes=(len(weights),), out=out)
+
+def _constructed(core, routine, *args):
+    # a constructor result with samples (the last argument) bins, on the grid of options["grid"]
+    if options["grid"]!="adaptive":
+        return _storeWeights(_coreCall(core, routine, *args))
+    centers, weights = _coreCall(core, routine, *args[:-1], args[-1]*options["oversample"])
+    return _storeWeights(_adaptiveResample(core, centers, weights, args[-1]))[:2]
+
+def _adaptiveCall(core, routine, args, newN, sizes=(), engine=None, pairs=0, out=None):
+    # an operation of _operate with newN adaptive result bins, for options["grid"]="adaptive"
+    if routine=="operateDistributionsAndResample":
+        # the bins are placed by a cheap estimate of the result from inputs with few bins,
+        # stretched to the exact result limits
+        op, centers1, weights1, centers2, weights2 = args
+        coarse1 = core.resampleDistribution(centers1, weights1, min(len(centers1), _adaptiveEstimateSamples))
+        coarse2 = core.resampleDistribution(centers2, weights2, min(len(centers2), _adaptiveEstimateSamples))
+        estimate = core.operateDistributionsAndResample(op, *coarse1, *coarse2, _adaptiveEstimateSamples)
+        resCenters = bkUncDistNumpy.adaptiveCenters(estimate[0], estimate[1], newN, options["adaptiveShare"])
+        
+        min1, max1 = bkUncDistNumpy.getLimits(centers1)
+        min2, max2 = bkUncDistNumpy.getLimits(centers2)
+        func = {OpAdd: np.add, OpMul: np.multiply, OpDiv: np.true_divide}[op]
+        corners = func([min1, min1, max1, max1], [min2, max2, min2, max2])
+        lo, hi = np.min(corners), np.max(corners)
+        if resCenters[-1]>resCenters[0]:
+            resCenters = lo+(resCenters-resCenters[0])*((hi-lo)/(resCenters[-1]-resCenters[0]))
+        return _coreCall(core, "operateDistributionsOntoCenters", op, centers1, weights1, centers2, weights2,
+                         resCenters, sizes=sizes, engine=engine, pairs=pairs, out=out)
+    
+    # the fft engines calculate a finer equally spaced result, which is resampled
+    fine = _coreCall(core, routine, *args, newN*options["oversample"], sizes=sizes, engine=engine)
+    res = _adaptiveResample(core, fine[0], fine[1], newN, out)
+    return res[0], res[1], res[2]+fine[2]
+
+def chooseEngine(op, dis1, dis2, engine=None):
+    """
+    decide which algorithm is used to combine two distributions
+    engine=None uses options["engine"]
+    returns "pair", "fft" (additions) or "log" (multiplications/divisions)
+    """
+    if engine is None:
+        engine = options["engine"]
+    if engine not in engines:
+        raise Exception("Unknown engine %s"%engine)
+    if engine=="pair":
+        return "pair"
+    
+    if engine=="auto":
+        pairs = len(dis1.centers)*len(dis2.centers)
+        if pairs<options["fftMinPairs"]:
+            return "pair"
     
-cppyy.include("bkUncDist.hpp")
+    if op==OpAdd:
+        return "pair" if engine=="log" else "fft"
+    
+    # the log engine needs strictly positive values
+    positive = np.min(dis1.centers)>0 and np.min(dis2.centers)>0
+    if engine=="log" and not positive:
+        raise Exception("log engine needs strictly positive distributions")
+    return "log" if positive else "pair"
+
+def _chainPairs(dists, powers):
+    # number of pairs the pair engine evaluates for the chain of operations of _repeat and _combineCheapest,
+    # every result has min(samples1, samples2)+1 bins
+    pairs, sizes = 0, []
+    for dis, p in zip(dists, powers):
+        n, res = len(dis.centers), None
+        while p:
+            if p&1:
+                if res is not None:
+                    pairs += res*n
+                res = n if res is None else min(res, n)+1
+            p >>= 1
+            if p:
+                pairs += n*n
+                n += 1
+        sizes.append(res)
+    heapq.heapify(sizes)
+    while len(sizes)>1:
+        n1, n2 = heapq.heappop(sizes), heapq.heappop(sizes)
+        pairs += n1*n2
+        heapq.heappush(sizes, min(n1, n2)+1)
+    return pairs
+
+def chooseReduceEngine(op, dists, engine=None, powers=None):
+    """
+    decide how a sum/product of more than two distributions is calculated, see unDist.sum
+    dists[i] occurs powers[i] times (default once)
+    returns "fft" (all in one fft pass, in log space for products) or "pair" (chain of pair operations)
+    """
+    if engine is None:
+        engine = options["engine"]
+    if engine not in engines:
+        raise Exception("Unknown engine %s"%engine)
+    if engine=="pair":
+        return "pair"
+    
+    if engine=="auto":
+        # the same threshold as chooseEngine, for the pairs of the whole chain
+        if _chainPairs(dists, [1]*len(dists) if powers is None else powers)<options["fftMinPairs"]:
+            return "pair"
+    
+    if op==OpAdd:
+        return "pair" if engine=="log" else "fft"
+    
+    positive = all(np.min(dis.centers)>0 for dis in dists)
+    if engine=="log" and not positive:
+        raise Exception("log engine needs strictly positive distributions")
+    return "fft" if positive else "pair"
 
 
 class unDist:
+    # a distribution has only these attributes, which saves the memory of a __dict__ per object
+    __slots__ = ("disType", "samples", "backend", "mean", "stdDev", "maxSigma", 
+                 "leftPos", "centerPos", "rightPos", "droppedMass", "provenance",
+                 "_centers", "_weights", "_grid", "_cdf", "_moments", "_owned", "_spare", "_analytic")
+    
     def __init__(self, disType="calculated", mean=np.nan, stdDev=np.nan, maxSigma=np.nan, 
-                  leftPos=np.nan, centerPos=np.nan, rightPos=np.nan, samples=1001):
+                  leftPos=np.nan, centerPos=np.nan, rightPos=np.nan, samples=1001, backend=None):
         self.disType = disType
         self.samples = samples
+        # None uses the globally selected backend, see options["backend"]
+        self.backend = backend
         
         self.centers = None
         self.weights = None
+        # probability mass left out by massBudget/minPairWeight while calculating this distribution
+        self.droppedMass = 0.
+        # how the distribution was made, a tree of dicts, see _node
+        self.provenance = None
+        # (centers, weights) arrays that only this distribution uses, and the spare ones
+        # of the in-place operations, see _outBuffers
+        self._owned = None
+        self._spare = None
+        # exact (mean, variance), None if not known, see analyticMeanStd
+        self._analytic = None
         
         if disType=="normal":
             if np.isnan(mean):
@@ -97,6 +1119,7 @@ class unDist:
             self.mean = mean
             self.stdDev = stdDev
             self.maxSigma = maxSigma
+            self.provenance = _node("normal", mean=mean, stdDev=stdDev, maxSigma=maxSigma, samples=samples)
         elif disType=="rect":
             if np.isnan(leftPos):
                 raise Exception("Rect distribution needs leftPos")
@@ -104,6 +1127,7 @@ class unDist:
                 raise Exception("Normal distribution needs rightPos")
             self.leftPos = leftPos
             self.rightPos = rightPos
+            self.provenance = _node("rect", leftPos=leftPos, rightPos=rightPos, samples=samples)
         elif disType=="tri":
             if np.isnan(leftPos):
                 raise Exception("Rect distribution needs leftPos")
@@ -114,15 +1138,21 @@ class unDist:
             self.leftPos = leftPos
             self.centerPos = centerPos
             self.rightPos = rightPos
+            self.provenance = _node("tri", leftPos=leftPos, centerPos=centerPos, rightPos=rightPos, 
+                                    samples=samples)
         elif disType=="calculated":
             pass
         else:
             raise Exception("Unimplemented distribution type %s"%disType)
         
+        self._analytic = _constructorMoments(disType, mean, stdDev, maxSigma, leftPos, centerPos, rightPos)
+        
         # if called with actual arguments, calculated the distribution
-        if disType!="calculated":
+        if disType!="calculated" and not options["momentsOnly"]:
             self.sample()
+            _checkMoments(self)
             
+    @_profiled("sample")
     def sample(self): 
         """
         create distribution, calls more specific functions
@@ -136,189 +1166,1923 @@ class unDist:
             self.sampleTri()
             
     def sampleNormal(self): 
-        # wraps the c++ function, and converts the results to numpy 
-        centers, weights= cppyy.gbl.getNormal(self.mean,self.stdDev, self.maxSigma, self.samples)
-        self.centers = np.array(centers)
-        self.weights=np.array(weights)
+        # wraps the c++/numpy function
+        core = getBackend(self.backend)
+        self.centers, self.weights = resultCache.lookup(
+                ("normal", core.name, self.mean,self.stdDev, self.maxSigma, self.samples, options["weightsDtype"])
+                +_gridKey(),
+                lambda: _constructed(core, "getNormal", self.mean,self.stdDev, self.maxSigma, self.samples))
+        self._compact()
         
     def sampleRect(self):
-        # wraps the c++ function, and converts the results to numpy 
-        centers, weights= cppyy.gbl.getRect(self.leftPos, self.rightPos, self.samples)
-        self.centers = np.array(centers)
-        self.weights=np.array(weights)
+        # wraps the c++/numpy function
+        core = getBackend(self.backend)
+        self.centers, self.weights = resultCache.lookup(
+                ("rect", core.name, self.leftPos, self.rightPos, self.samples, options["weightsDtype"])+_gridKey(),
+                lambda: _constructed(core, "getRect", self.leftPos, self.rightPos, self.samples))
+        self._compact()
         
     def sampleTri(self):
-        # wraps the c++ function, and converts the results to numpy 
-        centers, weights= cppyy.gbl.getTri(self.leftPos, self.centerPos, self.rightPos, self.samples)
-        self.centers = np.array(centers)
-        self.weights=np.array(weights)
+        # wraps the c++/numpy function
+        core = getBackend(self.backend)
+        self.centers, self.weights = resultCache.lookup(
+                ("tri", core.name, self.leftPos, self.centerPos, self.rightPos, self.samples, options["weightsDtype"])
+                +_gridKey(),
+                lambda: _constructed(core, "getTri", self.leftPos, self.centerPos, self.rightPos, self.samples))
+        self._compact()
+    
+    # centers and weights are properties, so that the cached cdf and moments are
+    # forgotten when they are replaced. Changing the arrays in place does not reset them.
+    @property
+    def centers(self):
+        # a compact distribution only keeps its grid, the centers are calculated when needed
+        if self._centers is None and self._grid is not None:
+            return bkUncDistNumpy.gridCenters(self._grid[0], self._grid[1], len(self._weights))
+        return self._centers
+    
+    @centers.setter
+    def centers(self, centers):
+        self._centers = centers
+        self._grid = None
+        self._cdf = None
+        self._moments = None
+    
+    @property
+    def grid(self):
+        # (first center, spacing) of a compact distribution, None otherwise
+        return self._grid
+    
+    def _setGrid(self, grid):
+        # make this a compact distribution: center i is grid[0]+i*grid[1]
+        self._centers = None
+        self._grid = (float(grid[0]), float(grid[1]))
+        self._cdf = None
+        self._moments = None
+    
+    def _subGrid(self, first):
+        # the grid of the bins from index first on, None if not compact
+        if self._grid is None:
+            return None
+        return self._grid[0]+first*self._grid[1], self._grid[1]
+    
+    def _compact(self):
+        # with options["compact"], replace equally spaced centers by their grid
+        # (the c++ routines calculate the centers by a running sum, so they are not exactly on the grid)
+        centers = self._centers
+        if not options["compact"] or centers is None or len(centers)<2:
+            return
+        delta = (centers[-1]-centers[0])/(len(centers)-1)
+        if delta!=0 and np.max(np.abs(centers-(centers[0]+np.arange(len(centers))*delta)))<=1e-6*abs(delta):
+            self._setGrid((centers[0], delta))
+    
+    @property
+    def weights(self):
+        return self._weights
+    
+    @weights.setter
+    def weights(self, weights):
+        self._weights = weights
+        self._cdf = None
+        self._moments = None
+    
+    def _getCdf(self):
+        # the cumulative sums, calculated once and kept until centers/weights change
+        # they are in the order of ascending centers (e.g. after negating, the arrays are descending)
+        if self._weights is None:
+            raise Exception("The distribution has no bins, e.g. with options[\"momentsOnly\"] only getMeanStd works")
+        if self._cdf is None:
+            centers, weights = _ascending(self.centers, self.weights)
+            
+            # for quantiles: like the original loop, the first weight is not counted
+            cum = np.zeros(len(weights))
+            np.cumsum(weights[1:], out=cum[1:], dtype=float)
+            
+            # for cdf/ppf: the weight is spread evenly over the bin, which reaches to the middle 
+            # between two neighbouring centers, and as far at the outer ends
+            edges = np.empty(len(centers)+1)
+            edges[1:-1] = (centers[1:]+centers[:-1])/2
+            edges[0] = centers[0]-(edges[1]-centers[0]) if len(centers)>1 else centers[0]
+            edges[-1] = centers[-1]+(centers[-1]-edges[-2]) if len(centers)>1 else centers[0]
+            cdf = np.zeros(len(weights)+1)
+            np.cumsum(weights, out=cdf[1:], dtype=float)
+            cdf /= cdf[-1]
+            
+            self._cdf = centers, cum, edges, cdf
+        return self._cdf
+    
+    def _streaming(self):
+        # True if the statistics are calculated in chunks, see options["streamMinBins"]
+        weights = self._weights
+        if self._cdf is not None or weights is None or len(weights)<=options["streamChunk"]:
+            return False
+        return len(weights)>options["streamMinBins"] or _isMapped(weights) or _isMapped(self._centers)
+    
+    def _chunks(self):
+        # (centers, weights) of the bins in chunks of options["streamChunk"], in the order of ascending centers
+        # the centers of a compact distribution are calculated per chunk
+        n, step = len(self._weights), options["streamChunk"]
+        if self._grid is not None:
+            descending = self._grid[1]<0
+        else:
+            descending = n>1 and self._centers[0]>self._centers[-1]
+        starts = range(0, n, step)
+        for start in reversed(starts) if descending else starts:
+            end = min(n, start+step)
+            if self._grid is not None:
+                centers = self._grid[0]+np.arange(start, end)*self._grid[1]
+            else:
+                centers = np.asarray(self._centers[start:end])
+            weights = np.asarray(self._weights[start:end], dtype=float)
+            if descending:
+                centers, weights = centers[::-1], weights[::-1]
+            yield centers, weights
+    
+    def _streamQuantiles(self, vals):
+        # quantiles() in chunks, same definition as with _getCdf: the first weight is not counted
+        res = np.full(len(vals), np.nan)
+        offset = None
+        for centers, weights in self._chunks():
+            cum = np.cumsum(weights)
+            cum += -weights[0] if offset is None else offset
+            offset = cum[-1]
+            todo = np.isnan(res) & (vals<=cum[-1])
+            res[todo] = centers[np.searchsorted(cum, vals[todo])]
+            lastCenter = centers[-1]
+        res[np.isnan(res)] = lastCenter
+        return res
+    
+    def _edgePoints(self):
+        # the (edges, cdf) points of _getCdf in chunks, every chunk starts with the last point of the one before
+        total = sum(np.sum(weights) for centers, weights in self._chunks())
+        running, last = 0., None
+        for centers, weights in self._chunks():
+            edges = np.empty(len(centers))
+            edges[1:] = (centers[1:]+centers[:-1])/2
+            if last is None:
+                second = centers[1] if len(centers)>1 else centers[0]
+                edges[0] = centers[0]-((centers[0]+second)/2-centers[0])
+            else:
+                edges[0] = (lastCenter+centers[0])/2
+            cdf = np.empty(len(centers))
+            cdf[0] = running
+            np.cumsum(weights[:-1], out=cdf[1:])
+            cdf[1:] += running
+            cdf /= total
+            running += np.sum(weights)
+            if last is not None:
+                edges, cdf = np.concatenate([[last[0]], edges]), np.concatenate([[last[1]], cdf])
+            yield edges, cdf
+            last, lastCenter = (edges[-1], cdf[-1]), centers[-1]
+        # the outer edge of the last bin is as far from its center as the inner one
+        yield np.array([last[0], lastCenter+(lastCenter-last[0])]), np.array([last[1], 1.])
     
-    def quantiles(self,vals):
+    def _streamInterp(self, x, inverse):
+        # cdf(x) or, with inverse=True, ppf(x) in chunks
+        values = np.atleast_1d(np.asarray(x, dtype=float))
+        res = np.full(len(values), np.nan)
+        for edges, cdf in self._edgePoints():
+            xp, fp = (cdf, edges) if inverse else (edges, cdf)
+            todo = np.isnan(res) & (values<=xp[-1])
+            res[todo] = np.interp(values[todo], xp, fp)
+        res[np.isnan(res)] = fp[-1]
+        return res if np.ndim(x) else res[0]
+    
+    def quantiles(self, vals, interpolate=False):
         # obtain the quantiles of the distibution
         # vals can be a single value, or a list/np.array
-        # does not do anti-aliasing
-        
-        # this would work in the curren numpy unstable, sadly not for everyone yet
-        # hence the code below is necessary
-        # return np.quantile(self.centers, vals, weights=self.weights)
-        
-        # create cummulative distribution function
-        # requiring that sum of weigths=1
-        cum = np.zeros_like(self.weights)
-        for i in range (1, len(self.weights)):
-            cum[i]=cum[i-1]+self.weights[i]
-        
-        poses = np.searchsorted(cum, vals)
+        # by default the center of the bin is returned, in which the quantile is (no anti-aliasing)
+        # interpolate=True interpolates linearly within the bin, same as ppf(vals)
+        if interpolate:
+            return self.ppf(vals)
+        if self._streaming():
+            poses = self._streamQuantiles(np.atleast_1d(np.asarray(vals, dtype=float)))
+            return poses if isinstance(vals, list) or isinstance(vals, np.ndarray) else poses[0]
+        centers, cum, edges, cdf = self._getCdf()
+        poses = np.minimum(np.searchsorted(cum, vals), len(cum)-1)
         
         #split based on if single of list is passed in vals
         if isinstance(vals, list) or isinstance(vals, np.ndarray):
-            return np.array( [ self.centers[p] for p in poses])
+            return centers[poses]
         else:
-            return  self.centers[int(poses)] 
+            return  centers[int(poses)] 
+    
+    def cdf(self, x):
+        # probability that a sample is <= x, x can be a value or an array
+        # the weight of a bin is assumed to be spread evenly over the bin
+        if self._streaming():
+            return self._streamInterp(x, inverse=False)
+        centers, cum, edges, cdf = self._getCdf()
+        return np.interp(x, edges, cdf)
+    
+    def ppf(self, q):
+        # inverse of cdf: the value, below which a sample is with probability q
+        if self._streaming():
+            return self._streamInterp(q, inverse=True)
+        centers, cum, edges, cdf = self._getCdf()
+        return np.interp(q, cdf, edges)
+    
+    def interval(self, confidence):
+        # the central interval, that contains a sample with the probability confidence
+        return tuple(self.ppf([(1-confidence)/2, (1+confidence)/2]))
+    
     def getMeanStd(self):
-        mean = np.sum(self.centers*self.weights )
-        stdDev = np.sqrt(    np.sum(  ((self.centers-mean)**2)*self.weights ) )
-        return mean, stdDev
+        # a distribution of options["momentsOnly"] has no bins, only the analytic moments
+        if self._weights is None and self._analytic is not None:
+            return self.analyticMeanStd()
+        if self._moments is None and self._streaming():
+            mean = sum(np.sum(centers*weights) for centers, weights in self._chunks())
+            stdDev = np.sqrt(sum(np.sum(((centers-mean)**2)*weights) for centers, weights in self._chunks()))
+            self._moments = mean, stdDev
+        if self._moments is None:
+            mean = np.sum(self.centers*self.weights )
+            stdDev = np.sqrt(    np.sum(  ((self.centers-mean)**2)*self.weights ) )
+            self._moments = mean, stdDev
+        return self._moments
         
-    def __add__(self, x):
-        # operater that is called if python sees code "unDist+x" 
-        # will be interpred
-        #  * as shift the centers, if x=float
-        #  * create the combined distrbution of sample(self)+sample(x)
+    def analyticMeanStd(self):
+        """
+        the exact mean and stdDev, calculated from the constructor parameters and propagated 
+        through the operations, instead of from the bins: free of binning errors, and O(1)
+        None if they are not known, e.g. after a division by a distribution
+        """
+        if self._analytic is None:
+            return None
+        return self._analytic[0], math.sqrt(max(self._analytic[1], 0.))
+    
+    def _momentsOnly(self, op, x, reverse=False):
+        # an operation for options["momentsOnly"]: the result only gets the analytic moments, no bins
+        if isinstance(x, unDist):
+            moments, samples, droppedMass = x._analytic, min(self.samples, x.samples)+1, x.droppedMass
+        elif isinstance(x, float) or isinstance(x, int):
+            moments, samples, droppedMass = (float(x), 0.), self.samples, 0.
+        else:
+            raise Exception("momentsOnly cannot combine type %s with an unDistributino"%type(x))
+        resDis = unDist()
+        resDis._analytic = _combineMoments(op, *((moments, self._analytic) if reverse else (self._analytic, moments)))
+        if resDis._analytic is None:
+            raise Exception("The moments of this %s are not known analytically, switch momentsOnly off"%_opNames[op])
+        resDis.samples = samples
+        resDis.droppedMass = self.droppedMass + droppedMass
+        if isinstance(x, unDist):
+            args = [x.provenance, self.provenance] if reverse else [self.provenance, x.provenance]
+            resDis.provenance = _node(_opNames[op], args, engine="moments")
+        else:
+            resDis.provenance = _node(_opNames[op], [self.provenance], value=x, reverse=reverse, engine="moments")
+        return resDis
         
-        if self.centers is None:
-            raise Exception("Cannot add unsampled distributions, left one")
+    def _operate(self, op, x, reverse=False, engine=None, backend=None, out=None):
+        # combine this distribution with another distribution x
+        # op is one of OpAdd, OpMul, OpDiv (same values as the c++ DistOps)
+        # reverse=True calculates "x op self" instead of "self op x", only relevant for OpDiv
+        # engine selects the algorithm, see options["engine"]
+        # backend selects the implementation, see options["backend"]
+        # out is a distribution, that is overwritten with the result, see _outBuffers
+        if x.centers is None:
+            raise Exception("Cannot operate on unsampled distributions, right one")
         
-        if isinstance(x, float) or isinstance(x, int):
-            #self.centers+=x
-            resDis = unDist()
-            resDis.samples = self.samples
-            resDis.weights = self.weights
-            resDis.centers = self.centers + x
-            return resDis
+        left, right = (x, self) if reverse else (self, x)
         
-        elif isinstance(x, unDist):
-            if x.centers is None:
-                raise Exception("Cannot add unsampled distributions, right one")
-            
-            newSamples = min(self.samples, x.samples) +1
+        engine = chooseEngine(op, left, right, engine)
+        
+        # drop negligible tails, the budget is shared by both inputs
+        budget = options["massBudget"]/2
+        first1, last1, dropped1 = _trimTails(left.weights, budget)
+        first2, last2, dropped2 = _trimTails(right.weights, budget)
+        weights1, weights2 = left.weights[first1:last1], right.weights[first2:last2]
+        minPairWeight = options["minPairWeight"] if engine=="pair" else 0
+        
+        core = getBackend(backend)
+        # the pair engine works directly on compact distributions, without center arrays
+        grid1, grid2 = left._subGrid(first1), right._subGrid(first2)
+        # adaptive result bins need the center arrays
+        adaptive = options["grid"]=="adaptive"
+        onGrid = engine=="pair" and grid1 is not None and grid2 is not None and not adaptive
+        if onGrid:
+            positions1, positions2 = np.array(grid1), np.array(grid2)
+        else:
+            positions1, positions2 = left.centers[first1:last1], right.centers[first2:last2]
+        
+        if onGrid:
+            routine, args = "operateGridDistributionsAndResample", (op, grid1, weights1, grid2, weights2)
+        elif engine=="fft":
+            routine, args = "convolveDistributionsAndResample", (positions1, weights1, positions2, weights2)
+        elif engine=="log":
+            routine, args = "logConvolveDistributionsAndResample", (op, positions1, weights1, positions2, weights2)
+        else:
+            routine, args = "operateDistributionsAndResample", (op, positions1, weights1, positions2, weights2)
+        
+        # the key contains everything the result depends on
+        # in-place results are not cached, as their arrays are overwritten later
+        useCache = out is None or options["tolerance"]>0
+        key = useCache and (op, engine, onGrid, core.name, options["oversample"], options["maxLogGrid"], 
+               options["threads"], minPairWeight, options["weightsDtype"], _digest(positions1), 
+               _digest(weights1), _digest(positions2), _digest(weights2))+_gridKey()
+        
+        def result(newSamples):
+            def calculate(buffers=None):
+                if adaptive:
+                    return _storeWeights(_adaptiveCall(core, routine, args, newSamples, 
+                                                       sizes=(len(weights1), len(weights2)), engine=engine,
+                                                       pairs=len(weights1)*len(weights2) if engine=="pair" else 0,
+                                                       out=buffers))
+                return _storeWeights(_coreCall(core, routine, *args, newSamples, 
+                                               sizes=(len(weights1), len(weights2)), engine=engine,
+                                               pairs=len(weights1)*len(weights2) if engine=="pair" else 0,
+                                               out=buffers))
             
-            resDis = unDist()
+            if useCache:
+                resDis = unDist()
+                positions, weights, info = resultCache.lookup(key+(newSamples,), calculate)
+            else:
+                resDis = out
+                resDis.disType = "calculated"
+                positions, weights, info = calculate(out._outBuffers(newSamples, centers=not onGrid))
             resDis.samples = newSamples
-            resDis.centers , resDis.weights = cppyy.gbl.operateDistributionsAndResample(cppyy.gbl.OpAdd, self.centers,self.weights, 
-                                                  x.centers, x.weights, newSamples)
-            resDis.centers = np.array(resDis.centers)
-            resDis.weights = np.array(resDis.weights)
+            resDis.weights = weights
+            if onGrid:
+                resDis._setGrid(positions)
+            else:
+                resDis.centers = positions
+                resDis._compact()
+            resDis.droppedMass = left.droppedMass + right.droppedMass + dropped1 + dropped2 \
+                                 + info[InfoPrunedMass]
+            resDis.provenance = _node(_opNames[op], [left.provenance, right.provenance], 
+                                      engine=engine, samples=newSamples)
+            resDis._analytic = _combineMoments(op, left._analytic, right._analytic)
             return resDis
+        
+        if options["tolerance"]>0:
+            resDis = _autoResolution(result)
+            return _checkMoments(resDis if out is None else out._assign(resDis))
+        return _checkMoments(result(min(self.samples, x.samples) +1))
+    
+    def _outBuffers(self, n, centers=True):
+        # result arrays of size n for an in-place operation on this distribution
+        # (centers=False for the grid routine, which only needs the weights)
+        # The inputs are still read while the result is written, so the current arrays cannot be used.
+        # They become the spare ones, into which the next in-place operation writes, if this 
+        # distribution is the only user of them. Arrays from the cache are read-only and never reused.
+        def reuse(a, wanted):
+            if not wanted:
+                return None
+            return a if a is not None and len(a)==n else np.empty(n)
+        spare = self._spare or (None, None)
+        owned = self._owned or (None, None)
+        buffers = reuse(spare[0], centers), reuse(spare[1], True)
+        self._spare = (owned[0] if owned[0] is not None and owned[0] is self._centers else None,
+                       owned[1] if owned[1] is not None and owned[1] is self._weights else None)
+        self._owned = buffers
+        return buffers
+    
+    def _assign(self, dis):
+        # make this distribution a copy of dis, the arrays are shared, returns self
+        if dis is not self:
+            dis._owned = None
+        self.disType = "calculated"
+        self.samples, self.droppedMass, self.provenance = dis.samples, dis.droppedMass, dis.provenance
+        self._analytic = dis._analytic
+        self.weights = dis.weights
+        if dis.grid is not None:
+            self._setGrid(dis.grid)
+        else:
+            self.centers = dis.centers
+        return self
+    
+    def copy(self):
+        """
+        a new distribution with the same bins and weights, e.g. as start value of a "+=" loop:
+        in-place operations on the copy do not change this distribution
+        the arrays are shared until one of them changes
+        """
+        return unDist(backend=self.backend)._assign(self)
+    
+    def _inPlace(self, name, func, x):
+        # shift/scale/divide this distribution by a scalar, func is np.add, np.multiply or np.true_divide
+        # the centers are changed in place if only this distribution uses them, the weights stay
+        if self._grid is not None:
+            left, delta = self._grid
+            self._setGrid((func(left, x), delta if func is np.add else func(delta, x)))
+        elif self._owned is not None and self._owned[0] is self._centers:
+            func(self._centers, x, out=self._centers)
+            self._cdf = None
+            self._moments = None
+        else:
+            self.centers = func(self.centers, x)
+            self._owned = (self._centers, self._owned[1] if self._owned else None)
+        self.disType = "calculated"
+        self.provenance = _node(name, [self.provenance], value=x)
+        self._analytic = _combineMoments({np.add: OpAdd, np.multiply: OpMul, np.true_divide: OpDiv}[func], 
+                                         self._analytic, (x, 0.))
+        return self
+    
+    def _withCenters(self, centers, provenance=None, analytic=None):
+        # a new distribution with the same weights, but different centers
+        # used for the operations with scalars, the weights array is shared
+        # analytic are the moments of the result, (mean, variance)
+        if self._owned is not None and self._owned[1] is self._weights:
+            # from now on an in-place operation must not overwrite them
+            self._owned = (self._owned[0], None)
+        resDis = unDist()
+        resDis.samples = self.samples
+        resDis.weights = self.weights
+        resDis.centers = centers
+        resDis.droppedMass = self.droppedMass
+        resDis.provenance = self.provenance if provenance is None else provenance
+        resDis._analytic = analytic
+        return resDis
+    
+    def _withGrid(self, left, delta, provenance=None, analytic=None):
+        # same as _withCenters for a compact distribution
+        resDis = self._withCenters(None, provenance, analytic)
+        resDis._setGrid((left, delta))
+        return resDis
+    
+    # operations with scalars, a compact distribution stays compact
+    def _shifted(self, x):
+        provenance = _node("shift", [self.provenance], value=x)
+        analytic = _combineMoments(OpAdd, self._analytic, (x, 0.))
+        if self._grid is not None:
+            return self._withGrid(self._grid[0]+x, self._grid[1], provenance, analytic)
+        return self._withCenters(self.centers + x, provenance, analytic)
+    
+    def _scaled(self, x):
+        provenance = _node("scale", [self.provenance], value=x)
+        analytic = _combineMoments(OpMul, self._analytic, (x, 0.))
+        if self._grid is not None:
+            return self._withGrid(self._grid[0]*x, self._grid[1]*x, provenance, analytic)
+        return self._withCenters(self.centers * x, provenance, analytic)
+    
+    def _divided(self, x):
+        provenance = _node("divide", [self.provenance], value=x)
+        analytic = _combineMoments(OpDiv, self._analytic, (x, 0.))
+        if self._grid is not None:
+            return self._withGrid(self._grid[0]/x, self._grid[1]/x, provenance, analytic)
+        return self._withCenters(self.centers / x, provenance, analytic)
+    
+    def _rdivided(self, x):
+        # x/self for a scalar x, the result is not equally spaced any more, and has no analytic moments
+        return self._withCenters(x/self.centers, _node("rdivide", [self.provenance], value=x))
+    
+    def lazy(self):
+        # start a lazy expression, see lazyDist
+        return lazyDist("leaf", dist=self)
+    
+    def add(self, x, engine=None, backend=None, out=None):
+        # same as "self+x", but the algorithm and backend can be chosen for this single call
+        # out is a distribution, that is overwritten with the result, reusing its arrays
+        # (e.g. out=self for "self += x"), see __iadd__
+        if options["momentsOnly"]:
+            return self._momentsOnly(OpAdd, x)
+        if self.centers is None:
+            raise Exception("Cannot add unsampled distributions, left one")
+        
+        if options["lazy"] or isinstance(x, lazyDist):
+            return self.lazy().__add__(x)
+        if isinstance(x, float) or isinstance(x, int):
+            return self._shifted(x) if out is None else out._assign(self)._inPlace("shift", np.add, x)
+        elif isinstance(x, unDist):
+            return self._operate(OpAdd, x, engine=engine, backend=backend, out=out)
         else:
             raise Exception("not sure how to add type %s to an unDistributino"%type(x))
+    
+    def mul(self, x, engine=None, backend=None, out=None):
+        # same as "self*x", but the algorithm and backend can be chosen for this single call
+        # out like for add
+        if options["momentsOnly"]:
+            return self._momentsOnly(OpMul, x)
+        if self.centers is None:
+            raise Exception("Cannot multiply unsampled distributions, left one")
+        if options["lazy"] or isinstance(x, lazyDist):
+            return self.lazy().__mul__(x)
+        if isinstance(x, float) or isinstance(x, int):
+            return self._scaled(x) if out is None else out._assign(self)._inPlace("scale", np.multiply, x)
+        elif isinstance(x, unDist):
+            return self._operate(OpMul, x, engine=engine, backend=backend, out=out)
+        else:
+            raise Exception("not sure how to multiply type %s to an unDistributino"%type(x))
+    
+    def div(self, x, engine=None, backend=None, out=None):
+        # same as "self/x", but the algorithm and backend can be chosen for this single call
+        # out like for add
+        if options["momentsOnly"]:
+            return self._momentsOnly(OpDiv, x)
+        if self.centers is None:
+            raise Exception("Cannot divide unsampled distributions, left one")
+        if options["lazy"] or isinstance(x, lazyDist):
+            return self.lazy().__truediv__(x)
+        if isinstance(x, float) or isinstance(x, int):
+            return self._divided(x) if out is None else out._assign(self)._inPlace("divide", np.true_divide, x)
+        elif isinstance(x, unDist):
+            return self._operate(OpDiv, x, engine=engine, backend=backend, out=out)
+        else:
+            raise Exception("not sure how to divide type %s to an unDistributino"%type(x))
+    
+    @staticmethod
+    @_profiled("sum")
+    def sum(dists, engine=None, backend=None):
+        """
+        sum of a list of distributions (scalars are allowed as well), e.g. unDist.sum([dis1, dis2, dis3])
+        
+        With the fft engines all terms are convolved in a single pass, 
+        instead of a chain of additions that resamples after every step.
+        This is faster and avoids the growing binning error of long chains.
+        A distribution that occurs several times in the list is transformed only once.
+        With the pair engine the terms are added starting with the smallest ones.
+        """
+        if options["lazy"] or any(isinstance(x, lazyDist) for x in dists):
+            return _lazyReduce(OpAdd, dists)
+        return _reduce(OpAdd, dists, engine, backend)
+    
+    @staticmethod
+    @_profiled("prod")
+    def prod(dists, engine=None, backend=None):
+        """
+        product of a list of distributions (scalars are allowed as well)
+        strictly positive distributions are multiplied in a single pass in log space, see unDist.sum
+        """
+        if options["lazy"] or any(isinstance(x, lazyDist) for x in dists):
+            return _lazyReduce(OpMul, dists)
+        return _reduce(OpMul, dists, engine, backend)
+    
+    @staticmethod
+    @_profiled("apply")
+    def apply(func, *dists, samples=None, inputSamples=None, backend=None):
+        """
+        distribution of func(dis1, dis2, ...) for independent distributions, calculated in a single pass
+            I = unDist.apply(lambda U, bg, R, tcR, dT: (U+bg)/(R*(1+0.01*tcR*dT)), U, bg, R, tcR, dT)
+        This avoids the resampling after every binary operation of the same equation written with operators.
+        func gets numpy arrays and has to be vectorized, scalars in dists are passed as they are.
+        
+        all N1*N2*...*Nk combinations of centers are evaluated (in chunks of options["chunkSize"]),
+        so inputSamples can resample the inputs to a smaller size first: 
+        a single number for all inputs, or a list with one entry per input (None keeps the size)
+        samples is the size of the result, the default is like for the operators: smallest input samples+1,
+        or chosen automatically with options["tolerance"]
+        """
+        if not dists:
+            raise Exception("apply needs at least one distribution")
+        if inputSamples is None or _isScalar(inputSamples):
+            inputSamples = [inputSamples]*len(dists)
+        if len(inputSamples)!=len(dists):
+            raise Exception("apply needs one inputSamples entry per input")
+        
+        core = getBackend(backend)
+        centersList, weightsList, sizes, provenances = [], [], [], []
+        droppedMass = 0.
+        for dis, n in zip(dists, inputSamples):
+            if _isScalar(dis):
+                centersList.append(np.array([float(dis)]))
+                weightsList.append(np.ones(1))
+                provenances.append(_node("value", value=dis))
+                continue
+            if isinstance(dis, lazyDist):
+                dis = dis.evaluate()
+            if not isinstance(dis, unDist):
+                raise Exception("not sure how to apply a function to type %s"%type(dis))
+            if dis.centers is None:
+                raise Exception("Cannot operate on unsampled distributions")
+            centers, weights = dis.centers, dis.weights
+            if n is not None and n<len(centers):
+                centers, weights = core.resampleDistribution(centers, weights, n)
+            centersList.append(centers)
+            weightsList.append(weights)
+            provenances.append(dis.provenance)
+            sizes.append(dis.samples)
+            droppedMass += dis.droppedMass
+        if not sizes:
+            raise Exception("apply needs at least one distribution")
+        
+        def result(samples):
+            resDis = unDist()
+            resDis.samples = samples
+            resDis.centers, resDis.weights = bkUncDistNumpy.applyFunctionAndResample(func, 
+                    centersList, weightsList, samples, options["chunkSize"])
+            resDis.droppedMass = droppedMass
+            resDis.provenance = _node("apply", provenances, function=getattr(func, "__qualname__", repr(func)),
+                                      inputSamples=[None if n is None else int(n) for n in inputSamples], 
+                                      samples=samples)
+            return resDis
+        
+        if samples is None and options["tolerance"]>0:
+            return _autoResolution(result)
+        return result(min(sizes)+1 if samples is None else samples)
+    
+    @staticmethod
+    @_profiled("fromTable")
+    def fromTable(table):
+        """
+        many normal/rect/tri distributions from a parameter table, e.g. an instrument catalog
+        the table has the columns type, mean, stdDev, maxSigma, leftPos, centerPos, rightPos, samples
+        (missing ones are nan, samples defaults to 1001), as dict of arrays, numpy structured array,
+        pandas DataFrame or list of dicts with one dict per distribution
+        all distributions are calculated in one pass into a single buffer, see distTable
+        a row that is no valid distribution, e.g. a tri with centerPos==leftPos, raises a ValueError with its row
+        """
+        return distTable(table)
+    
+    def repeatSum(self, k, engine=None, backend=None):
+        """
+        sum of k independent samples of this distribution, e.g. the length of k sticks of the same kind
+        with the fft engines the spectrum is raised to the power k, 
+        with the pair engine repeated squaring needs about log2(k) additions
+        """
+        if int(k)!=k or k<1:
+            raise Exception("repeatSum needs a positive integer, not %s"%k)
+        return unDist.sum([self]*int(k), engine, backend)
+    
+    def save(self, fileName):
+        """
+        store the distribution in a binary file: bins, grid, weights dtype, 
+        provenance (the constructors and operations it was made of) and a checksum
+        """
+        saveLibrary(fileName, {"dist": self})
+    
+    @staticmethod
+    def load(fileName, name=None, verify=True):
+        """
+        read a distribution written by save, or the one called name from a file of saveLibrary
+        the arrays are copied into memory, use distLibrary to share them via memory mapping
+        """
+        lib = distLibrary(fileName)
+        if name is None:
+            if len(lib)!=1:
+                raise Exception("%s contains %i distributions, choose one by name"%(fileName, len(lib)))
+            name = next(iter(lib))
+        if verify:
+            lib.verify([name])
+        rec, centers, weights, provenance = lib._blocks(name)
+        return _fromBlocks(rec, None if centers is None else centers.copy(), weights.copy(), provenance)
+        
+    @_profiled("add")
+    def __add__(self, x):
+        # operater that is called if python sees code "unDist+x" 
+        # will be interpred
+        #  * as shift the centers, if x=float
+        #  * create the combined distrbution of sample(self)+sample(x)
+        return self.add(x)
         
     def __radd__(self, x):
         # operater that is called if python sees code "x+unDist" 
         # + is assumed commutative
         return self.__add__(x)
     
+    @_profiled("iadd")
+    def __iadd__(self, x):
+        # operater that is called if python sees code "unDist += x"
+        # same result as "unDist = unDist+x", but the arrays of the distribution are reused:
+        # a scalar shifts the centers in place, for a distribution the result is written 
+        # into the arrays of the previous "+="/"*="/"/=" on it. Saves the allocations in long loops.
+        # Like for numpy arrays, every other reference to this object sees the change.
+        if options["lazy"] or isinstance(x, lazyDist):
+            return self.__add__(x)
+        return self.add(x, out=self)
+    
+    def __isub__(self, x):
+        # operater that is called if python sees code "unDist -= x" 
+        return self.__iadd__(-x)
+    
+    def __neg__(self):
+        # operater that is called if python sees code "-unDist" 
+        if options["momentsOnly"]:
+            return self._momentsOnly(OpMul, -1)
+        return self._scaled(-1)
+    
     def __sub__(self, x):
         # operater that is called if python sees code "unDist-x" 
         return self.__add__(-x)
     
     def __rsub__(self, x):
         # operater that is called if python sees code "x-unDist" 
-        print("rsub")
-        nd = unDist()
-        nd.centers = -copy.copy(self.centers)
-        nd.weights = copy.copy(self.weights)
-        
-        return nd.__add__(-x)
-    
-    
+        return (-self).__add__(x)
                 
+    @_profiled("mul")
     def __mul__(self, x):
         # operater that is called if python sees code "unDist*x" 
         # will be interpred
         #  * as spreading of the the centers by factor x, if x=float
         #  * create the combined distrbution of sample(self)*sample(x)
-        if self.centers is None:
-            raise Exception("Cannot multiply unsampled distributions, left one")
-        if isinstance(x, float) or isinstance(x, int):
-            #self.centers+=x
-            resDis = unDist()
-            resDis.samples = self.samples
-            resDis.weights = self.weights
-            resDis.centers = self.centers * x
-            return resDis
-        elif isinstance(x, unDist):
-            if x.centers is None:
-                raise Exception("Cannot multiply unsampled distributions, right one")
-            
-            newSamples = min(self.samples, x.samples)+1
-            resDis = unDist()
-            resDis.samples = newSamples
-            resDis.centers , resDis.weights = cppyy.gbl.operateDistributionsAndResample(cppyy.gbl.OpMul, self.centers,self.weights, 
-                                                  x.centers, x.weights, newSamples)
-            resDis.centers = np.array(resDis.centers)
-            resDis.weights = np.array(resDis.weights)
-            return resDis
-        else:
-            raise Exception("not sure how to multiply type %s to an unDistributino"%type(x))
+        return self.mul(x)
         
     def __rmul__(self, x):
         # operater that is called if python sees code "x*unDist" 
         # * is assumed commutative
         return self.__mul__(x)
+    
+    @_profiled("imul")
+    def __imul__(self, x):
+        # operater that is called if python sees code "unDist *= x", in place like __iadd__
+        if options["lazy"] or isinstance(x, lazyDist):
+            return self.__mul__(x)
+        return self.mul(x, out=self)
 
+    @_profiled("div")
     def __truediv__(self, x):
         # operater that is called if python sees code "unDist/x" 
         # will be interpred
         #  * as divition of the the centers by factor x, if x=float
         #  * create the combined distrbution of sample(self)/sample(x)
+        return self.div(x)
+            
+    @_profiled("idiv")
+    def __itruediv__(self, x):
+        # operater that is called if python sees code "unDist /= x", in place like __iadd__
+        if options["lazy"] or isinstance(x, lazyDist):
+            return self.__truediv__(x)
+        return self.div(x, out=self)
+    
+    @_profiled("rdiv")
+    def __rtruediv__(self, x):
+        if options["momentsOnly"]:
+            return self._momentsOnly(OpDiv, x, reverse=True)
         if self.centers is None:
             raise Exception("Cannot divide unsampled distributions, left one")
+        if options["lazy"] or isinstance(x, lazyDist):
+            return self.lazy().__rtruediv__(x)
         if isinstance(x, float) or isinstance(x, int):
-            #self.centers+=x
-            resDis = unDist()
-            resDis.samples = self.samples
-            resDis.weights = self.weights
-            resDis.centers = self.centers / x
-            return resDis
+            return self._rdivided(x)
         elif isinstance(x, unDist):
-            if x.centers is None:
-                raise Exception("Cannot divide unsampled distributions, right one")
-            
-            newSamples = min(self.samples, x.samples)+1
-            resDis = unDist()
-            resDis.samples = newSamples
-            resDis.centers , resDis.weights = cppyy.gbl.operateDistributionsAndResample(cppyy.gbl.OpDiv, self.centers,self.weights, 
-                                                  x.centers, x.weights, newSamples)
-            resDis.centers = np.array(resDis.centers)
-            resDis.weights = np.array(resDis.weights)
-            return resDis
+            return self._operate(OpDiv, x, reverse=True)
         else:
             raise Exception("not sure how to divide type %s to an unDistributino"%type(x))
-            
-    def __rtruediv__(self, x):
-        if self.centers is None:
-            raise Exception("Cannot divide unsampled distributions, left one")
-        if isinstance(x, float) or isinstance(x, int):
-            #self.centers+=x
-            resDis = unDist()
-            resDis.samples = self.samples
-            resDis.weights = self.weights
-            resDis.centers = x/self.centers 
-            return resDis
+
+
+_opNames = {OpAdd: "add", OpMul: "mul", OpDiv: "div"}
+
+def _combineMoments(op, moments1, moments2):
+    # the exact (mean, variance) of "a op b" for independent a and b with the given (mean, variance)
+    # a scalar x has the moments (x, 0). None if not known: division by a distribution, or unknown inputs
+    if moments1 is None or moments2 is None:
+        return None
+    (mean1, var1), (mean2, var2) = moments1, moments2
+    if op==OpAdd:
+        return mean1+mean2, var1+var2
+    if op==OpMul:
+        return mean1*mean2, var1*var2 + var1*mean2*mean2 + var2*mean1*mean1
+    if op==OpDiv and var2==0:
+        return mean1/mean2, var1/(mean2*mean2)
+    return None
+
+def _constructorMoments(disType, mean, stdDev, maxSigma, leftPos, centerPos, rightPos):
+    # the exact (mean, variance) of a normal/rect/tri distribution, None for "calculated"
+    if disType=="normal":
+        # the tails beyond maxSigma are cut off, which reduces the variance
+        k = maxSigma
+        return mean, stdDev**2*(1-2*k*math.exp(-k*k/2)/math.sqrt(2*math.pi)/math.erf(k/math.sqrt(2)))
+    if disType=="rect":
+        return (leftPos+rightPos)/2, (rightPos-leftPos)**2/12
+    if disType=="tri":
+        a, c, b = leftPos, centerPos, rightPos
+        return (a+b+c)/3, (a*a+b*b+c*c-a*b-a*c-b*c)/18
+    return None
+
+def _checkMoments(dis):
+    # with options["momentsTolerance"]: compare the moments of the bins of dis with the analytic ones
+    # the difference relative to the stdDev is kept in the provenance, a warning is given above the tolerance
+    if options["momentsTolerance"]<=0 or dis._analytic is None or dis.weights is None:
+        return dis
+    mean, stdDev = dis.analyticMeanStd()
+    if stdDev==0:
+        return dis
+    gridMean, gridStdDev = dis.getMeanStd()
+    error = max(abs(gridMean-mean), abs(gridStdDev-stdDev))/stdDev
+    dis.provenance["momentsError"] = error
+    if error>options["momentsTolerance"]:
+        warnings.warn("the bins of %s give mean %g stdDev %g, the analytic moments are %g %g (%.2g stdDev apart)"
+                      %(dis.provenance["op"], gridMean, gridStdDev, mean, stdDev, error))
+    return dis
+
+def _resolutionError(coarse, fine):
+    # difference of the compared statistics of two results, relative to the stdDev of the finer one
+    mean, stdDev = fine.getMeanStd()
+    if stdDev==0:
+        return 0.
+    if options["toleranceOn"]=="moments":
+        coarseMean, coarseStdDev = coarse.getMeanStd()
+        return max(abs(mean-coarseMean), abs(stdDev-coarseStdDev))/stdDev
+    qs = list(options["toleranceQuantiles"])
+    return float(np.max(np.abs(fine.ppf(qs)-coarse.ppf(qs))))/stdDev
+
+def _autoResolution(result):
+    # result(N) calculates an operation with N result bins
+    # N is doubled, until the results for N and 2N agree within options["tolerance"].
+    # The binning error shrinks about proportionally to 1/N, so the difference is about
+    # the error of the 2N result, which is returned. The estimate is kept in its provenance.
+    n = options["autoMinSamples"]
+    res = result(n)
+    while True:
+        finer = result(2*n)
+        error = _resolutionError(res, finer)
+        if error<=options["tolerance"] or 2*n>=options["autoMaxSamples"]:
+            break
+        res, n = finer, 2*n
+    finer.provenance["resolutionError"] = error
+    return finer
+
+def resolutionReport(dis):
+    """
+    the number of bins of every operation that made dis, and the estimated resolution error
+    (relative to the stdDev, only with options["tolerance"]), as text with one line per operation
+    """
+    lines = []
+    flat = _flattenProvenance(dis.provenance)
+    for i, node in enumerate(flat["nodes"]):
+        inputs = ", ".join("#%i"%a for a in node["args"] if a is not None)
+        line = "#%-4i %-8s %-14s samples %6s"%(i, node["op"], inputs, node.get("samples", ""))
+        if "resolutionError" in node:
+            line += "  error %.2g"%node["resolutionError"]
+        if "momentsError" in node:
+            line += "  moments error %.2g"%node["momentsError"]
+        lines.append(line)
+    return "\n".join(lines)
+
+class budgetTable:
+    """
+    the contribution of every input of a sum or product to the result, see budgetContributions
+        rows        one dict per input: name, mean, stdDev, 
+                    variance: var(total)-var(without the input), varianceFraction: that /var(total),
+                    quantileShifts: total.ppf(q)-withoutInput.ppf(q) for every q of quantiles,
+                    widthContribution: the same for the width of the interval between the outer quantiles
+        total       the result with all inputs
+        withoutInput[i]  the result with input i replaced by its mean
+    """
+    def __init__(self, names, dists, total, withoutInput, quantiles):
+        self.total = total
+        self.withoutInput = withoutInput
+        self.quantiles = list(quantiles)
+        totalVariance = total.getMeanStd()[1]**2
+        totalQuantiles = total.ppf(self.quantiles)
+        self.rows = []
+        for name, dis, other in zip(names, dists, withoutInput):
+            mean, stdDev = dis.getMeanStd()
+            variance = totalVariance-other.getMeanStd()[1]**2
+            shifts = totalQuantiles-other.ppf(self.quantiles)
+            self.rows.append({"name": name, "mean": mean, "stdDev": stdDev, "variance": variance,
+                              "varianceFraction": variance/totalVariance if totalVariance>0 else 0.,
+                              "quantileShifts": dict(zip(self.quantiles, shifts)),
+                              "widthContribution": shifts[-1]-shifts[0]})
+    
+    def report(self):
+        """
+        the rows as text, sorted by the variance contribution
+        """
+        lines = ["%-20s %12s %12s %12s %8s %12s"%("input", "mean", "stdDev", "variance", "share", "width")]
+        for row in sorted(self.rows, key=lambda row: -row["variance"]):
+            lines.append("%-20s %12.5g %12.5g %12.5g %7.1f%% %12.5g"%(row["name"], row["mean"], row["stdDev"],
+                         row["variance"], row["varianceFraction"]*100, row["widthContribution"]))
+        mean, stdDev = self.total.getMeanStd()
+        lines.append("%-20s %12.5g %12.5g %12.5g %7.1f%% %12.5g"%("total", mean, stdDev, stdDev**2, 100,
+                     self.total.ppf(self.quantiles[-1])-self.total.ppf(self.quantiles[0])))
+        return "\n".join(lines)
+
+@_profiled("budgetContributions")
+def budgetContributions(dists, op="add", names=None, quantiles=(0.025, 0.975), engine=None, backend=None):
+    """
+    how much each of the independent distributions dists contributes to their sum (op="add") 
+    or product (op="mul"), returns a budgetTable
+    
+    For every input the result is calculated once more with this input replaced by its mean.
+    Instead of n chains of n-1 operations, the chains of the inputs before (prefix) and 
+    after (suffix) input i are calculated once, and shared by all inputs: 
+    without input i = prefix[i] op suffix[i+1], which are about 3n operations.
+    The results can differ from a chain in the written order by binning effects.
+    """
+    if op not in ("add", "mul"):
+        raise Exception("budgetContributions needs op add or mul")
+    if len(dists)<2:
+        raise Exception("budgetContributions needs at least two distributions")
+    for dis in dists:
+        if not isinstance(dis, unDist) or dis.centers is None:
+            raise Exception("budgetContributions needs calculated distributions")
+    names = ["#%i"%i for i in range(len(dists))] if names is None else list(names)
+    opCode = OpAdd if op=="add" else OpMul
+    combine = lambda a, b: a._operate(opCode, b, engine=engine, backend=backend)
+    
+    # prefix[i] combines dists[:i], suffix[i] dists[i:], the empty ones are None
+    n = len(dists)
+    prefix, suffix = [None, dists[0]], [None]*(n+1)
+    for i in range(1, n-1):
+        prefix.append(combine(prefix[-1], dists[i]))
+    suffix[n-1] = dists[n-1]
+    for i in range(n-2, 0, -1):
+        suffix[i] = combine(dists[i], suffix[i+1])
+    total = combine(prefix[n-1], dists[n-1])
+    
+    withoutInput = []
+    for i in range(n):
+        rest = prefix[i] if suffix[i+1] is None else suffix[i+1] if prefix[i] is None \
+               else combine(prefix[i], suffix[i+1])
+        mean = dists[i].getMeanStd()[0]
+        withoutInput.append(rest._shifted(mean) if op=="add" else rest._scaled(mean))
+    return budgetTable(names, dists, total, withoutInput, quantiles)
+
+def _node(op, args=(), **params):
+    # a node of the provenance tree of a distribution: 
+    # the operation or constructor, its parameters, and the provenance of the input distributions
+    # e.g. {"op": "mul", "args": [{"op": "rect", "args": [], "leftPos": 1, ...}, ...], "engine": "pair", ...}
+    # nodes are shared, not copied, so the tree costs a dict per operation
+    return dict(op=op, args=list(args), **params)
+
+def _isScalar(x):
+    return isinstance(x, float) or isinstance(x, int)
+
+def _combineCheapest(dists, op, engine=None, backend=None):
+    # combine a list of distributions with an associative operation (OpAdd or OpMul)
+    # the two distributions with the fewest bins are combined first,
+    # which keeps the number of evaluated pairs N*M small
+    heap = [(len(dis.centers), i, dis) for i, dis in enumerate(dists)]
+    heapq.heapify(heap)
+    counter = len(heap)
+    while len(heap)>1:
+        n1, i1, dis1 = heapq.heappop(heap)
+        n2, i2, dis2 = heapq.heappop(heap)
+        res = dis1._operate(op, dis2, engine=engine, backend=backend)
+        heapq.heappush(heap, (len(res.centers), counter, res))
+        counter += 1
+    return heap[0][2]
+
+def _repeat(op, dis, p, engine=None, backend=None):
+    # combine p times the same distribution by repeated squaring, 
+    # this needs about log2(p) operations instead of p-1
+    res = None
+    while p:
+        if p&1:
+            res = dis if res is None else res._operate(op, dis, engine=engine, backend=backend)
+        p >>= 1
+        if p:
+            dis = dis._operate(op, dis, engine=engine, backend=backend)
+    return res
+
+def _convolveMany(op, dists, powers, backend=None):
+    # all distributions in a single fft pass, dists[i] occurs powers[i] times
+    
+    # the mass budget is shared by all terms
+    budget = options["massBudget"]/sum(powers)
+    trimmed = []
+    for dis in dists:
+        first, last, dropped = _trimTails(dis.weights, budget)
+        trimmed.append((dis.centers[first:last], dis.weights[first:last], dropped))
+    
+    core = getBackend(backend)
+    key = ("many", op, core.name, options["oversample"], options["maxLogGrid"], options["weightsDtype"],
+           tuple((_digest(t[0]), _digest(t[1]), p) for t, p in zip(trimmed, powers)))
+    
+    def result(newSamples):
+        def calculate():
+            return _storeWeights(_coreCall(core, "convolveManyDistributionsAndResample", op, 
+                    [t[0] for t in trimmed], [t[1] for t in trimmed], powers, newSamples,
+                    sizes=[len(t[1]) for t in trimmed], engine="fft"))
+        
+        resDis = unDist()
+        resDis.samples = newSamples
+        resDis.centers , resDis.weights, info = resultCache.lookup(key+(newSamples,), calculate)
+        resDis._compact()
+        resDis.droppedMass = sum(p*(dis.droppedMass+t[2]) for dis, t, p in zip(dists, trimmed, powers)) \
+                             + info[InfoPrunedMass]
+        resDis.provenance = _node("sum" if op==OpAdd else "prod", [dis.provenance for dis in dists], 
+                                  powers=[int(p) for p in powers], engine="fft", samples=newSamples)
+        resDis._analytic = functools.reduce(functools.partial(_combineMoments, op), 
+                                            [dis._analytic for dis, p in zip(dists, powers) for i in range(p)])
+        return resDis
+    
+    if options["tolerance"]>0:
+        return _checkMoments(_autoResolution(result))
+    return _checkMoments(result(min(dis.samples for dis in dists) +1))
+
+def _manyGridFits(op, dists, powers):
+    # the single fft pass resolves the bins of every distribution, for very long sums/products
+    # or very different widths its grid would exceed options["maxLogGrid"], then a chain of operations is used
+    # with options["tolerance"] the result bins are only known up to 2*autoMaxSamples
+    newN = 2*options["autoMaxSamples"] if options["tolerance"]>0 else min(dis.samples for dis in dists)+1
+    return bkUncDistNumpy.manyGridSize(op, [dis.centers for dis in dists], powers, newN, 
+                                       options["oversample"])<=options["maxLogGrid"]
+
+def _reduce(op, terms, engine=None, backend=None):
+    # sum (OpAdd) or product (OpMul) of a list of distributions and scalars
+    # used by unDist.sum/prod and the sum/prod nodes of lazyDist
+    if options["momentsOnly"]:
+        # only the analytic moments, see unDist._momentsOnly
+        first = next((i for i, x in enumerate(terms) if isinstance(x, unDist)), None)
+        if first is None:
+            raise Exception("sum/prod needs at least one distribution")
+        res = terms[first]
+        for x in terms[:first]+terms[first+1:]:
+            res = res._momentsOnly(op, x)
+        return res
+    dists, powers, index = [], [], {}
+    scalar = 0 if op==OpAdd else 1
+    for x in terms:
+        if _isScalar(x):
+            scalar = scalar+x if op==OpAdd else scalar*x
         elif isinstance(x, unDist):
             if x.centers is None:
-                raise Exception("Cannot divide unsampled distributions, right one")
-            
-            newSamples = min(self.samples, x.samples)+1
-            resDis = unDist()
-            resDis.samples = newSamples
-            resDis.centers , resDis.weights = cppyy.gbl.operateDistributionsAndResample(cppyy.gbl.OpDiv, 
-                    x.centers, x.weights,  self.centers, self.weights, newSamples)
-            resDis.centers = np.array(resDis.centers)
-            resDis.weights = np.array(resDis.weights)
-            return resDis
+                raise Exception("Cannot operate on unsampled distributions")
+            # identical distributions are counted instead of listed
+            if id(x) in index:
+                powers[index[id(x)]] += 1
+            else:
+                index[id(x)] = len(dists)
+                dists.append(x)
+                powers.append(1)
         else:
-            raise Exception("not sure how to divide type %s to an unDistributino"%type(x))
-      
-    
\ No newline at end of file
+            raise Exception("not sure how to combine type %s with an unDistributino"%type(x))
+    if not dists:
+        raise Exception("sum/prod needs at least one distribution")
+    
+    total = sum(powers)
+    if total==1:
+        res = dists[0]
+    elif total==2:
+        # two terms are a normal operation, so unDist.sum([a, b]) is the same as a+b
+        res = dists[0]._operate(op, dists[-1], engine=engine, backend=backend)
+    elif chooseReduceEngine(op, dists, engine, powers)=="fft" and _manyGridFits(op, dists, powers):
+        res = _convolveMany(op, dists, powers, backend)
+    else:
+        res = _combineCheapest([_repeat(op, dis, p, engine, backend) for dis, p in zip(dists, powers)], 
+                               op, engine, backend)
+    
+    if op==OpAdd and scalar!=0:
+        res = res._shifted(scalar)
+    elif op==OpMul and scalar!=1:
+        res = res._scaled(scalar)
+    return res
+
+def _lazyReduce(op, terms):
+    # sum/product as lazy expression
+    res = None
+    for x in terms:
+        if isinstance(x, unDist):
+            x = x.lazy()
+        if res is None:
+            res = x
+        else:
+            res = res+x if op==OpAdd else res*x
+    if not isinstance(res, lazyDist):
+        raise Exception("sum/prod needs at least one distribution")
+    return res
+
+
+class lazyDist:
+    """
+    a distribution which is not calculated yet, but remembers how to calculate it
+    
+    The operators on lazyDist build an expression graph instead of calculating.
+    The calculation happens when the result is needed: 
+    on .centers, .weights, .samples, quantiles(), getMeanStd() or evaluate().
+    
+    While building the graph
+     * scalar shifts and scales are collected into a single affine transform a*x+b
+     * chains of + and * are collected into one sum/product node
+    When evaluating
+     * identical sub expressions are calculated only once
+     * sums/products are evaluated like unDist.sum/prod: with the fft engines in a single pass,
+       with the pair engine starting with the distributions that have the fewest bins,
+       so the order can differ from the written one (results differ only by binning effects)
+    
+    Usage:
+        res = (dis1.lazy()+3)*dis2*dis3 + dis4
+    or for everything:
+        setOptions(lazy=True)
+    
+    A scalar can be left open with parameter(name), and the expression
+    evaluated for many values of it with sweep(), see there.
+    """
+    def __init__(self, kind, children=(), dist=None, scale=1, shift=0, factor=None, name=None):
+        # kind is one of
+        #  "leaf":   a calculated unDist dist
+        #  "affine": scale*children[0]+shift
+        #  "sum":    sum of all children
+        #  "prod":   product of all children
+        #  "div":    children[0]/children[1]
+        #  "rdiv":   factor/children[0]
+        #  "param":  a scalar, whose value is given when evaluating, see sweep()
+        self.kind = kind
+        self.children = tuple(children)
+        self.dist = dist
+        self.scale = scale
+        self.shift = shift
+        self.factor = factor
+        self.name = name
+        self._key = None
+        self._params = None
+        self._value = None
+    
+    def __getstate__(self):
+        # the key contains ids, and the value is recalculated, so both are not pickled
+        return dict(self.__dict__, _key=None, _value=None)
+    
+    def key(self):
+        # identical keys mean identical results, used to find common sub expressions
+        if self._key is None:
+            if self.kind=="leaf":
+                self._key = ("leaf", id(self.dist))
+            elif self.kind=="affine":
+                self._key = ("affine", self.children[0].key(), self.scale, self.shift)
+            elif self.kind in ("sum", "prod"):
+                # order does not matter for sums and products
+                self._key = (self.kind, tuple(sorted((c.key() for c in self.children), key=repr)))
+            elif self.kind=="div":
+                self._key = ("div", self.children[0].key(), self.children[1].key())
+            elif self.kind=="param":
+                self._key = ("param", self.name)
+            else:
+                self._key = ("rdiv", self.factor, self.children[0].key())
+        return self._key
+    
+    def params(self):
+        # names of the parameters, that the result depends on
+        if self._params is None:
+            if self.kind=="param":
+                self._params = frozenset([self.name])
+            else:
+                self._params = frozenset().union(*[c.params() for c in self.children])
+        return self._params
+    
+    def lazy(self):
+        return self
+    
+    @_profiled("evaluate")
+    def evaluate(self, engine=None, backend=None):
+        """
+        calculate the distribution, the result is an unDist and is kept
+        """
+        if self._value is None:
+            if self.params():
+                raise Exception("parameters %s have no value, use sweep()"%", ".join(sorted(self.params())))
+            self._value = self._evaluate({}, engine, backend)
+        return self._value
+    
+    def sweep(self, engine=None, backend=None, **values):
+        # see the function sweep
+        return sweep(self, engine, backend, **values)
+    
+    def _evaluate(self, memo, engine, backend, binding={}):
+        # binding are the values of the parameters
+        # the memo key contains only the values of the parameters this node depends on,
+        # so in a sweep all parameter independent results are calculated once
+        key = self.key()
+        if self.params():
+            key = (key, tuple(binding[name] for name in sorted(self.params())))
+        if key in memo:
+            return memo[key]
+        if self._value is not None:
+            res = self._value
+        elif self.kind=="leaf":
+            res = self.dist
+        elif self.kind=="param":
+            res = binding[self.name]
+        elif self.kind=="affine":
+            res = self.children[0]._evaluate(memo, engine, backend, binding)
+            res = res*self.scale+self.shift if _isScalar(res) else \
+                  res._scaled(self.scale)._shifted(self.shift)
+        elif self.kind in ("sum", "prod"):
+            children = self.children
+            fixed = [c for c in children if not c.params()]
+            if self.params() and len(fixed)>1:
+                # the parameter independent members form a sub node, whose memo key has no binding,
+                # so in a sweep they are reduced once, and only combined with the others for every value
+                children = [lazyDist(self.kind, fixed)]+[c for c in children if c.params()]
+            dists = [c._evaluate(memo, engine, backend, binding) for c in children]
+            op = OpAdd if self.kind=="sum" else OpMul
+            if all(_isScalar(x) for x in dists):
+                res = sum(dists) if op==OpAdd else float(np.prod(dists))
+            else:
+                res = _reduce(op, dists, engine, backend)
+        elif self.kind=="div":
+            num = self.children[0]._evaluate(memo, engine, backend, binding)
+            den = self.children[1]._evaluate(memo, engine, backend, binding)
+            if _isScalar(den):
+                res = num/den if _isScalar(num) else num._divided(den)
+            elif _isScalar(num):
+                res = den._rdivided(num)
+            else:
+                res = num._operate(OpDiv, den, engine=engine, backend=backend)
+        else:
+            res = self.children[0]._evaluate(memo, engine, backend, binding)
+            res = self.factor/res if _isScalar(res) else res._rdivided(self.factor)
+        memo[key] = res
+        return res
+    
+    @property
+    def centers(self):
+        return self.evaluate().centers
+    
+    @property
+    def weights(self):
+        return self.evaluate().weights
+    
+    @property
+    def samples(self):
+        return self.evaluate().samples
+    
+    @property
+    def provenance(self):
+        return self.evaluate().provenance
+    
+    def save(self, fileName):
+        self.evaluate().save(fileName)
+    
+    @property
+    def droppedMass(self):
+        return self.evaluate().droppedMass
+    
+    def quantiles(self, vals, interpolate=False):
+        return self.evaluate().quantiles(vals, interpolate)
+    
+    def cdf(self, x):
+        return self.evaluate().cdf(x)
+    
+    def ppf(self, q):
+        return self.evaluate().ppf(q)
+    
+    def interval(self, confidence):
+        return self.evaluate().interval(confidence)
+    
+    def getMeanStd(self):
+        return self.evaluate().getMeanStd()
+    
+    def _affineParts(self):
+        # split into scale*node+shift
+        if self.kind=="affine":
+            return self.children[0], self.scale, self.shift
+        return self, 1, 0
+    
+    def _affine(self, scale, shift):
+        # scale*self+shift, merged with an existing affine transform
+        node, a, b = self._affineParts()
+        a, b = a*scale, b*scale+shift
+        if a==1 and b==0:
+            return node
+        return lazyDist("affine", (node,), scale=a, shift=b)
+    
+    def _members(self, kind):
+        # the children, if self is a sum/prod node of this kind
+        return self.children if self.kind==kind else (self,)
+    
+    def __add__(self, x):
+        if _isScalar(x):
+            return self._affine(1, x)
+        x = _asLazy(x, "add")
+        # shifts are pulled out of the sum, and applied once at the end
+        shift = 0
+        members = []
+        for term in (self, x):
+            node, a, b = term._affineParts()
+            shift += b
+            members += (node._affine(a, 0))._members("sum")
+        res = lazyDist("sum", members)
+        return res._affine(1, shift) if shift!=0 else res
+    
+    def __radd__(self, x):
+        return self.__add__(x)
+    
+    def __neg__(self):
+        return self._affine(-1, 0)
+    
+    def __sub__(self, x):
+        return self.__add__(-x)
+    
+    def __rsub__(self, x):
+        return (-self).__add__(x)
+    
+    def __mul__(self, x):
+        if _isScalar(x):
+            return self._affine(x, 0)
+        x = _asLazy(x, "multiply")
+        # pure scales are pulled out of the product, and applied once at the end
+        scale = 1
+        members = []
+        for term in (self, x):
+            node, a, b = term._affineParts()
+            if b==0:
+                scale *= a
+                members += node._members("prod")
+            else:
+                members.append(term)
+        res = lazyDist("prod", members)
+        return res._affine(scale, 0) if scale!=1 else res
+    
+    def __rmul__(self, x):
+        return self.__mul__(x)
+    
+    def __truediv__(self, x):
+        if _isScalar(x):
+            return self._affine(1/x, 0)
+        x = _asLazy(x, "divide")
+        num, a, b = self._affineParts()
+        den, c, d = x._affineParts()
+        if b!=0:
+            num, a = self, 1
+        if d!=0:
+            den, c = x, 1
+        res = lazyDist("div", (num, den))
+        return res._affine(a/c, 0) if a!=c else res
+    
+    def __rtruediv__(self, x):
+        if _isScalar(x):
+            node, a, b = self._affineParts()
+            if b==0:
+                return lazyDist("rdiv", (node,), factor=x/a)
+            return lazyDist("rdiv", (self,), factor=x)
+        return _asLazy(x, "divide").__truediv__(self)
+    
+    add = __add__
+    mul = __mul__
+    div = __truediv__
+
+
+def parameter(name):
+    """
+    a scalar placeholder for lazy expressions, its values are given to sweep()
+        DNI = parameter("DNI")
+        res = (DNI+zeroOffset)*sensitivity*sensDist + dataLogger
+        batch = sweep(res, DNI=np.linspace(100, 1000, 100))
+    """
+    return lazyDist("param", name=name)
+
+def sweep(expr, engine=None, backend=None, **values):
+    """
+    evaluate a lazy expression with parameters for many values, e.g. sweep(res, DNI=[100, 200, 300])
+    with several parameters, all value lists need the same length, and are used together
+    
+    everything that does not depend on the parameters (e.g. a product of sensitivity distributions)
+    is calculated only once for all values
+    returns a distBatch with the stacked results
+    """
+    expr = _asLazy(expr, "sweep")
+    missing = expr.params()-set(values)
+    if missing:
+        raise Exception("sweep needs values for %s"%", ".join(sorted(missing)))
+    values = {name: np.atleast_1d(np.asarray(v, dtype=float)) for name, v in values.items()}
+    count = len(next(iter(values.values()))) if values else 1
+    for name, v in values.items():
+        if len(v)!=count:
+            raise Exception("sweep needs the same number of values for all parameters, %s has %i instead of %i"
+                            %(name, len(v), count))
+    
+    memo = {}
+    dists = []
+    for i in range(count):
+        res = expr._evaluate(memo, engine, backend, {name: float(v[i]) for name, v in values.items()})
+        if _isScalar(res):
+            raise Exception("the swept expression does not contain a distribution")
+        dists.append(res)
+    return distBatch(dists, values)
+
+
+class distBatch:
+    """
+    many distributions with the same number of bins, e.g. the result of sweep()
+    centers and weights are 2d arrays, row i is distribution i
+    quantiles and getMeanStd work on all rows at once
+    """
+    def __init__(self, dists, values=None):
+        if len(set(len(dis.centers) for dis in dists))>1:
+            raise Exception("all distributions of a distBatch need the same number of bins")
+        self.values = values
+        self.samples = dists[0].samples
+        self.centers = np.stack([dis.centers for dis in dists])
+        self.weights = np.stack([dis.weights for dis in dists])
+        self.droppedMass = np.array([dis.droppedMass for dis in dists])
+        self.provenance = [dis.provenance for dis in dists]
+    
+    def __len__(self):
+        return len(self.centers)
+    
+    def __getitem__(self, i):
+        # distribution i as unDist, it shares the memory of the batch
+        res = unDist()
+        res.samples = self.samples
+        res.centers = self.centers[i]
+        res.weights = self.weights[i]
+        res.droppedMass = self.droppedMass[i]
+        res.provenance = self.provenance[i]
+        return res
+    
+    def quantiles(self, vals):
+        # same as unDist.quantiles for every distribution, 
+        # the result has one row per distribution, and one column per value in vals
+        centers, weights = _ascending(self.centers, self.weights)
+        cum = np.zeros(weights.shape)
+        np.cumsum(weights[:, 1:], axis=1, out=cum[:, 1:])
+        
+        # counting the smaller values is the same as np.searchsorted in every row
+        vals1d = np.atleast_1d(vals)
+        poses = np.stack([np.sum(cum<v, axis=1) for v in vals1d], axis=1)
+        poses = np.minimum(poses, cum.shape[1]-1)
+        res = np.take_along_axis(centers, poses, axis=1)
+        
+        if isinstance(vals, list) or isinstance(vals, np.ndarray):
+            return res
+        return res[:, 0]
+    
+    def getMeanStd(self):
+        # arrays of the means and standard deviations of all distributions
+        mean = np.sum(self.centers*self.weights, axis=1)
+        stdDev = np.sqrt(np.sum(((self.centers-mean[:, None])**2)*self.weights, axis=1))
+        return mean, stdDev
+
+
+_tableColumns = ("type", "mean", "stdDev", "maxSigma", "leftPos", "centerPos", "rightPos", "samples")
+
+def _readTable(table):
+    # the columns of a parameter table for distTable as dict of 1d arrays
+    if isinstance(table, (list, tuple)):
+        table = {name: [row.get(name, np.nan) for row in table] for name in _tableColumns}
+    names = table.dtype.names if hasattr(table, "dtype") else table
+    if "type" not in names:
+        raise Exception("The table needs a type column")
+    types = np.asarray(table["type"]).astype(str)
+    columns = {"type": types}
+    for name in _tableColumns[1:]:
+        default = 1001 if name=="samples" else np.nan
+        values = np.asarray(table[name] if name in names else default, dtype=float)
+        if name=="samples":
+            values = np.where(np.isnan(values), default, values)
+        columns[name] = np.broadcast_to(values, types.shape)
+    columns["samples"] = columns["samples"].astype(np.int64)
+    return columns
+
+class distTable:
+    """
+    many normal/rect/tri distributions from a parameter table, see unDist.fromTable
+    The bins of all distributions are calculated in one vectorized pass into one contiguous buffer:
+    buffer[0] are the centers, buffer[1] the weights, distribution i has the bins [offsets[i], offsets[i+1]).
+    table[i] is distribution i as unDist, a view of the buffer that is only created when it is used.
+    The results are the same as of the numpy backend, they are not cached.
+    """
+    def __init__(self, table):
+        self.columns = _readTable(table)
+        types, samples = self.columns["type"], self.columns["samples"]
+        for kind, needs in (("normal", ("mean", "stdDev", "maxSigma")), ("rect", ("leftPos", "rightPos")),
+                            ("tri", ("leftPos", "centerPos", "rightPos"))):
+            for name in needs:
+                missing = np.nonzero((types==kind) & np.isnan(self.columns[name]))[0]
+                if len(missing):
+                    raise Exception("%s distribution needs %s (row %i)"%(kind.capitalize(), name, missing[0]))
+        c = self.columns
+        for kind, condition, bad in (
+                ("rect", "leftPos<=rightPos", c["leftPos"]>c["rightPos"]),
+                # the triangle needs a rising and a falling side, like the scalar constructor (which divides by zero)
+                ("tri", "leftPos<centerPos<rightPos", (c["centerPos"]<=c["leftPos"]) | (c["centerPos"]>=c["rightPos"]))):
+            wrong = np.nonzero((types==kind) & bad)[0]
+            if len(wrong):
+                raise ValueError("%s distribution needs %s (row %i)"%(kind.capitalize(), condition, wrong[0]))
+        unknown = np.nonzero(~np.isin(types, ("normal", "rect", "tri")))[0]
+        if len(unknown):
+            raise Exception("Unimplemented distribution type %s (row %i)"%(types[unknown[0]], unknown[0]))
+        if np.any(samples<1):
+            raise Exception("samples has to be at least 1")
+        
+        # the rect distributions have an empty bin on both sides
+        self.offsets = np.zeros(len(types)+1, dtype=np.int64)
+        np.cumsum(np.where(types=="rect", samples+2, samples), out=self.offsets[1:])
+        total = int(self.offsets[-1])
+        if options["memmapDir"] is not None and total>=options["memmapMinBins"]:
+            self.buffer = _mappedArray(2*total).reshape(2, total)
+        else:
+            self.buffer = np.empty((2, total))
+        bkUncDistNumpy.getManyInto(types, c["mean"], c["stdDev"], c["maxSigma"], c["leftPos"], c["centerPos"],
+                                   c["rightPos"], samples, self.buffer[0], self.buffer[1], self.offsets)
+    
+    def __len__(self):
+        return len(self.offsets)-1
+    
+    def __getitem__(self, i):
+        # distribution i as unDist, it shares the memory of the buffer
+        if not -len(self)<=i<len(self):
+            raise IndexError("distTable index %i out of range"%i)
+        i = i%len(self)
+        c = self.columns
+        disType = str(c["type"][i])
+        params = {name: float(c[name][i]) for name in _tableColumns[1:-1]}
+        res = unDist()
+        res.disType = disType
+        res.samples = int(c["samples"][i])
+        if disType=="normal":
+            res.mean, res.stdDev, res.maxSigma = params["mean"], params["stdDev"], params["maxSigma"]
+            res.provenance = _node("normal", mean=res.mean, stdDev=res.stdDev, maxSigma=res.maxSigma, 
+                                   samples=res.samples)
+        else:
+            res.leftPos, res.rightPos = params["leftPos"], params["rightPos"]
+            if disType=="tri":
+                res.centerPos = params["centerPos"]
+                res.provenance = _node("tri", leftPos=res.leftPos, centerPos=res.centerPos, 
+                                       rightPos=res.rightPos, samples=res.samples)
+            else:
+                res.provenance = _node("rect", leftPos=res.leftPos, rightPos=res.rightPos, samples=res.samples)
+        res._analytic = _constructorMoments(disType, **params)
+        first, last = self.offsets[i], self.offsets[i+1]
+        res.centers = self.buffer[0, first:last]
+        res.weights = self.buffer[1, first:last]
+        return res
+    
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+    
+    def getMeanStd(self):
+        # arrays of the means and standard deviations of all distributions, without creating them
+        centers, weights, starts = self.buffer[0], self.buffer[1], self.offsets[:-1]
+        mean = np.add.reduceat(centers*weights, starts)
+        sizes = np.diff(self.offsets)
+        stdDev = np.sqrt(np.add.reduceat(((centers-np.repeat(mean, sizes))**2)*weights, starts))
+        return mean, stdDev
+
+
+def _asLazy(x, what):
+    if isinstance(x, lazyDist):
+        return x
+    if isinstance(x, unDist):
+        return x.lazy()
+    raise Exception("not sure how to %s type %s to an unDistributino"%(what, type(x)))
+
+
+
+# file format of saveLibrary and unDist.save, all numbers are little endian:
+#   8 bytes   fileMagic, the last byte is the version of the format
+#   8 bytes   uint64 number of distributions
+#   8 bytes   uint64 length of the names
+#  16 bytes   blake2b checksum of the index and the names
+#   index     one record of _indexDtype per distribution, read without parsing by np.frombuffer
+#   names     utf-8 json list of the names
+#   data      the arrays and the provenance json, each starting at a multiple of 64 bytes,
+#             the offsets in the index are relative to the first multiple of 64 after the names
+# an index record has
+#   n, samples, droppedMass
+#   weightsItemSize: 8 for float64, 4 for float32 weights
+#   centersOffset: -1 for a compact distribution, whose first center and spacing are gridLeft and gridDelta
+#   provenanceOffset/Length: the provenance tree as json, see _flattenProvenance
+#   checksum: blake2b of the centers, weights and provenance bytes
+#   analyticMean/Variance: the analytic moments (see unDist.analyticMeanStd), nan if unknown
+fileMagic = b"UNDIST\x00\x03"
+_fileAlignment = 64
+_indexDtype = np.dtype([("n", "<u8"), ("samples", "<u8"), ("droppedMass", "<f8"), ("weightsItemSize", "<u8"),
+                        ("weightsOffset", "<u8"), ("centersOffset", "<i8"), ("gridLeft", "<f8"), ("gridDelta", "<f8"),
+                        ("provenanceOffset", "<u8"), ("provenanceLength", "<u8"), ("checksum", "V16"),
+                        ("analyticMean", "<f8"), ("analyticVariance", "<f8")])
+
+def _aligned(n):
+    return -(-n//_fileAlignment)*_fileAlignment
+
+def _checksum(*buffers):
+    h = hashlib.blake2b(digest_size=16)
+    for b in buffers:
+        if b is not None:
+            h.update(b)
+    return h.digest()
+
+def _flattenProvenance(root):
+    # the provenance tree as list of nodes, whose args are indices into the list
+    # nodes shared by several branches (e.g. dis+dis) are stored once
+    nodes, index = [], {}
+    stack = [(root, False)]
+    while stack:
+        node, childrenDone = stack.pop()
+        if node is None or id(node) in index:
+            continue
+        if childrenDone:
+            index[id(node)] = len(nodes)
+            nodes.append(dict(node, args=[None if a is None else index[id(a)] for a in node["args"]]))
+        else:
+            stack.append((node, True))
+            stack.extend((a, False) for a in node["args"])
+    return {"nodes": nodes, "root": None if root is None else index[id(root)]}
+
+def _unflattenProvenance(flat):
+    # inverse of _flattenProvenance, the children are always before their parents in the list
+    built = []
+    for node in flat["nodes"]:
+        built.append(dict(node, args=[None if i is None else built[i] for i in node["args"]]))
+    return None if flat["root"] is None else built[flat["root"]]
+
+def _libraryLayout(dists):
+    # the file format for the dict dists: returns the header (everything before the data),
+    # the start of the data, the list of (offset relative to the data start, array or bytes) and the size
+    index = np.zeros(len(dists), dtype=_indexDtype)
+    names, blocks = [], []
+    offset = 0
+    for i, (name, dis) in enumerate(dists.items()):
+        if isinstance(dis, lazyDist):
+            dis = dis.evaluate()
+        if not isinstance(dis, unDist) or dis.weights is None:
+            raise Exception("%s is not a calculated distribution"%name)
+        weights = np.ascontiguousarray(dis.weights, dtype="<f4" if dis.weights.dtype==np.float32 else "<f8")
+        centers = None if dis._grid is not None else np.ascontiguousarray(dis.centers, dtype="<f8")
+        provenance = json.dumps(_flattenProvenance(dis.provenance)).encode()
+        
+        rec = index[i]
+        rec["n"], rec["samples"], rec["droppedMass"] = len(weights), dis.samples, dis.droppedMass
+        rec["weightsItemSize"] = weights.itemsize
+        rec["centersOffset"] = -1
+        if dis._grid is not None:
+            rec["gridLeft"], rec["gridDelta"] = dis._grid
+        for key, block in (("centersOffset", centers), ("weightsOffset", weights), ("provenanceOffset", provenance)):
+            if block is not None:
+                rec[key] = offset
+                blocks.append((offset, block))
+                offset += _aligned(len(memoryview(block).cast("B")))
+        rec["provenanceLength"] = len(provenance)
+        rec["analyticMean"], rec["analyticVariance"] = (np.nan, np.nan) if dis._analytic is None else dis._analytic
+        rec["checksum"] = _checksum(None if centers is None else centers.data, weights.data, provenance)
+        names.append(str(name))
+    
+    namesBytes = json.dumps(names).encode()
+    header = index.tobytes()+namesBytes
+    header = fileMagic+struct.pack("<QQ", len(index), len(namesBytes))+_checksum(header)+header
+    dataStart = _aligned(len(header))
+    return header, dataStart, blocks, dataStart+offset
+
+def saveLibrary(fileName, dists):
+    """
+    store named distributions in one file, e.g. saveLibrary("sensors.undist", {"sensA": sensDistA, ...})
+    open it with distLibrary, see there. unDist.save stores a single distribution in the same format.
+    The file is written under a temporary name and renamed at the end, 
+    so processes opening it meanwhile see either the old or the new file.
+    """
+    header, dataStart, blocks, size = _libraryLayout(dists)
+    tmpName = fileName+".tmp"
+    with open(tmpName, "wb") as f:
+        f.write(header)
+        for blockOffset, block in blocks:
+            f.seek(dataStart+blockOffset)
+            f.write(block.data if isinstance(block, np.ndarray) else block)
+    os.replace(tmpName, fileName)
+
+class distLibrary:
+    """
+    the distributions of a file written by saveLibrary, e.g. precalculated sub budgets of many sensors
+        lib = distLibrary("sensors.undist")
+        sensDist = lib["sensA"]
+    The file is memory mapped read-only, opening it only reads the index and the names.
+    So all processes opening the same file share one copy in memory, 
+    and the bins are only read from disk when they are used.
+    The arrays of the returned distributions are read-only views of the file.
+    verify=True compares the checksums of all distributions when opening, otherwise verify() does it.
+    buffer: read from this buffer in the same format instead (e.g. shared memory, see distExecutor),
+    fileName then only names it in the messages
+    """
+    def __init__(self, fileName, verify=False, buffer=None):
+        self.fileName = fileName
+        if buffer is not None:
+            self._map = memoryview(buffer).toreadonly()
+        else:
+            with open(fileName, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        prefix = bytes(self._map[:40])
+        if len(prefix)<40 or prefix[:7]!=fileMagic[:7]:
+            raise Exception("%s is not a distribution file"%fileName)
+        if prefix[7]!=fileMagic[7]:
+            raise Exception("%s has the unsupported format version %i"%(fileName, prefix[7]))
+        count, namesLength = struct.unpack("<QQ", prefix[8:24])
+        headerEnd = 40+count*_indexDtype.itemsize+namesLength
+        if headerEnd>len(self._map) or _checksum(self._map[40:headerEnd])!=prefix[24:40]:
+            raise Exception("the header of %s is corrupt"%fileName)
+        self.index = np.frombuffer(self._map, dtype=_indexDtype, count=count, offset=40)
+        self.names = json.loads(bytes(self._map[headerEnd-namesLength:headerEnd]))
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        self._dataStart = _aligned(headerEnd)
+        if verify:
+            self.verify()
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def __iter__(self):
+        return iter(self.names)
+    
+    def __contains__(self, name):
+        return name in self._positions
+    
+    def keys(self):
+        return list(self.names)
+    
+    def _blocks(self, name):
+        # the record, centers (None for a compact distribution), weights and provenance bytes, without copying
+        rec = self.index[self._positions[name]]
+        n, start = int(rec["n"]), self._dataStart
+        weights = np.frombuffer(self._map, dtype="<f4" if rec["weightsItemSize"]==4 else "<f8", 
+                                count=n, offset=start+int(rec["weightsOffset"]))
+        centers = None
+        if rec["centersOffset"]>=0:
+            centers = np.frombuffer(self._map, dtype="<f8", count=n, offset=start+int(rec["centersOffset"]))
+        provenanceStart = start+int(rec["provenanceOffset"])
+        provenance = bytes(self._map[provenanceStart:provenanceStart+int(rec["provenanceLength"])])
+        return rec, centers, weights, provenance
+    
+    def __getitem__(self, name):
+        return _fromBlocks(*self._blocks(name))
+    
+    def verify(self, names=None):
+        """
+        compare the checksums of the distributions (all if names is None), raises if one does not match
+        """
+        for name in self.names if names is None else names:
+            rec, centers, weights, provenance = self._blocks(name)
+            checksum = _checksum(None if centers is None else centers.data, weights.data, provenance)
+            if checksum!=bytes(rec["checksum"]):
+                raise Exception("distribution %s in %s is corrupt"%(name, self.fileName))
+
+def _fromBlocks(rec, centers, weights, provenance):
+    res = unDist()
+    res.samples = int(rec["samples"])
+    res.weights = weights
+    if centers is None:
+        res._setGrid((rec["gridLeft"], rec["gridDelta"]))
+    else:
+        res.centers = centers
+    res.droppedMass = float(rec["droppedMass"])
+    res.provenance = _unflattenProvenance(json.loads(provenance))
+    if not np.isnan(rec["analyticMean"]):
+        res._analytic = (float(rec["analyticMean"]), float(rec["analyticVariance"]))
+    return res
+
+
+# distExecutor: the jobs are pickled, but the distributions in them are replaced by their index
+# into a list (persistent_id). The arrays of that list are written into one shared memory block
+# in the format of saveLibrary, and read back by distLibrary(buffer=...) without copying.
+# The results come back the same way, in a block created by the worker.
+class _sharingPickler(pickle.Pickler):
+    # dists and positions can be shared by several picklers, so that the jobs of a map use one list
+    def __init__(self, file, dists, positions):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._dists, self._positions = dists, positions
+    
+    def persistent_id(self, obj):
+        if type(obj) is not unDist or obj.weights is None:
+            return None
+        if id(obj) not in self._positions:
+            self._positions[id(obj)] = len(self._dists)
+            self._dists.append(obj)
+        return self._positions[id(obj)]
+
+class _sharingUnpickler(pickle.Unpickler):
+    def __init__(self, file, lib, copy):
+        super().__init__(file)
+        self._lib, self._copy, self._built = lib, copy, {}
+    
+    def persistent_load(self, pid):
+        # every distribution is built once, so that shared references stay shared
+        if pid not in self._built:
+            rec, centers, weights, provenance = self._lib._blocks(str(pid))
+            if self._copy:
+                centers, weights = None if centers is None else centers.copy(), weights.copy()
+            self._built[pid] = _fromBlocks(rec, centers, weights, provenance)
+        return self._built[pid]
+
+# A block is registered at the resource tracker (which unlinks it, if the process ends without doing so)
+# only by the process that unlinks it: the parent. So the worker unregisters its result blocks,
+# and attaching does not register (python<3.13 would register there as well).
+def _untrack(block):
+    resource_tracker.unregister(block._name, "shared_memory")
+
+def _attach(name):
+    if sys.version_info>=(3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+def _pickleShared(obj, dists, positions):
+    # pickle obj, its distributions are appended to dists instead (positions: their index by id)
+    f = io.BytesIO()
+    _sharingPickler(f, dists, positions).dump(obj)
+    return f.getvalue()
+
+def _shareDists(dists):
+    # a new shared memory block with the distributions, None if there are none
+    if not dists:
+        return None
+    header, dataStart, blocks, size = _libraryLayout({str(i): dis for i, dis in enumerate(dists)})
+    block = shared_memory.SharedMemory(create=True, size=size)
+    buffer = block.buf
+    buffer[:len(header)] = header
+    for blockOffset, data in blocks:
+        data = memoryview(data).cast("B")
+        buffer[dataStart+blockOffset:dataStart+blockOffset+len(data)] = data
+    del buffer, data
+    return block
+
+def _unpickleShared(payload, block, copy):
+    # inverse of _pickleShared, with copy=False the arrays are read-only views of the block
+    lib = None if block is None else distLibrary("shared memory %s"%block.name, buffer=block.buf)
+    return _sharingUnpickler(io.BytesIO(payload), lib, copy).load()
+
+_workerBlocks = []
+
+def _initWorker(workerOptions):
+    # runs once in every worker process: the options of the parent, and the core is loaded now
+    setOptions(**workerOptions)
+    getBackend().getRect(0, 1, 2)
+
+def _runJob(blockName, payload):
+    # runs in a worker: unpack the job, call it, and pack the result into a new block
+    # the parent unlinks both blocks, the worker only closes them
+    _closeBlocks()
+    block = None
+    if blockName is not None:
+        block = _attach(blockName)
+        _workerBlocks.append(block)
+    func, args, kwargs = _unpickleShared(payload, block, copy=False)
+    result = func(*args, **kwargs)
+    del args, kwargs
+    dists = []
+    payload = _pickleShared(result, dists, {})
+    resultBlock = _shareDists(dists)
+    del result, dists
+    _closeBlocks()
+    if resultBlock is None:
+        return None, payload
+    _untrack(resultBlock)
+    resultBlock.close()
+    return resultBlock.name, payload
+
+def _closeBlocks():
+    # close the input blocks of the worker, as soon as no distribution uses them any more
+    for block in list(_workerBlocks):
+        try:
+            block.close()
+            _workerBlocks.remove(block)
+        except BufferError:
+            pass
+
+def _evaluateJob(expr, engine, backend):
+    return expr.evaluate(engine, backend) if isinstance(expr, lazyDist) else expr
+
+class distExecutor:
+    """
+    evaluates independent jobs, e.g. the budgets of separate sensors, set points or scenarios, 
+    in a pool of processes:
+        with distExecutor(processes=4) as ex:
+            sensDists = ex.map(sensorBudget, sensorNames)   # sensorBudget(name) returns an unDist
+            results = ex.evaluate([exprA, exprB])            # lazy expressions
+    
+    The jobs and their results can be any picklable objects containing distributions, so func has to be
+    a module level function. The arrays of the distributions are not pickled, but go through
+    shared memory: the worker reads the inputs without copying them (read-only), 
+    the results are copied once out of the block of the worker.
+    Every worker gets the current options and loads the backend once, when it is started.
+    processes=None uses all cores, startMethod is "fork", "spawn" or "forkserver" (None: python default)
+    threads is options["threads"] in the workers, by default 1, as the processes already use the cores
+    """
+    def __init__(self, processes=None, startMethod=None, threads=1):
+        context = None if startMethod is None else multiprocessing.get_context(startMethod)
+        workerOptions = dict(options, backend=getBackend().name, threads=threads)
+        self._pool = concurrent.futures.ProcessPoolExecutor(processes, mp_context=context, 
+                initializer=_initWorker, initargs=(workerOptions,))
+    
+    def map(self, func, *iterables, **kwargs):
+        """
+        [func(*args, **kwargs) for args in zip(*iterables)], each call as a job in the pool
+        """
+        # the distributions of all jobs are in one block, a distribution used by several jobs only once
+        dists, positions = [], {}
+        payloads = [_pickleShared((func, args, kwargs), dists, positions) for args in zip(*iterables)]
+        block = _shareDists(dists)
+        del dists, positions
+        try:
+            futures = [self._pool.submit(_runJob, None if block is None else block.name, payload) 
+                       for payload in payloads]
+            # all results are collected even if a job failed, so that their blocks are unlinked
+            results, error = [], None
+            for future in futures:
+                try:
+                    results.append(self._result(future))
+                except Exception as e:
+                    error = error or e
+            if error is not None:
+                raise error
+            return results
+        finally:
+            if block is not None:
+                block.close()
+                block.unlink()
+    
+    def evaluate(self, exprs, engine=None, backend=None):
+        """
+        the lazy expressions exprs evaluated in the pool, returns a list of unDist
+        """
+        return self.map(_evaluateJob, exprs, engine=engine, backend=backend)
+    
+    def _result(self, future):
+        blockName, payload = future.result()
+        if blockName is None:
+            return _unpickleShared(payload, None, copy=True)
+        block = _attach(blockName)
+        try:
+            return _unpickleShared(payload, block, copy=True)
+        finally:
+            block.close()
+            resource_tracker.register(block._name, "shared_memory")
+            block.unlink()
+    
+    def close(self):
+        self._pool.shutdown()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+